@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Measure import times of the zorg modules and the start up time of
+# zorg-cli quick queries, each in a fresh interpreter.
+#
+# Exits with status 1 if a module pulls in one of the heavy
+# dependencies which should only be loaded when used, or if a quick
+# query takes longer than the budget.
+#
+# Usage: bench_import.py [repeat] [budget ms]
+
+import os
+import sys
+import time
+import subprocess
+
+here = os.path.dirname(os.path.abspath(__file__))
+top = os.path.dirname(here)
+
+heavyModules = ("comar", "dbus", "piksemel", "pardus")
+
+modules = ("zorg", "zorg.consts", "zorg.parser", "zorg.document",
+           "zorg.hwdata", "zorg.probe", "zorg.state", "zorg.config",
+           "zorg.daemon")
+
+# zorg-cli arguments which must not touch D-Bus
+quickQueries = (["--version"], ["--help"], ["-c", "10de:0020"])
+
+importScript = """
+import sys, time
+start = time.time()
+import %s
+elapsed = time.time() - start
+print elapsed
+print " ".join(x for x in %r if x in sys.modules)
+"""
+
+def python(*args):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([top] + filter(None,
+                                        [env.get("PYTHONPATH")]))
+    env.pop("ZORG_PROFILE", None)
+
+    start = time.time()
+    proc = subprocess.Popen((sys.executable,) + args, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    return time.time() - start, proc.returncode, out, err
+
+def measureImport(module, repeat):
+    best = None
+    loaded = []
+    for i in range(repeat):
+        wall, status, out, err = python("-c", importScript % (module, heavyModules))
+        if status != 0:
+            return None, [err.strip().splitlines()[-1]]
+
+        lines = out.splitlines()
+        elapsed = float(lines[0])
+        loaded = lines[1].split() if len(lines) > 1 else []
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best, loaded
+
+def measureCommand(args, repeat):
+    best = None
+    for i in range(repeat):
+        wall, status, out, err = python(os.path.join(top, "zorg-cli"), *args)
+        if best is None or wall < best:
+            best = wall
+    return best, status, err
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 100.0
+
+    failures = []
+
+    emptyWall = min(python("-c", "pass")[0] for i in range(repeat))
+    print "Interpreter start up: %8.2f ms" % (emptyWall * 1000)
+    print
+
+    print "%-20s %10s  %s" % ("Module", "Import ms", "Heavy modules loaded")
+    for module in modules:
+        elapsed, loaded = measureImport(module, repeat)
+        if elapsed is None:
+            print "%-20s %10s  %s" % (module, "ERROR", loaded[0])
+            failures.append(module)
+            continue
+
+        print "%-20s %10.2f  %s" % (module, elapsed * 1000, " ".join(loaded) or "-")
+        if loaded:
+            failures.append(module)
+
+    print
+    print "%-30s %10s" % ("zorg-cli", "Wall ms")
+    for args in quickQueries:
+        wall, status, err = measureCommand(args, repeat)
+        name = " ".join(args)
+        mark = ""
+        if status != 0:
+            mark = "  exit status %d" % status
+            failures.append(name)
+        elif wall * 1000 > budget:
+            mark = "  over %d ms budget" % budget
+            failures.append(name)
+        print "%-30s %10.2f%s" % (name, wall * 1000, mark)
+
+    if failures:
+        print
+        print "Failed: %s" % ", ".join(failures)
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Compare load times of config.xml and the config.json sidecar.
+#
+# Usage: bench_state.py [cards] [repeat]
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from zorg import state
+from zorg.utils import fileStamp
+
+def makeState(cards):
+    st = state.State()
+    for n in range(cards):
+        outputs = []
+        for name in ("VGA", "DVI-I-1", "HDMI-1", "LVDS"):
+            outputs.append({
+                "name":         name,
+                "enabled":      True,
+                "ignored":      False,
+                "mode":         "1280x1024",
+                "refresh_rate": "60",
+                "monitor":      {
+                    "vendor":   "Acer",
+                    "model":    "Acer 1455",
+                    "hsync":    "30.0-54.0",
+                    "vref":     "50.0-120.0",
+                    },
+                })
+        st.setCard("PCI:%d:0:0" % (n + 1), {
+            "vendor_id":    "1002",
+            "product_id":   "6880",
+            "driver":       "radeon",
+            "depth":        24,
+            "outputs":      outputs,
+            })
+    st.keyboard = ("tr", "f")
+    return st
+
+def timeit(func, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main():
+    cards = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    tmp = tempfile.mkdtemp()
+    try:
+        xmlFile = os.path.join(tmp, "config.xml")
+        jsonFile = os.path.join(tmp, "config.json")
+
+        st = makeState(cards)
+        open(xmlFile, "w").write(state.xmlString(st))
+        stamp = fileStamp(xmlFile)
+        open(jsonFile, "w").write(state.jsonString(st, stamp))
+
+        xmlTime = timeit(lambda: state.readXML(xmlFile), repeat)
+        jsonTime = timeit(lambda: state.readJSON(jsonFile, stamp), repeat)
+
+        print "cards: %d, best of %d" % (cards, repeat)
+        print "config.xml:  %8.3f ms" % (xmlTime * 1000)
+        print "config.json: %8.3f ms" % (jsonTime * 1000)
+        print "speedup:     %8.1fx" % (xmlTime / jsonTime)
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,481 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Benchmarks of the zorg hot paths on synthetic inputs.
+#
+# All inputs are generated under a temporary directory: a fake sysfs
+# tree with video cards and EDIDs, DriversDB, MonitorsDB, a pci.ids of
+# the size of the real one and a 10k line xorg.conf. COMAR is replaced
+# by a fake link. Each case runs in its own process, so the first run
+# is done with cold caches and the peak memory is that of the case.
+#
+# Usage: bench_zorg.py [options] [case...]
+#
+# Results are compared with a baselines file if it exists, and the
+# exit status is 1 if a case got slower than the threshold. Use --save
+# to record the current results as the new baselines.
+#
+# baselines.json holds reference results of the default scale, taken
+# without piksemel, so the config.* cases have none. Timings depend on
+# the machine: save baselines of the unchanged tree on yours before
+# comparing a change against them.
+
+import os
+import sys
+import time
+import json
+import shutil
+import marshal
+import optparse
+import platform
+import resource
+import tempfile
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import fixtures
+
+driverPackages = ["xorg_video_nvidia96", "xorg_video_nvidia173",
+                  "xorg_video_fglrx", "xorg_video_nvidia_current"]
+
+fixtures.installFakes(driverPackages)
+
+from zorg import consts
+
+defaultBaselines = os.path.join(here, "baselines.json")
+
+# Case name -> (unit, setup function)
+cases = {}
+caseOrder = []
+
+def case(name, unit):
+    """
+        Register a benchmark. The decorated function gets the fixture
+        directory and returns (run, count), where run() is timed and
+        count is the number of units it processes.
+    """
+
+    def register(func):
+        cases[name] = (unit, func)
+        caseOrder.append(name)
+        return func
+
+    return register
+
+# Fixtures
+
+class Fixtures:
+    cards = 64
+
+    def __init__(self, root, scale=1.0):
+        self.root = root
+        self.scale = scale
+
+    def size(self, n):
+        return max(int(n * self.scale), 1)
+
+    def path(self, *names):
+        return os.path.join(self.root, *names)
+
+    def create(self):
+        self.cardNames = fixtures.makeSysfs(self.path("sys"), self.size(self.cards))
+
+        cardIds = []
+        for name in self.cardNames:
+            dev = self.path("sys", "bus/pci/devices", name)
+            cardIds.append(tuple(open(os.path.join(dev, x)).read().strip()[2:]
+                                    for x in ("vendor", "device")))
+
+        fixtures.writeDriversDB(self.path("DriversDB"), self.size(50000), cardIds)
+        fixtures.writeMonitorsDB(self.path("MonitorsDB"), self.size(400))
+        self.pciIds = fixtures.writePciIds(self.path("pci.ids"), self.size(2500))
+        fixtures.writeLines(self.path("xorg.conf"),
+                            fixtures.xorgConfLines(self.size(10000)))
+        fixtures.makeDriversDir(self.path("drivers"))
+        fixtures.makeModuleTree(self.path("root"), self.size(20000))
+
+    def use(self, work):
+        """Point zorg at the fixtures, with a private writable dir."""
+
+        from zorg import probe
+
+        os.makedirs(work)
+
+        consts.config_dir           = work
+        consts.cache_dir            = os.path.join(work, "cache")
+        consts.config_file          = os.path.join(work, "config.xml")
+        consts.state_file           = os.path.join(work, "config.json")
+        consts.configured_bus_file  = os.path.join(work, "configured_bus")
+        consts.hashes_file          = os.path.join(work, "hashes")
+        consts.fingerprint_file     = os.path.join(work, "fingerprint")
+        consts.profile_file         = os.path.join(work, "profile.json")
+        consts.xorg_conf_file       = os.path.join(work, "xorg.conf")
+        consts.drivers_file         = self.path("DriversDB")
+        consts.local_drivers_file   = os.path.join(work, "DriversDB")
+        consts.monitors_file        = self.path("MonitorsDB")
+        consts.pci_ids_file         = self.path("pci.ids")
+        consts.drivers_dir          = self.path("drivers")
+        consts.aliases_root         = self.path("root")
+
+        probe.sysdir = self.path("sys", "bus/pci/devices")
+        probe.drmdir = self.path("sys", "class/drm")
+
+def videoDevices(fix):
+    from zorg.probe import scanVideoDevices, Output
+
+    cards = scanVideoDevices(fix.path("sys"))
+    for card in cards:
+        card.driver = "radeon"
+        card.depth = 24
+        for name in ("VGA-1", "DVI-I-1", "HDMI-A-1"):
+            output = Output(name)
+            output.setMode("1280x1024", "60")
+            card.outputs[name] = output
+        card.probeMonitors()
+
+    return cards
+
+# Cases
+
+@case("parser.parseFile", "lines")
+def benchParseFile(fix):
+    from zorg.parser import XorgParser
+
+    path = fix.path("xorg.conf")
+    lines = len(open(path).readlines())
+
+    def run():
+        XorgParser().parseFile(path)
+
+    return run, lines
+
+@case("parser.toString", "lines")
+def benchToString(fix):
+    from zorg.parser import XorgParser
+
+    parser = XorgParser()
+    parser.parseFile(fix.path("xorg.conf"))
+    lines = parser.toString().count("\n")
+
+    return parser.toString, lines
+
+@case("document.roundTrip", "lines")
+def benchDocument(fix):
+    from zorg.document import XorgDocument
+
+    path = fix.path("xorg.conf")
+    lines = len(open(path).readlines())
+
+    def run():
+        doc = XorgDocument()
+        doc.parseFile(path)
+        doc.toString()
+
+    return run, lines
+
+@case("parser.XorgEntry", "lines")
+def benchTokenize(fix):
+    from zorg.parser import XorgEntry
+
+    lines = fixtures.entryLines(fix.size(100000))
+
+    def run():
+        for line in lines:
+            XorgEntry(line)
+
+    return run, len(lines)
+
+@case("hwdata.getMonitorInfos", "calls")
+def benchMonitorInfos(fix):
+    from zorg.hwdata import getMonitorInfos
+
+    def run():
+        genericList, vendorList = getMonitorInfos()
+        for models in vendorList.values():
+            len(models)
+
+    return run, 1
+
+@case("hwdata.getCompatibleDriverNames", "lookups")
+def benchCompatibleDrivers(fix):
+    import random
+    from zorg import driversdb
+    from zorg.hwdata import getCompatibleDriverNames
+
+    ids = driversdb.parseDriversDB(fix.path("DriversDB")).keys()
+    ids = random.Random(7).sample(ids, min(fix.size(10000), len(ids)))
+    ids = [(x[:4], x[4:]) for x in ids]
+
+    def run():
+        for vendor, device in ids:
+            getCompatibleDriverNames(vendor, device)
+
+    return run, len(ids)
+
+@case("driversdb.generateDriversDB", "calls")
+def benchGenerateDriversDB(fix):
+    from zorg.driversdb import generateDriversDB
+
+    root = fix.path("root")
+    shipped = fix.path("DriversDB")
+    return lambda: generateDriversDB(root, shipped), 1
+
+@case("probe.scanVideoDevices", "calls")
+def benchScan(fix):
+    from zorg.probe import scanVideoDevices
+
+    root = fix.path("sys")
+    return lambda: scanVideoDevices(root), 1
+
+@case("probe.preferredDriver", "cards")
+def benchPreferredDriver(fix):
+    from zorg.probe import scanVideoDevices
+
+    cards = scanVideoDevices(fix.path("sys"))
+
+    def run():
+        for card in cards:
+            card.preferredDriver()
+
+    return run, len(cards)
+
+@case("utils.idsQuery", "queries")
+def benchIdsQuery(fix):
+    import random
+    from zorg.utils import idsQuery
+
+    ids = random.Random(8).sample(fix.pciIds, min(fix.size(5000), len(fix.pciIds)))
+
+    def run():
+        for vendor, device, subvendor, subdevice in ids:
+            idsQuery(vendor, device)
+
+    return run, len(ids)
+
+@case("config.saveDeviceInfo", "cards")
+def benchSaveDeviceInfo(fix):
+    from zorg.config import saveDeviceInfo
+
+    cards = videoDevices(fix)
+
+    def run():
+        for card in cards:
+            card.depth = 24 if card.depth == 16 else 16
+            saveDeviceInfo(card)
+
+    return run, len(cards)
+
+@case("config.saveDevicesInfo", "cards")
+def benchSaveDevicesInfo(fix):
+    from zorg.config import saveDevicesInfo
+
+    cards = videoDevices(fix)
+
+    def run():
+        for card in cards:
+            card.depth = 24 if card.depth == 16 else 16
+        saveDevicesInfo(cards)
+
+    return run, len(cards)
+
+@case("config.getDeviceInfo", "cards")
+def benchGetDeviceInfo(fix):
+    from zorg import config
+
+    cards = videoDevices(fix)
+    config.saveDevicesInfo(cards)
+    busIds = [x.bus_id for x in cards]
+
+    def run():
+        # Start from the files, as a new process would
+        config._store = None
+        for busId in busIds:
+            config.getDeviceInfo(busId)
+
+    return run, len(busIds)
+
+# Runner
+
+def measure(name, fix, repeat):
+    unit, setup = cases[name]
+
+    fix.use(fix.path("work", name))
+
+    times = []
+    try:
+        run, count = setup(fix)
+        for i in range(repeat):
+            start = time.time()
+            run()
+            times.append(time.time() - start)
+    except ImportError, e:
+        return {"skipped": "skipped, %s" % e}
+
+    return {
+            "unit":     unit,
+            "count":    count,
+            "first":    times[0],
+            "best":     min(times[1:] or times),
+            "peak":     resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            }
+
+def runIsolated(name, fix, repeat):
+    """Run a case in a child process and return its result."""
+
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        try:
+            try:
+                result = measure(name, fix, repeat)
+            except Exception, e:
+                result = {"error": "%s: %s" % (e.__class__.__name__, e)}
+            os.write(w, marshal.dumps(result))
+        finally:
+            os._exit(0)
+
+    os.close(w)
+    data = []
+    while True:
+        chunk = os.read(r, 65536)
+        if not chunk:
+            break
+        data.append(chunk)
+    os.close(r)
+    os.waitpid(pid, 0)
+
+    if not data:
+        return {"error": "benchmark process died"}
+    return marshal.loads("".join(data))
+
+def loadBaselines(path):
+    try:
+        return json.load(open(path))
+    except (IOError, ValueError):
+        return None
+
+def saveBaselines(path, results, scale=1.0):
+    data = {
+            "scale":    scale,
+            "host":     platform.node(),
+            "machine":  platform.machine(),
+            "python":   platform.python_version(),
+            "date":     time.strftime("%Y-%m-%d %H:%M:%S"),
+            "cases":    dict((name, {
+                            "best":     result["best"],
+                            "count":    result["count"],
+                            "peak":     result["peak"],
+                            }) for name, result in results.items()
+                                    if "best" in result),
+            }
+
+    f = open(path, "w")
+    try:
+        json.dump(data, f, sort_keys=True, indent=1)
+    finally:
+        f.close()
+
+def compare(result, baseline):
+    """Return the change in time per unit against the baseline, in %."""
+
+    if not baseline or "best" not in result:
+        return None
+
+    old = baseline["best"] / baseline["count"]
+    new = result["best"] / result["count"]
+    if old <= 0:
+        return None
+    return (new - old) / old * 100
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] [case...]")
+    parser.add_option("-r", "--repeat", type="int", default=5,
+        help="runs per case, the first one is cold [default: %default]")
+    parser.add_option("-s", "--scale", type="float", default=1.0,
+        help="scale the size of the synthetic inputs [default: %default]")
+    parser.add_option("-b", "--baselines", default=defaultBaselines,
+        help="baselines file [default: %default]")
+    parser.add_option("--save", action="store_true", default=False,
+        help="save the results as the new baselines")
+    parser.add_option("-t", "--threshold", type="float", default=20.0,
+        help="slowdown in percent reported as a regression [default: %default]")
+    parser.add_option("-l", "--list", action="store_true", default=False,
+        help="list the cases and exit")
+
+    opts, names = parser.parse_args()
+
+    if opts.list:
+        for name in caseOrder:
+            print name
+        return 0
+
+    for name in names:
+        if name not in cases:
+            parser.error("unknown case: %s" % name)
+    names = names or caseOrder
+
+    baselines = loadBaselines(opts.baselines)
+    if baselines and baselines.get("scale", 1.0) != opts.scale:
+        print "Baselines of scale %s are not compared" % baselines.get("scale", 1.0)
+        baselines = None
+
+    if baselines and not opts.save:
+        print "Baselines from %s (%s, python %s)" % (baselines["date"],
+                                                     baselines["host"],
+                                                     baselines["python"])
+        baselines = baselines["cases"]
+    else:
+        baselines = {}
+
+    tmp = tempfile.mkdtemp(prefix="zorg-bench-")
+    try:
+        fix = Fixtures(tmp, opts.scale)
+        fix.create()
+
+        print "%-34s %10s %10s %18s %9s %8s" % ("Case", "First ms", "Best ms",
+                                                "Throughput", "Peak MB", "Change")
+
+        results = {}
+        regressions = []
+        for name in names:
+            result = runIsolated(name, fix, max(opts.repeat, 1))
+            results[name] = result
+
+            if "skipped" in result or "error" in result:
+                print "%-34s %s" % (name, result.get("skipped") or
+                                          "ERROR " + result["error"])
+                continue
+
+            change = compare(result, baselines.get(name))
+            if change is None:
+                changeText = ""
+            else:
+                changeText = "%+.0f%%" % change
+                if change > opts.threshold:
+                    changeText += " !"
+                    regressions.append(name)
+
+            rate = result["count"] / max(result["best"], 1e-9)
+            print "%-34s %10.2f %10.2f %8d %-9s %9.1f %8s" % (name,
+                    result["first"] * 1000, result["best"] * 1000,
+                    rate, "%s/s" % result["unit"],
+                    result["peak"] / 1024.0, changeText)
+    finally:
+        shutil.rmtree(tmp)
+
+    if opts.save:
+        saveBaselines(opts.baselines, results, opts.scale)
+        print "Baselines saved to %s" % opts.baselines
+
+    if regressions:
+        print
+        print "Slower than the baselines by more than %d%%: %s" % \
+                    (opts.threshold, ", ".join(regressions))
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
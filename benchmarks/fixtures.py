@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+#
+# Synthetic inputs for the zorg benchmarks and tests.
+#
+# Everything is generated from a fixed seed, so runs on the same
+# machine are comparable.
+
+import os
+import sys
+import time
+import random
+import struct
+
+# Fake COMAR link
+
+class FakeDriverScript:
+    def __init__(self, link, package):
+        self.link = link
+        self.package = package
+
+    def getInfo(self, timeout=None):
+        self.link.calls += 1
+        if self.package in self.link.slow:
+            time.sleep(self.link.slow[self.package])
+        if self.package in self.link.failing:
+            raise FakeDBusException(self.link.failing[self.package])
+        alias = self.package.replace("xorg_video_", "")
+        return {
+                "alias":        alias,
+                "xorg-module":  alias.rstrip("0123456789"),
+                }
+
+    def getDeviceOptions(self, busId, options, timeout=None):
+        self.link.calls += 1
+        return options
+
+    def enable(self, timeout=None):
+        self.link.calls += 1
+
+    def disable(self, timeout=None):
+        self.link.calls += 1
+
+class FakeDriverGroup:
+    def __init__(self, link):
+        self.link = link
+
+    def __iter__(self):
+        self.link.calls += 1
+        return iter(self.link.packages)
+
+    def __getitem__(self, package):
+        return FakeDriverScript(self.link, package)
+
+class FakeModel:
+    pass
+
+class FakeLink:
+    """
+        Answers Xorg.Driver calls the way installed driver packages do.
+        getInfo() of the packages in failing raises with the given
+        message, that of the packages in slow sleeps the given seconds.
+    """
+
+    packages = []
+    failing = {}
+    slow = {}
+
+    def __init__(self, packages=None):
+        if packages is not None:
+            self.packages = packages
+        self.calls = 0
+        self.Xorg = FakeModel()
+        self.Xorg.Driver = FakeDriverGroup(self)
+
+class FakeDBusException(Exception):
+    pass
+
+def installFakes(packages):
+    """
+        Make comar.Link() return a FakeLink for the given packages, so
+        that no benchmark talks to the real COMAR. dbus and pardus are
+        only replaced if they are not installed.
+    """
+
+    import imp
+
+    FakeLink.packages = packages
+
+    comar = imp.new_module("comar")
+    comar.Link = FakeLink
+    sys.modules["comar"] = comar
+
+    try:
+        import dbus
+    except ImportError:
+        dbus = imp.new_module("dbus")
+        dbus.DBusException = FakeDBusException
+        dbus.Dictionary = lambda d, signature=None: dict(d)
+        sys.modules["dbus"] = dbus
+
+    try:
+        import pardus.sysutils
+    except ImportError:
+        pardus = imp.new_module("pardus")
+        sysutils = imp.new_module("pardus.sysutils")
+        sysutils.get_kernel_option = lambda option: {}
+        pardus.sysutils = sysutils
+        sys.modules["pardus"] = pardus
+        sys.modules["pardus.sysutils"] = sysutils
+
+# Text inputs
+
+driverNames = ("ati", "radeon", "radeonhd", "nv", "nouveau", "intel",
+               "i810", "mga", "sis", "savage", "vmware", "vesa")
+
+def pciId(rnd):
+    return "%04x" % rnd.randint(0x1000, 0x1fff), "%04x" % rnd.randint(0, 0xffff)
+
+def writeLines(path, lines):
+    f = open(path, "w")
+    try:
+        for line in lines:
+            f.write(line)
+    finally:
+        f.close()
+
+def xorgConfLines(count, seed=1):
+    """Return about count lines of a valid, commented xorg.conf."""
+
+    rnd = random.Random(seed)
+    lines = []
+    n = 0
+    while len(lines) < count:
+        lines.append("# Section %d\n" % n)
+        lines.append('Section "Device"\n')
+        lines.append('    Identifier  "VideoCard%d"\n' % n)
+        lines.append('    Driver      "%s"  # picked by zorg\n'
+                        % rnd.choice(driverNames))
+        lines.append('    BusID       "PCI:%d:0:0"\n' % (n % 256))
+        for i in range(rnd.randint(2, 8)):
+            lines.append('    Option      "Option%d" "%d"\n' % (i, rnd.randint(0, 1)))
+        lines.append("EndSection\n")
+        lines.append("\n")
+        lines.append('Section "Monitor"\n')
+        lines.append('    Identifier  "Monitor%d"\n' % n)
+        lines.append('    HorizSync   30.0 - 80.0\n')
+        lines.append('    VertRefresh 56.0 - 76.0\n')
+        lines.append('    Option      "PreferredMode" "1280x1024"\n')
+        lines.append("EndSection\n")
+        lines.append("\n")
+        lines.append('Section "Screen"\n')
+        lines.append('    Identifier  "Screen%d"\n' % n)
+        lines.append('    Device      "VideoCard%d"\n' % n)
+        lines.append('    Monitor     "Monitor%d"\n' % n)
+        lines.append('    DefaultDepth 24\n')
+        lines.append('    SubSection "Display"\n')
+        lines.append('        Depth   24\n')
+        lines.append('        Modes   "1280x1024" "1024x768" "800x600"\n')
+        lines.append('    EndSubSection\n')
+        lines.append("EndSection\n")
+        lines.append("\n")
+        n += 1
+
+    return lines
+
+def entryLines(count, seed=2):
+    """Return count single xorg.conf lines of mixed shapes."""
+
+    rnd = random.Random(seed)
+    shapes = (
+        '    Identifier  "Card%d"\n',
+        '    Option      "AccelMethod" "EXA"  # %d\n',
+        '    Modes       "1280x1024" "1024x768" "800x600" "640x480"\n',
+        '    HorizSync   30.0 - %d.0\n',
+        '    Depth       %d\n',
+        '# comment line %d\n',
+        '\n',
+        'Section "Device%d"\n',
+        'EndSection\n',
+        )
+    lines = []
+    for i in range(count):
+        shape = rnd.choice(shapes)
+        if "%d" in shape:
+            shape = shape % i
+        lines.append(shape)
+    return lines
+
+def writeMonitorsDB(path, vendors=400, models=50, seed=3):
+    rnd = random.Random(seed)
+    lines = ["# Synthetic MonitorsDB\n"]
+    for i in range(20):
+        lines.append("Generic LCD Display; LCD Panel %dx%d; 0; 31.5-%d.0; 56.0 - 65.0\n"
+                        % (640 + i * 64, 480 + i * 48, 37 + i))
+    for v in range(vendors):
+        vendor = "Vendor %d" % v
+        eisa = "".join(chr(ord("A") + rnd.randint(0, 25)) for x in range(3))
+        for m in range(models):
+            lines.append("%s; Model %d-%d; %s%04X; 30.0-%d.0; 50.0-%d.0; 1\n"
+                            % (vendor, v, m, eisa, m, rnd.randint(60, 110),
+                               rnd.randint(75, 160)))
+    writeLines(path, lines)
+
+def writeDriversDB(path, entries=50000, extra=(), seed=4):
+    """
+        Write a DriversDB with entries random devices and the extra
+        (vendor, device) IDs. Returns the sorted list of all IDs.
+    """
+
+    rnd = random.Random(seed)
+    ids = set(extra)
+    while len(ids) < entries:
+        ids.add(pciId(rnd))
+    ids = sorted(ids)
+
+    writeLines(path, ["%s%s %s\n" % (v, d, " ".join(rnd.sample(driverNames, 2)))
+                        for v, d in ids])
+    return ids
+
+def writePciIds(path, vendors=2500, devices=15, seed=5):
+    """
+        Write a pci.ids of about the size of the real one and return a
+        list of (vendor, device, subvendor, subdevice) IDs in it.
+    """
+
+    rnd = random.Random(seed)
+    lines = ["# Synthetic pci.ids\n", "#\n", "\n"]
+    ids = []
+    for v in range(vendors):
+        vendor = "%04x" % (0x1000 + v)
+        lines.append("%s  Vendor %d Corporation\n" % (vendor, v))
+        for d in range(devices):
+            device = "%04x" % (d * 16 + rnd.randint(0, 15))
+            lines.append("\t%s  Device %d of vendor %d\n" % (device, d, v))
+            if d % 3 == 0:
+                sub = ("%04x" % (0x1000 + rnd.randint(0, vendors - 1)), "%04x" % d)
+                lines.append("\t\t%s %s  Subsystem %d\n" % (sub[0], sub[1], d))
+                ids.append((vendor, device) + sub)
+            else:
+                ids.append((vendor, device, None, None))
+
+    lines.append("\n# List of known device classes\n")
+    lines.append("C 03  Display controller\n")
+    lines.append("\t00  VGA compatible controller\n")
+    lines.append("\t\t00  VGA controller\n")
+    lines.append("\t80  Display controller\n")
+    writeLines(path, lines)
+
+    return ids
+
+# Fake sysfs
+
+def makeEDID(vendor, product, name, hsync=(30, 83), vref=(56, 75)):
+    mfg = 0
+    for c in vendor:
+        mfg = (mfg << 5) | (ord(c) - ord("A") + 1)
+
+    data = "\x00\xff\xff\xff\xff\xff\xff\x00"
+    data += struct.pack(">H", mfg) + struct.pack("<HI", product, 1)
+    data += "\x00" * (54 - len(data))
+
+    data += "\x00\x00\x00\xfc\x00" + (name[:13] + "\n").ljust(13)[:13]
+    data += "\x00\x00\x00\xfd\x00" + struct.pack("BBBB", vref[0], vref[1],
+                                                 hsync[0], hsync[1])
+    data += "\x00" * 9
+    data += "\x00" * 36
+    data += "\x00"
+    data += chr((256 - sum(ord(x) for x in data) % 256) % 256)
+
+    return data
+
+def makeSysfs(root, cards, others=200, outputs=("VGA-1", "DVI-I-1", "HDMI-A-1")):
+    """
+        Create a fake /sys under root with the given number of video
+        cards among other PCI devices, and DRM connectors with EDIDs
+        under root/class/drm. Returns the list of card directory names.
+    """
+
+    rnd = random.Random(6)
+
+    devicesDir = os.path.join(root, "bus/pci/devices")
+    drmDir = os.path.join(root, "class/drm")
+    os.makedirs(devicesDir)
+    os.makedirs(drmDir)
+
+    def write(path, data):
+        f = open(path, "w")
+        f.write(data)
+        f.close()
+
+    names = []
+    for n in range(cards + others):
+        name = "0000:%02x:%02x.0" % (n / 32, n % 32)
+        path = os.path.join(devicesDir, name)
+        os.mkdir(path)
+
+        isCard = n % ((cards + others) / max(cards, 1)) == 0 and len(names) < cards
+        write(os.path.join(path, "class"), "0x030000\n" if isCard else "0x020000\n")
+        write(os.path.join(path, "vendor"), "0x%04x\n" % rnd.choice((0x1002, 0x10de, 0x8086)))
+        write(os.path.join(path, "device"), "0x%04x\n" % rnd.randint(0, 0xffff))
+        write(os.path.join(path, "subsystem_vendor"), "0x1043\n")
+        write(os.path.join(path, "subsystem_device"), "0x%04x\n" % n)
+        if not isCard:
+            continue
+
+        write(os.path.join(path, "boot_vga"), "1\n" if not names else "0\n")
+
+        card = "card%d" % len(names)
+        os.mkdir(os.path.join(drmDir, card))
+        os.symlink(path, os.path.join(drmDir, card, "device"))
+        for output in outputs:
+            connector = os.path.join(drmDir, "%s-%s" % (card, output))
+            os.mkdir(connector)
+            write(os.path.join(connector, "edid"),
+                  makeEDID("ACR", len(names), "Monitor %d" % len(names)))
+
+        names.append(name)
+
+    return names
+
+def makeModuleTree(root, aliases=20000, seed=9):
+    """
+        Create a fake kernel modules.alias, mostly of non-display
+        devices like the real one, and Xorg driver alias files.
+    """
+
+    rnd = random.Random(seed)
+
+    modulesDir = os.path.join(root, "lib/modules/2.6.37")
+    os.makedirs(modulesDir)
+    lines = ["# Aliases extracted from modules themselves.\n"]
+    for i in range(aliases):
+        vendor, device = pciId(rnd)
+        if i % 10:
+            module, baseClass = rnd.choice(("e1000e", "ahci", "snd_hda_intel")), "*"
+        else:
+            module, baseClass = rnd.choice(("i915", "radeon", "nouveau", "mgag200")), "03"
+        lines.append("alias pci:v0000%sd0000%ssv*sd*bc%ssc*i* %s\n"
+                        % (vendor.upper(), device.upper(), baseClass, module))
+    lines.append("alias pci:v000010DEd*sv*sd*bc03sc*i* nouveau\n")
+    writeLines(os.path.join(modulesDir, "modules.alias"), lines)
+
+    aliasDir = os.path.join(root, "usr/share/hwdata/videoaliases")
+    os.makedirs(aliasDir)
+    for driver in driverNames:
+        writeLines(os.path.join(aliasDir, "%s.xinf" % driver),
+                   ["alias pcivideo:v0000%sd0000%ssv*sd*bc*sc*i* %s\n"
+                        % (pciId(rnd) + (driver,)) for i in range(200)])
+
+def makeDriversDir(path, modules=driverNames):
+    os.makedirs(path)
+    for name in modules:
+        open(os.path.join(path, "%s_drv.so" % name), "w").close()
@@ -10,6 +10,24 @@ import zorg
 from zorg import consts
 
 class Install(install):
+    """
+        Also generates DriversDB from the driver alias files. With
+        --root, they are read under the root, which has only the files
+        installed there. Give --aliases-root=/ to read those of the
+        build host instead. On the target system, the aliases are
+        merged again when DriversDB is loaded after they change.
+    """
+
+    user_options = install.user_options + [
+        ("aliases-root=", None,
+         "directory to read the driver alias files under "
+         "[default: the install root]"),
+        ]
+
+    def initialize_options(self):
+        install.initialize_options(self)
+        self.aliases_root = None
+
     def run(self):
         install.run(self)
 
@@ -20,13 +38,23 @@ class Install(install):
         if not os.path.exists(target):
             os.makedirs(target, 0755)
 
+        # Merge the PCI IDs of installed drivers into DriversDB and
+        # compile it, so that the first lookup does not parse it
+        from zorg.driversdb import updateDriversDB
+        db = updateDriversDB(self.root, self.aliases_root)
+        if db is None:
+            print "Could not write %s" % consts.local_drivers_file
+        else:
+            print "Generated %s with %d entries" % \
+                    (consts.local_drivers_file, len(db))
+
 setup(name="zorg",
     version=zorg.versionString(),
     description="Python Modules for zorg",
     license="GNU GPL2",
     url="http://www.pardus.org.tr/",
     packages = ["zorg"],
-    scripts = ["zorg-cli", "inf2mondb"],
+    scripts = ["zorg-cli", "zorg-offline", "zorg-daemon", "inf2mondb"],
     data_files = [
         (consts.data_dir, ["data/DriversDB", "data/MonitorsDB"]),
         ("/sbin", ["zorg-loadmodule"]),
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Helpers shared by the zorg tests.
+#
+# The tests use the fake COMAR link and the input generators of the
+# benchmarks. Run them from the top directory with:
+#
+#   python -m unittest discover -s tests
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+top = os.path.dirname(here)
+sys.path.insert(0, top)
+sys.path.insert(0, os.path.join(top, "benchmarks"))
+
+import fixtures
+
+fixtures.installFakes([])
+
+from zorg import consts
+
+try:
+    import piksemel
+except ImportError:
+    piksemel = None
+
+needsPiksemel = unittest.skipIf(piksemel is None, "piksemel is not installed")
+
+# consts pointed at the test directory, relative to it
+workPaths = {
+    "config_dir":           "var/lib/zorg",
+    "cache_dir":            "var/lib/zorg/cache",
+    "config_file":          "var/lib/zorg/config.xml",
+    "state_file":           "var/lib/zorg/config.json",
+    "configured_bus_file":  "var/lib/zorg/configured_bus",
+    "hashes_file":          "var/lib/zorg/hashes",
+    "fingerprint_file":     "var/lib/zorg/fingerprint",
+    "profile_file":         "var/lib/zorg/profile.json",
+    "enabled_package_file": "var/lib/zorg/enabled_package",
+    "local_drivers_file":   "var/lib/zorg/DriversDB",
+    "xorg_conf_file":       "etc/X11/xorg.conf",
+    "drivers_file":         "usr/share/X11/DriversDB",
+    "monitors_file":        "usr/share/X11/MonitorsDB",
+    "drivers_dir":          "usr/lib/xorg/modules/drivers",
+    "pci_ids_file":         "usr/share/misc/pci.ids",
+    "xkb_symbols_dir":      "usr/share/X11/xkb/symbols",
+    "xkb_rules_dir":        "usr/share/X11/xkb/rules",
+    "language_file":        "etc/mudur/language",
+    "daemon_socket":        "run/zorg/socket",
+    "driver_scripts_dir":   "var/db/comar3/scripts/Xorg.Driver",
+    "aliases_root":         "",
+    }
+
+class ZorgTestCase(unittest.TestCase):
+    """
+        Runs each test with zorg pointed at an empty temporary tree,
+        with the fake sysfs at sys/ and the caches of the previous
+        test dropped.
+    """
+
+    packages = []
+
+    def setUp(self):
+        from zorg import cache, driverinfo, probe
+
+        self.root = tempfile.mkdtemp(prefix="zorg-test-")
+
+        self.savedConsts = dict((name, getattr(consts, name))
+                                    for name in workPaths)
+        for name, path in workPaths.items():
+            setattr(consts, name, self.path(path))
+        os.makedirs(consts.cache_dir)
+
+        self.savedSysfs = (probe.sysdir, probe.drmdir)
+        probe.sysdir = self.path("sys/bus/pci/devices")
+        probe.drmdir = self.path("sys/class/drm")
+
+        fixtures.FakeLink.packages = list(self.packages)
+        fixtures.FakeLink.failing = {}
+        fixtures.FakeLink.slow = {}
+        cache.invalidate()
+        driverinfo.invalidate()
+
+    def tearDown(self):
+        from zorg import probe
+
+        for name, value in self.savedConsts.items():
+            setattr(consts, name, value)
+        probe.sysdir, probe.drmdir = self.savedSysfs
+
+        shutil.rmtree(self.root)
+
+    def path(self, *names):
+        return os.path.join(self.root, *names)
+
+    def writeFile(self, path, data):
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        fixtures.writeLines(path, [data])
+
+    def addScript(self, package):
+        """Register a fake Xorg.Driver script of package."""
+
+        self.writeFile(os.path.join(consts.driver_scripts_dir,
+                                    "%s.py" % package), "")
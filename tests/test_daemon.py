@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import socket
+import threading
+import unittest
+
+from common import fixtures, ZorgTestCase
+
+from zorg import consts, daemon
+
+class FakeDisplay:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def method(*args):
+            self.calls.append(name)
+            return True
+        return method
+
+class DaemonTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+
+        self.cards = fixtures.makeSysfs(self.path("sys"), 2, others=4,
+                                        outputs=("VGA-1",))
+        daemon._devices = None
+
+        self.display = FakeDisplay()
+        link = fixtures.FakeLink()
+        link.Xorg.Display = {"zorg": self.display}
+        self.savedLink = daemon._link
+        daemon._link = link
+
+    def tearDown(self):
+        daemon._link = self.savedLink
+        daemon._serving = False
+        daemon._devices = None
+        ZorgTestCase.tearDown(self)
+
+    def testDevicesFollowHardware(self):
+        self.assertEqual([x["bus_id"] for x in daemon.devices()],
+                         ["PCI:0:0:0", "PCI:0:3:0"])
+
+        # A card is hot plugged
+        card = os.path.join(self.path("sys/bus/pci/devices"), "0000:00:1f.0")
+        for name, value in (("class", "0x030000"), ("vendor", "0x8086"),
+                            ("device", "0x0046")):
+            self.writeFile(os.path.join(card, name), value + "\n")
+
+        self.assertEqual(len(daemon.devices()), 3)
+
+    def testSilentClient(self):
+        sock = daemon.listen(consts.daemon_socket)
+
+        def serve():
+            try:
+                daemon.acceptLoop(sock)
+            except socket.error:
+                pass
+
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+
+        silent = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        silent.connect(consts.daemon_socket)
+        try:
+            start = time.time()
+            self.assertEqual(daemon.call("devices")[0]["bus_id"], "PCI:0:0:0")
+            self.assertTrue(time.time() - start < daemon.readTimeout)
+        finally:
+            silent.close()
+            sock.shutdown(socket.SHUT_RDWR)
+            sock.close()
+
+    def testProbeSameInDaemon(self):
+        for serving in (False, True):
+            daemon._serving = serving
+            self.display.calls = []
+
+            self.assertTrue(daemon.probe())
+            self.assertEqual(self.display.calls, ["initialConfig", "syncConfigs"])
+
+if __name__ == "__main__":
+    unittest.main()
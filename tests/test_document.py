@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from common import fixtures, ZorgTestCase, needsPiksemel
+
+from zorg import consts
+from zorg.document import XorgDocument
+from zorg.parser import XorgParser, XorgSection
+from zorg.probe import VideoDevice
+
+conf = """\
+# Edited by hand
+Section "Device"
+    Identifier  "VideoCard0"
+    Driver      "vesa"
+EndSection
+
+Section "Device"
+    Identifier  "VideoCard1"
+    Driver      "vesa"
+EndSection
+
+Section "InputClass"
+    Identifier  "Touchpad"
+EndSection
+"""
+
+def generated(*identifiers):
+    parser = XorgParser()
+    for identifier in identifiers:
+        section = XorgSection("Device")
+        section.set("Identifier", identifier)
+        section.set("Driver", "nv")
+        parser.sections.append(section)
+    return parser
+
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        self.doc = XorgDocument()
+        self.doc.parse(conf.splitlines(True))
+
+    def testStaleOwnedRemoved(self):
+        self.doc.merge(generated("VideoCard0"),
+                       [("Device", "VideoCard0"), ("Device", "VideoCard1")])
+
+        text = self.doc.toString()
+        self.assertFalse("VideoCard1" in text)
+        self.assertTrue('"Touchpad"' in text)
+        self.assertTrue("\n\n\n" not in text)
+        self.assertEqual(self.doc.findSection("Device", "VideoCard1"), None)
+        self.assertEqual(self.doc.findSection("Device", "VideoCard0").get("Driver"),
+                         "nv")
+
+    def testNotOwnedKept(self):
+        self.doc.merge(generated("VideoCard0"))
+        self.assertEqual(self.doc.findSection("Device", "VideoCard1").get("Driver"),
+                         "vesa")
+
+    def testOwnedKeysRemoved(self):
+        block = self.doc.findSection("Device", "VideoCard0")
+        block.setOption("TwinView", "true")
+        block.setOption("NoAccel", "true")
+        block.set("VideoRam", 65536)
+
+        owned = {("Device", "VideoCard0"): (("driver", "identifier", "videoram"),
+                                            ("twinview",))}
+        self.doc.merge(generated("VideoCard0"), [("Device", "VideoCard0")],
+                       owned)
+
+        self.assertEqual(block.options().keys(), ["NoAccel"])
+        self.assertEqual(block.get("VideoRam"), None)
+        self.assertEqual(block.get("Driver"), "nv")
+
+    def testIdentifierChange(self):
+        block = self.doc.findSection("device", "VideoCard1")
+        block.set("Identifier", "Renamed")
+
+        self.assertEqual(self.doc.findSection("Device", "VideoCard1"), None)
+        self.assertTrue(self.doc.findSection("Device", "Renamed") is block)
+
+    def testLinePositions(self):
+        first = self.doc.findSection("Device", "VideoCard0")
+        second = self.doc.findSection("Device", "VideoCard1")
+
+        first.set("BusID", "PCI:1:0:0")
+        first.setOption("NoAccel", "true")
+        second.remove("Driver")
+
+        for n, line in enumerate(self.doc.lines):
+            self.assertEqual(self.doc.index(line), n)
+
+        removed = first.items[0]
+        first.remove("Identifier")
+        self.assertRaises(ValueError, self.doc.index, removed)
+
+@needsPiksemel
+class SaveXorgConfigTest(ZorgTestCase):
+    def testCardRemoved(self):
+        from zorg.config import probeDevices, saveXorgConfig, getConfigStore
+
+        fixtures.makeSysfs(self.path("sys"), 2, others=2,
+                           outputs=("VGA-1",))
+        cards = probeDevices(self.path("sys"))
+        self.writeFile(consts.xorg_conf_file, "# Keep me\n")
+
+        saveXorgConfig(cards)
+        text = open(consts.xorg_conf_file).read()
+        self.assertTrue('"VideoCard1"' in text and '"Monitor1[default]"' in text)
+        self.assertTrue(("Device", "VideoCard1") in getConfigStore().getSections())
+
+        saveXorgConfig(cards[:1])
+        text = open(consts.xorg_conf_file).read()
+        self.assertTrue(text.startswith("# Keep me\n"))
+        for identifier in ("VideoCard0", "VideoCard1", "Screen0", "Screen1",
+                           "Monitor0[default]", "Monitor1[default]"):
+            self.assertFalse('"%s"' % identifier in text, identifier)
+        self.assertTrue('"VideoCard"' in text and '"Monitor[default]"' in text)
+
+    def testDriverSwitch(self):
+        from zorg.config import buildXorgConfig, writeXorgConfig
+
+        fixtures.makeSysfs(self.path("sys"), 1, others=2)
+        fixtures.makeDriversDir(consts.drivers_dir, ("nvidia", "intel"))
+        os.makedirs(os.path.dirname(consts.xorg_conf_file))
+        card = VideoDevice(deviceDir="0000:00:00.0")
+        card.driver = "nvidia"
+        cards = [card]
+
+        options = {card.bus_id: {"NoLogo": "true", "TwinView": "true"}}
+        writeXorgConfig(buildXorgConfig(cards, False, options), cards)
+        self.assertTrue('"TwinView"' in open(consts.xorg_conf_file).read())
+
+        card.driver = "intel"
+        writeXorgConfig(buildXorgConfig(cards, False, {}), cards)
+
+        text = open(consts.xorg_conf_file).read()
+        self.assertTrue('"intel"' in text)
+        self.assertTrue('"TwinView"' not in text and '"NoLogo"' not in text)
+
+        # The admin's own options are kept
+        doc = XorgDocument()
+        doc.parseFile(consts.xorg_conf_file)
+        doc.findSection("Device", "VideoCard").setOption("AccelMethod", "sna")
+        fixtures.writeLines(consts.xorg_conf_file, [doc.toString()])
+
+        writeXorgConfig(buildXorgConfig(cards, False, {}), cards)
+        self.assertTrue('"AccelMethod"' in open(consts.xorg_conf_file).read())
+
+if __name__ == "__main__":
+    unittest.main()
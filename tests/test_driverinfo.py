@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import unittest
+import StringIO
+
+from common import fixtures, ZorgTestCase
+
+from zorg import consts
+from zorg import driverinfo
+from zorg.inventory import DriverInventory
+
+class DriverInfoTest(ZorgTestCase):
+    packages = ["xorg_video_nvidia96", "xorg_video_fglrx",
+                "xorg_video_nvidia173"]
+
+    def getDriverInfos(self, link=None):
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            infos = driverinfo.getDriverInfos(link)
+            self.log = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        return infos
+
+    def testAllPackages(self):
+        infos = self.getDriverInfos()
+        self.assertEqual(sorted(infos), ["fglrx", "nvidia173", "nvidia96"])
+        self.assertEqual(infos["fglrx"]["package"], "xorg_video_fglrx")
+        self.assertEqual(driverinfo.failedPackages(), {})
+        self.assertEqual(self.log, "")
+
+    def testOneFailing(self):
+        fixtures.FakeLink.failing = {"xorg_video_fglrx": "Script error"}
+
+        infos = self.getDriverInfos()
+        self.assertEqual(sorted(infos), ["nvidia173", "nvidia96"])
+        self.assertEqual(driverinfo.failedPackages(),
+                         {"xorg_video_fglrx": "Script error"})
+        self.assertTrue("xorg_video_fglrx" in self.log)
+
+        # Failures are not cached, the next process asks again
+        self.assertFalse(os.path.exists(driverinfo.cacheFile()))
+
+    def testConcurrent(self):
+        delay = 0.3
+        fixtures.FakeLink.slow = dict((x, delay) for x in self.packages)
+
+        start = time.time()
+        infos, errors = driverinfo.queryInfos(fixtures.FakeLink(),
+                                              self.packages, workers=3)
+        elapsed = time.time() - start
+
+        self.assertEqual(len(infos), 3)
+        self.assertEqual(errors, {})
+        self.assertTrue(elapsed < 2 * delay, elapsed)
+
+    def testHangingPackage(self):
+        fixtures.FakeLink.slow = {"xorg_video_fglrx": 3}
+
+        start = time.time()
+        infos, errors = driverinfo.queryInfos(fixtures.FakeLink(),
+                                              self.packages, timeout=0.05)
+        self.assertTrue(time.time() - start < 2)
+
+        self.assertEqual(sorted(infos), ["nvidia173", "nvidia96"])
+        self.assertEqual(errors, {"xorg_video_fglrx": "Timed out"})
+
+    def testCacheReused(self):
+        self.getDriverInfos()
+        driverinfo.invalidate()
+
+        link = fixtures.FakeLink()
+        infos = self.getDriverInfos(link)
+        self.assertEqual(len(infos), 3)
+        # Only the package list was fetched
+        self.assertEqual(link.calls, 1)
+
+    def testScriptsChange(self):
+        for package in self.packages:
+            self.addScript(package)
+        self.assertEqual(len(self.getDriverInfos()), 3)
+
+        fixtures.FakeLink.packages = self.packages + ["xorg_video_nvidia185"]
+        self.addScript("xorg_video_nvidia185")
+        self.assertTrue("nvidia185" in self.getDriverInfos())
+
+    def testSetInfosKept(self):
+        driverinfo.setInfos({"intel": {"alias": "intel"}})
+        self.addScript("xorg_video_nvidia96")
+        self.assertEqual(self.getDriverInfos().keys(), ["intel"])
+
+class InventoryTest(ZorgTestCase):
+    packages = ["xorg_video_nvidia96"]
+
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+        fixtures.makeDriversDir(consts.drivers_dir, ("vesa", "intel"))
+
+    def testNoWatcherByDefault(self):
+        self.assertEqual(DriverInventory().notifier, None)
+
+    def testModules(self):
+        inventory = DriverInventory()
+        self.assertEqual(sorted(inventory.modules()), ["intel", "vesa"])
+
+        fixtures.makeDriversDir(consts.drivers_dir + "2", ("nv",))
+        os.rename(os.path.join(consts.drivers_dir + "2", "nv_drv.so"),
+                  os.path.join(consts.drivers_dir, "nv_drv.so"))
+        self.assertTrue(inventory.hasModule("nv"))
+
+    def testPackagesFollowScripts(self):
+        self.addScript("xorg_video_nvidia96")
+        inventory = DriverInventory()
+        generation = inventory.update()
+        self.assertEqual(inventory.packages(), ("xorg_video_nvidia96",))
+
+        fixtures.FakeLink.packages = ["xorg_video_nvidia96", "xorg_video_fglrx"]
+        self.addScript("xorg_video_fglrx")
+        self.assertTrue(inventory.update() > generation)
+        self.assertEqual(inventory.packages(),
+                         ("xorg_video_fglrx", "xorg_video_nvidia96"))
+
+if __name__ == "__main__":
+    unittest.main()
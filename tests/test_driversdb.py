@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import unittest
+
+from common import fixtures, ZorgTestCase
+
+from zorg import cache, consts, driversdb
+
+shipped = """\
+# vendor device driver...
+10de0020 nv
+80860046 intel i810
+"""
+
+class GenerateTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+
+        self.sysroot = self.path("image")
+        fixtures.makeModuleTree(self.sysroot, aliases=500)
+        self.writeFile(os.path.join(self.sysroot,
+                                    consts.drivers_file.lstrip("/")), shipped)
+
+    def aliases(self, name):
+        path = os.path.join(self.sysroot, name)
+        return [x.split() for x in open(path) if x.startswith("alias")]
+
+    def testGenerate(self):
+        db = driversdb.generateDriversDB(self.sysroot)
+
+        # Shipped entries come first
+        self.assertEqual(db["10de0020"][0], "nv")
+        self.assertEqual(db["80860046"][:2], ["intel", "i810"])
+
+        # Display drivers of the kernel, vendor wide ones too
+        self.assertEqual(db["10de"], ["nouveau"])
+        for alias, pattern, module in self.aliases("lib/modules/2.6.37/modules.alias"):
+            if module in driversdb.kernelDrivers:
+                pciId = driversdb.aliasId(pattern)
+                self.assertTrue(driversdb.kernelDrivers[module] in db[pciId])
+
+        # but no other kernel modules
+        drivers = set(sum(db.values(), []))
+        self.assertEqual(drivers - set(fixtures.driverNames), set())
+
+        # Xorg driver aliases
+        for alias, pattern, driver in self.aliases("usr/share/hwdata/videoaliases/vesa.xinf"):
+            self.assertTrue("vesa" in db[driversdb.aliasId(pattern)])
+
+    def testUpdate(self):
+        root = self.path("target")
+        self.writeFile(os.path.join(root, consts.drivers_file.lstrip("/")),
+                       "10de0020 nv\n")
+
+        db = driversdb.updateDriversDB(root, self.sysroot)
+        self.assertEqual(db, driversdb.generateDriversDB(self.sysroot,
+                os.path.join(root, consts.drivers_file.lstrip("/"))))
+        self.assertFalse("80860046" in db)
+
+        target = os.path.join(root, consts.local_drivers_file.lstrip("/"))
+        self.assertEqual(driversdb.parseDriversDB(target), db)
+
+        cacheDir = os.path.join(root, consts.cache_dir.lstrip("/"))
+        self.assertEqual(cache.readCache(cache.cacheFile("DriversDB",
+                            consts.local_drivers_file, cacheDir),
+                                         (cache.sourceStamp(target),
+                                          driversdb.aliasesStamp(self.sysroot))),
+                         db)
+
+    def testAliasesStamp(self):
+        stamp = driversdb.aliasesStamp(self.sysroot)
+        self.assertEqual([x[0] for x in stamp],
+                         ["usr/share/hwdata/videoaliases",
+                          "usr/share/xserver-xorg/pci",
+                          "lib/modules/2.6.37/modules.alias"])
+        self.assertEqual(stamp[1][1], None)
+
+class LookupTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+
+        self.writeFile(consts.drivers_file, shipped)
+        self.writeFile(consts.local_drivers_file,
+                       "10de0020 nv nouveau\n10de nouveau\n")
+        past = time.time() - 60
+        os.utime(consts.drivers_file, (past, past))
+
+    def testVendorWildcard(self):
+        self.assertEqual(driversdb.lookup("10de", "0020"), ["nv", "nouveau"])
+        self.assertEqual(driversdb.lookup("10de", "ffff"), ["nouveau"])
+        self.assertEqual(driversdb.lookup("10de", "ffff", wildcard=False), [])
+        self.assertEqual(driversdb.lookupMany([("10de", "ffff")],
+                                              wildcard=False),
+                         {("10de", "ffff"): []})
+
+    def testAliasesChange(self):
+        self.assertEqual(driversdb.lookup("1af4", "1050"), [])
+
+        aliasDir = os.path.join(consts.aliases_root, "usr/share/xserver-xorg/pci")
+        self.writeFile(os.path.join(aliasDir, "modesetting.ids"), "1af41050\n")
+        self.assertEqual(driversdb.lookup("1af4", "1050"), [])
+
+        # Checked again after aliasesInterval
+        driversdb._aliases = None
+        self.assertEqual(driversdb.lookup("1af4", "1050"), ["modesetting"])
+        self.assertEqual(driversdb.lookup("10de", "0020"), ["nv", "nouveau"])
+
+        self.writeFile(os.path.join(aliasDir, "qxl.ids"), "1b360100\n")
+        later = time.time() + 60
+        os.utime(aliasDir, (later, later))
+        driversdb._aliases = None
+        self.assertEqual(driversdb.lookup("1b36", "0100"), ["qxl"])
+
+    def testNewerShippedFile(self):
+        self.assertEqual(driversdb.driversDBFile(), consts.local_drivers_file)
+
+        later = time.time() + 60
+        os.utime(consts.drivers_file, (later, later))
+        self.assertEqual(driversdb.driversDBFile(), consts.drivers_file)
+        self.assertEqual(driversdb.lookup("10de", "ffff"), [])
+
+        os.unlink(consts.local_drivers_file)
+        self.assertEqual(driversdb.driversDBFile(), consts.drivers_file)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import unittest
+
+from common import fixtures, ZorgTestCase
+
+from zorg import consts, driverinfo
+from zorg.fingerprint import saveFingerprint, isUpToDate
+
+class FingerprintTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+
+        self.cards = fixtures.makeSysfs(self.path("sys"), 1, others=4,
+                                        outputs=("VGA-1",))
+        fixtures.makeDriversDir(consts.drivers_dir)
+        self.addScript("xorg_video_nvidia")
+        self.writeFile(consts.drivers_file, "10de:0020 nv\n")
+        self.writeFile(consts.xorg_conf_file, "# generated\n")
+
+        # Checking the fingerprint must not ask COMAR
+        def noLink(*args):
+            raise AssertionError("COMAR was called")
+
+        self.savedPackages = driverinfo.getInstalledPackages
+        driverinfo.getInstalledPackages = noLink
+
+        saveFingerprint()
+
+    def tearDown(self):
+        driverinfo.getInstalledPackages = self.savedPackages
+        ZorgTestCase.tearDown(self)
+
+    def touch(self, path):
+        later = time.time() + 10
+        os.utime(path, (later, later))
+
+    def testUnchanged(self):
+        self.assertTrue(isUpToDate())
+
+    def testXorgConfEdited(self):
+        fixtures.writeLines(consts.xorg_conf_file, ["# edited by hand\n"])
+        self.assertFalse(isUpToDate())
+
+    def testDriverPackageInstalled(self):
+        self.addScript("xorg_video_fglrx")
+        self.assertFalse(isUpToDate())
+
+    def testDriverPackageUpgraded(self):
+        self.touch(os.path.join(consts.driver_scripts_dir,
+                                "xorg_video_nvidia.py"))
+        self.assertFalse(isUpToDate())
+
+    def testDriverModuleChanged(self):
+        self.touch(os.path.join(consts.drivers_dir, "nv_drv.so"))
+        self.assertFalse(isUpToDate())
+
+    def testDriversDBChanged(self):
+        self.writeFile(consts.local_drivers_file, "10de:0020 nouveau\n")
+        self.assertFalse(isUpToDate())
+
+    def testCardChanged(self):
+        self.writeFile(os.path.join(self.path("sys/bus/pci/devices"),
+                                    self.cards[0], "device"), "0xffff\n")
+        self.assertFalse(isUpToDate())
+
+    def testMonitorChanged(self):
+        self.writeFile(self.path("sys/class/drm/card0-VGA-1/edid"),
+                       fixtures.makeEDID("SAM", 1, "Other"))
+        self.assertFalse(isUpToDate())
+
+    def testInitialConfigSkipped(self):
+        from zorg.config import initialConfig
+
+        self.assertEqual(initialConfig(), None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import common
+
+import bench_import
+
+class ImportTest(unittest.TestCase):
+    """Heavy dependencies are only loaded by the code which uses them."""
+
+    def testModules(self):
+        for module in bench_import.modules:
+            elapsed, loaded = bench_import.measureImport(module, 1)
+            self.assertNotEqual(elapsed, None,
+                                "%s: %s" % (module, " ".join(loaded)))
+            self.assertEqual(loaded, [], "%s loads %s" % (module,
+                                                          " ".join(loaded)))
+
+    def testQuickQueries(self):
+        for args in bench_import.quickQueries:
+            wall, status, err = bench_import.measureCommand(args, 1)
+            self.assertEqual(status, 0, "zorg-cli %s: %s" % (" ".join(args),
+                                                             err.strip()))
+
+if __name__ == "__main__":
+    unittest.main()
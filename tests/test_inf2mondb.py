@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import os
+import imp
+import unittest
+import StringIO
+
+from common import ZorgTestCase, top
+
+inf2mondb = imp.load_source("inf2mondb", os.path.join(top, "inf2mondb"))
+
+monitorsDB = """\
+#
+# Monitor information
+#
+Zenith; Zenith ZCM-1550; 0; 31.0-65.0; 55-100; 1
+
+Acer; Acer View 56L; ACR0213; 30.0-54.0; 50.0-120.0; 1
+# wrong data ? #430276
+#Acer; Acer View 7; ACR7777; 28.0-55.0; 50.0-120.0; 1
+Acer; Acer View 34T; ACR0034; 30.0-38.0; 50.0-100.0; 1
+# end of the list
+"""
+
+class MergeTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+        self.source = self.path("MonitorsDB")
+        self.writeFile(self.source, monitorsDB)
+
+    def merge(self, *converted):
+        header, entries, notes = inf2mondb.readMonitorsDB(self.source)
+        entries = inf2mondb.mergeEntries([entries] + list(converted))
+
+        out = StringIO.StringIO()
+        inf2mondb.writeMonitorsDB(out, header, entries, notes)
+        return out.getvalue().splitlines()
+
+    def testCommentsFollowEntries(self):
+        lines = self.merge()
+
+        self.assertEqual(lines[:3], ["#", "# Monitor information", "#"])
+        self.assertEqual(lines[-1], "# end of the list")
+
+        n = lines.index("# wrong data ? #430276")
+        self.assertEqual(lines[n + 1],
+                "#Acer; Acer View 7; ACR7777; 28.0-55.0; 50.0-120.0; 1")
+        self.assertEqual(lines[n - 1],
+                "Acer; Acer View 56L; ACR0213; 30.0-54.0; 50.0-120.0; 1")
+
+        n = lines.index("Acer; Acer View 56L; ACR0213; 30.0-54.0; 50.0-120.0; 1")
+        self.assertEqual(lines[n - 2:n], ["Acer; Acer View 34T; ACR0034; "
+                                          "30.0-38.0; 50.0-100.0; 1", ""])
+
+    def testDisabledEntryWins(self):
+        lines = self.merge([("Acer", "Acer View 7", "ACR7777",
+                             "28.0-55.0", "50.0-120.0", "1"),
+                            ("Acer", "Acer View 9", "ACR9999",
+                             "30.0-60.0", "50.0-75.0", "1")])
+
+        self.assertFalse("Acer; Acer View 7; ACR7777; 28.0-55.0; 50.0-120.0; 1"
+                            in lines)
+        self.assertTrue("Acer; Acer View 9; ACR9999; 30.0-60.0; 50.0-75.0; 1"
+                            in lines)
+
+if __name__ == "__main__":
+    unittest.main()
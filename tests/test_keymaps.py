@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import os
+import imp
+import sys
+import unittest
+
+from common import ZorgTestCase
+
+from zorg import consts, keymaps
+from zorg.keymaps import parseRules, parseSymbols, getCatalogue
+
+baseList = """\
+! model
+  pc105           Generic 105-key PC (intl.)
+
+! layout
+  us              English (US)
+  tr              Turkish
+  de              German
+
+! variant
+  intl            us: English (US, intl., with dead keys)
+  f               tr: Turkish (F)
+  alt             tr: Turkish (Alt-Q)
+
+! option
+  grp             Switching to another layout
+"""
+
+trSymbols = """\
+default partial alphanumeric_keys
+xkb_symbols "basic" {
+    include "latin"
+    name[Group1]="Turkish";
+};
+
+partial alphanumeric_keys
+xkb_symbols "f" {
+    name[Group1]="Turkish (F)";
+};
+
+partial
+xkb_symbols "sundeadkeys" {
+    include "tr(intl)"
+};
+"""
+
+usSymbols = """\
+xkb_symbols "basic" {
+    name[Group1]= "English (US)";
+};
+"""
+
+modifierMap = """\
+xkb_symbols "pc" {
+    modifier_map Shift { Shift_L, Shift_R };
+};
+"""
+
+class Keymap:
+    def __init__(self, layout, variant=""):
+        self.xkb_layout = layout
+        self.xkb_variant = variant
+
+class Language:
+    def __init__(self, *keymaps):
+        self.keymaps = keymaps
+
+class DefaultKeymapTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+
+        localedata = imp.new_module("pardus.localedata")
+        localedata.languages = {
+                "en":   Language(Keymap("us")),
+                "tr":   Language(Keymap("tr", "f")),
+                }
+        self.savedModule = sys.modules.get("pardus.localedata")
+        sys.modules["pardus.localedata"] = localedata
+
+        self.builds = []
+        self.savedBuild = keymaps.languageKeymap
+
+        def languageKeymap(path):
+            self.builds.append(path)
+            return self.savedBuild(path)
+
+        keymaps.languageKeymap = languageKeymap
+
+    def tearDown(self):
+        keymaps.languageKeymap = self.savedBuild
+        if self.savedModule is None:
+            del sys.modules["pardus.localedata"]
+        else:
+            sys.modules["pardus.localedata"] = self.savedModule
+        ZorgTestCase.tearDown(self)
+
+    def testMissingLanguageFile(self):
+        self.assertEqual(keymaps.defaultKeymap(), ("us", ""))
+        self.assertEqual(keymaps.defaultKeymap(), ("us", ""))
+        self.assertEqual(len(self.builds), 1)
+
+        # Until the file appears
+        self.writeFile(consts.language_file, "tr\n")
+        self.assertEqual(keymaps.defaultKeymap(), ("tr", "f"))
+        self.assertEqual(len(self.builds), 2)
+
+    def testLanguageFile(self):
+        self.writeFile(consts.language_file, "tr\n")
+        self.assertEqual(keymaps.defaultKeymap(), ("tr", "f"))
+        self.assertEqual(keymaps.defaultKeymap(), ("tr", "f"))
+        self.assertEqual(len(self.builds), 1)
+
+class CatalogueTest(ZorgTestCase):
+    def writeSymbols(self):
+        for name, data in (("tr", trSymbols), ("us", usSymbols),
+                           ("pc", modifierMap)):
+            self.writeFile(os.path.join(consts.xkb_symbols_dir, name), data)
+        os.mkdir(os.path.join(consts.xkb_symbols_dir, "sun_vndr"))
+
+    def testRules(self):
+        self.writeFile(os.path.join(consts.xkb_rules_dir, "base.lst"), baseList)
+        index = parseRules(os.path.join(consts.xkb_rules_dir, "base.lst"))
+
+        self.assertEqual(index["layouts"],
+                         {"us": "English (US)", "tr": "Turkish", "de": "German"})
+        self.assertEqual(index["variants"]["tr"],
+                         [("f", "Turkish (F)"), ("alt", "Turkish (Alt-Q)")])
+        self.assertEqual(index["variants"]["de"], [])
+        self.assertFalse("pc105" in index["layouts"] or "grp" in index["layouts"])
+
+        self.assertEqual(parseRules(self.path("missing.lst")),
+                         {"layouts": {}, "variants": {}})
+
+    def testSymbols(self):
+        self.writeSymbols()
+        index = parseSymbols(consts.xkb_symbols_dir)
+
+        self.assertEqual(index["layouts"], {"tr": "Turkish", "us": "English (US)"})
+        self.assertEqual(index["variants"], {"tr": [("f", "Turkish (F)")],
+                                             "us": []})
+
+    def testSymbolsFallback(self):
+        self.writeSymbols()
+        self.assertEqual(getCatalogue().layouts(), ["tr", "us"])
+
+        # The rules listing is preferred once it is there
+        self.writeFile(os.path.join(consts.xkb_rules_dir, "evdev.lst"), baseList)
+        self.assertEqual(getCatalogue().layouts(), ["de", "tr", "us"])
+
+    def testNoData(self):
+        self.assertEqual(len(getCatalogue()), 0)
+        self.assertFalse(getCatalogue().isValid("us"))
+
+    def testLookups(self):
+        self.writeFile(os.path.join(consts.xkb_rules_dir, "base.lst"), baseList)
+        catalogue = getCatalogue()
+
+        self.assertTrue(getCatalogue() is catalogue)
+        self.assertEqual(len(catalogue), 3)
+
+        self.assertTrue(catalogue.isValid("tr"))
+        self.assertTrue(catalogue.isValid("tr", "f"))
+        self.assertFalse(catalogue.isValid("tr", "intl"))
+        self.assertFalse(catalogue.isValid("xx"))
+
+        self.assertEqual(catalogue.variants("us"),
+                         [("intl", "English (US, intl., with dead keys)")])
+        self.assertEqual(catalogue.variants("xx"), [])
+        self.assertEqual(catalogue.description("tr"), "Turkish")
+        self.assertEqual(catalogue.description("tr", "alt"), "Turkish (Alt-Q)")
+        self.assertEqual(catalogue.description("tr", "xx"), None)
+
+    def testDaemonValidation(self):
+        from zorg.daemon import handle, RequestError
+
+        self.writeFile(os.path.join(consts.xkb_rules_dir, "base.lst"), baseList)
+
+        try:
+            handle("setKeymap", ("tr", "intl"))
+        except RequestError, e:
+            message = str(e)
+        else:
+            self.fail("Invalid variant accepted")
+
+        self.assertTrue(message.startswith("Unknown variant 'intl' of layout 'tr'"))
+        self.assertTrue("Turkish (Alt-Q)" in message)
+
+        self.assertRaises(RequestError, handle, "setKeymap", ("xx",))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from common import fixtures, ZorgTestCase
+
+from zorg import cache, consts, hwdata, monitorsdb
+from zorg.monitorsdb import MonitorDB, MonitorList, buildMonitorsDB, \
+                            getMonitorDB
+
+monitors = """\
+# Test MonitorsDB
+Generic LCD Display; LCD Panel 1024x768; 0; 31.5-48.5; 56.0-65.0
+Acer; AL1716; ACR0018; 30-83; 56-75; 1
+Acer; P193W; acr0ac7; 31-81; 56-76
+Samsung; SyncMaster 710N; SAM0108; 30-81; 56-75; 1
+Acer; X233H; ACR00F2; 31-83; 56-76; 1
+broken line
+"""
+
+class MonitorDBTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+        self.writeFile(consts.monitors_file, monitors)
+        self.db = MonitorDB(buildMonitorsDB(consts.monitors_file))
+
+    def testRecords(self):
+        self.assertEqual(len(self.db), 5)
+        self.assertEqual(self.db.vendors(),
+                         ["Generic LCD Display", "Acer", "Samsung"])
+        self.assertEqual(self.db.stamp, cache.sourceStamp(consts.monitors_file))
+
+        # The missing DPMS field defaults to 0
+        self.assertEqual(self.db.byVendor("Acer")[1],
+                         {"model": "P193W", "eisa_id": "acr0ac7",
+                          "hsync": "31-81", "vref": "56-76", "is_dpms": "0"})
+
+    def testByVendor(self):
+        models = self.db.byVendor("Acer")
+        self.assertTrue(isinstance(models, MonitorList))
+        self.assertEqual([x["model"] for x in models],
+                         ["AL1716", "P193W", "X233H"])
+        self.assertEqual([x["model"] for x in models[1:]], ["P193W", "X233H"])
+        self.assertEqual(len(self.db.byVendor("Nobody")), 0)
+
+    def testByEisa(self):
+        self.assertEqual([x["model"] for x in self.db.byEisa("acr0018")],
+                         ["AL1716"])
+        self.assertEqual([x["model"] for x in self.db.byEisa("ACR0AC7")],
+                         ["P193W"])
+        self.assertEqual(self.db.byEisa("0"), [])
+
+        monitor = self.db.findEisa("sam0108")
+        self.assertEqual((monitor["vendor"], monitor["model"]),
+                         ("Samsung", "SyncMaster 710N"))
+        self.assertEqual(self.db.findEisa("XXX0000"), None)
+
+    def testSearchModel(self):
+        def models(prefix):
+            return [x["model"] for x in self.db.searchModel(prefix)]
+
+        self.assertEqual(models("a"), ["AL1716"])
+        self.assertEqual(models("Sy"), ["SyncMaster 710N"])
+        self.assertEqual(models("p193"), ["P193W"])
+        self.assertEqual(models("P194"), [])
+
+    def testEditableCopies(self):
+        models = self.db.byVendor("Acer")
+        models[0]["model"] = "Edited"
+        self.assertEqual(models[0]["model"], "AL1716")
+
+        edited = list(models)
+        edited.sort(key=lambda x: x["model"], reverse=True)
+        self.assertEqual(edited[0]["model"], "X233H")
+
+class GetMonitorDBTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+        monitorsdb._db.clear()
+        hwdata._monitorInfos = None
+        self.writeFile(consts.monitors_file, monitors)
+
+    def testCompiledFile(self):
+        db = getMonitorDB()
+        self.assertTrue(getMonitorDB() is db)
+
+        path = cache.cacheFile("MonitorsDB", consts.monitors_file)
+        self.assertTrue(os.path.exists(path))
+
+        # Opened again from the compiled file
+        monitorsdb._db.clear()
+        self.assertEqual([x["model"] for x in getMonitorDB().byVendor("Samsung")],
+                         ["SyncMaster 710N"])
+
+    def testRebuiltOnChange(self):
+        db = getMonitorDB()
+        fixtures.writeLines(consts.monitors_file,
+                            [monitors, "Dell; 1905FP; DEL3010; 31-80; 56-76; 1\n"])
+
+        self.assertFalse(getMonitorDB() is db)
+        self.assertEqual(getMonitorDB().vendors()[-1], "Dell")
+
+    def testUnwritableCache(self):
+        os.rmdir(consts.cache_dir)
+        self.writeFile(consts.cache_dir, "not a directory\n")
+
+        self.assertEqual(len(getMonitorDB()), 5)
+
+    def testMonitorInfosLazy(self):
+        decoded = []
+        monitor = MonitorDB.monitor
+
+        def counting(db, n):
+            decoded.append(n)
+            return monitor(db, n)
+
+        MonitorDB.monitor = counting
+        try:
+            genericList, vendorList = hwdata.getMonitorInfos()
+            self.assertEqual(sorted(vendorList), ["Acer", "Samsung"])
+            self.assertEqual(decoded, [])
+
+            self.assertEqual(vendorList["Acer"][2]["model"], "X233H")
+            self.assertEqual(len(decoded), 1)
+        finally:
+            MonitorDB.monitor = monitor
+
+        # Kept while MonitorsDB is unchanged
+        vendorList["Acer"] = []
+        self.assertEqual(len(hwdata.getMonitorInfos()[1]["Acer"]), 3)
+        self.assertTrue(hwdata.getMonitorInfos()[0]["Generic LCD Display"]
+                            is genericList["Generic LCD Display"])
+
+if __name__ == "__main__":
+    unittest.main()
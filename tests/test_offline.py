@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import unittest
+
+from common import fixtures, ZorgTestCase, needsPiksemel
+
+from zorg import consts, offline
+
+shippedConf = """\
+# Shipped with the image
+Section "InputClass"
+    Identifier  "Touchpad"
+EndSection
+"""
+
+def makeProfile(name="sku-1"):
+    return {
+        "name":     name,
+        "keymap":   ["tr", "f"],
+        "driver_infos": {
+            "nvidia": {
+                "alias":        "nvidia",
+                "xorg-module":  "nvidia",
+                "package":      "xorg_video_nvidia",
+                },
+            },
+        "cards":    [{
+            "bus_id":       "PCI:1:0:0",
+            "vendor_id":    "10de",
+            "product_id":   "0640",
+            "driver":       "nvidia",
+            "device_options": {"NoLogo": "true"},
+            "outputs":      [{
+                "name":     "DVI-I-1",
+                "mode":     "1680x1050",
+                "edid":     fixtures.makeEDID("ACR", 1, "Acer").encode("hex"),
+                }],
+            }],
+        }
+
+class ProfileNameTest(unittest.TestCase):
+    def testRejected(self):
+        for name in ("", ".", "..", "../etc", "a/b", "/tmp/x", "x..y"):
+            self.assertRaises(ValueError, offline.configureProfiles,
+                              [makeProfile(name)], "/", "/nonexistent")
+
+    def testDuplicate(self):
+        self.assertRaises(ValueError, offline.configureProfiles,
+                          [makeProfile(), makeProfile()], "/", "/nonexistent")
+
+@needsPiksemel
+class ConfigureTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+
+        self.sysroot = self.path("image")
+        self.outdir = self.path("out")
+        self.writeFile(os.path.join(self.sysroot,
+                                    consts.xorg_conf_file.lstrip("/")),
+                       shippedConf)
+
+        # Nothing may be asked from COMAR
+        def link():
+            raise AssertionError("COMAR was called")
+
+        comar = sys.modules["comar"]
+        self.savedLink = comar.Link
+        comar.Link = link
+
+    def tearDown(self):
+        sys.modules["comar"].Link = self.savedLink
+        ZorgTestCase.tearDown(self)
+
+    def testConfigure(self):
+        result = offline.configureProfiles([makeProfile()], self.sysroot,
+                                           self.outdir, jobs=1)[0]
+        self.assertTrue(result["ok"], result.get("error"))
+        self.assertEqual(result["drivers"], [("PCI:1:0:0", "nvidia")])
+
+        target = os.path.join(self.outdir, "sku-1")
+        text = open(os.path.join(target, consts.xorg_conf_file.lstrip("/"))).read()
+        self.assertTrue(text.startswith(shippedConf))
+        self.assertTrue(re.search(r'Driver\s+"nvidia"', text))
+        self.assertTrue(re.search(r'Option\s+"NoLogo" "true"', text))
+        self.assertTrue(re.search(r'ModelName\s+"Acer"', text))
+
+        configured = os.path.join(target, consts.configured_bus_file.lstrip("/"))
+        self.assertEqual(open(configured).read(), "PCI:1:0:0")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import warnings
+
+import common
+
+from zorg.document import XorgDocument
+from zorg.parser import XorgParser, XorgSection, XorgEntry, ParseWarning
+
+strayLines = [
+    'Identifier "Stray"\n',
+    'Section "Device"\n',
+    '    Identifier  "VideoCard"\n',
+    'EndSection\n',
+    'EndSection\n',
+    'Section "Screen"\n',
+    '    Identifier  "Screen"\n',
+    ]
+
+class SectionIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.section = XorgSection("Device")
+        self.section.set("Identifier", "VideoCard")
+        self.section.set("Driver", "vesa")
+
+    def testInsert(self):
+        self.section.entries.insert(0, XorgEntry('BusID "PCI:1:0:0"'))
+        self.assertEqual(self.section.get("Identifier"), "VideoCard")
+        self.assertEqual(self.section.get("BusID"), "PCI:1:0:0")
+        self.assertEqual(len(self.section.getEntries("Driver")), 1)
+
+    def testDeleteAndAppend(self):
+        del self.section.entries[0]
+        self.section.entries.append(XorgEntry('BusID "PCI:1:0:0"'))
+        self.assertEqual(self.section.get("Identifier"), None)
+        self.assertEqual(self.section.get("BusID"), "PCI:1:0:0")
+
+    def testReplace(self):
+        self.section.entries[1] = XorgEntry('Driver "nv"')
+        self.assertEqual(self.section.get("Driver"), "nv")
+
+        self.section.entries[:] = []
+        self.assertEqual(self.section.get("Driver"), None)
+
+    def testCaseInsensitive(self):
+        self.assertEqual(self.section.get("DRIVER"), "vesa")
+
+    def testRemove(self):
+        self.section.remove("driver")
+        self.assertEqual(self.section.get("Driver"), None)
+        self.assertEqual(self.section.get("Identifier"), "VideoCard")
+
+class StrayLinesTest(unittest.TestCase):
+    def parse(self, parser):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            parser.parse(strayLines, "xorg.conf")
+        return [str(x.message) for x in caught
+                    if issubclass(x.category, ParseWarning)]
+
+    def testParser(self):
+        parser = XorgParser()
+        messages = self.parse(parser)
+
+        self.assertEqual([x.name for x in parser.sections], ["Device", "Screen"])
+        self.assertEqual(messages[0], "xorg.conf:1:1: Identifier outside of a section")
+        self.assertEqual(messages[1], "xorg.conf:5:1: EndSection outside of a section")
+
+    def testDocumentKeepsLines(self):
+        doc = XorgDocument()
+        messages = self.parse(doc)
+
+        self.assertEqual(len(messages), 3)
+        self.assertTrue(doc.toString().startswith("".join(strayLines)))
+        self.assertTrue(doc.toString().endswith("EndSection\n"))
+        self.assertEqual(doc.findSection("Screen", "Screen").get("Identifier"),
+                         "Screen")
+
+if __name__ == "__main__":
+    unittest.main()
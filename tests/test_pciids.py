@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from common import fixtures, ZorgTestCase
+
+from zorg import consts
+from zorg.pciids import buildIndex, getPciIds, unknownCompany, unknownModel
+from zorg.utils import idsQuery
+
+pciIds = """\
+# Test pci.ids
+#
+1002  ATI Technologies Inc
+\t5159  Radeon RV100 QY [Radeon 7000/VE]
+\t\t1002 013a  Radeon 7000
+\t\t174b 7c28  VE Radeon 7000
+
+# A comment between vendors
+10de  NVIDIA Corporation
+\t0020  NV4 [RIVA TNT]
+\t\t1043 0200  V3400 TNT
+8086  Intel Corporation
+\t2562  82845G/GL[Brookdale-G]/GE Chipset Integrated Graphics Device
+
+# List of known device classes
+C 02  Network controller
+\t00  Ethernet controller
+C 03  Display controller
+\t00  VGA compatible controller
+\t\t00  VGA controller
+\t\t01  8514 controller
+\t80  Display controller
+"""
+
+class PciIdsTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+        self.writeFile(consts.pci_ids_file, pciIds)
+        self.ids = getPciIds()
+
+    def testIndex(self):
+        index = buildIndex(consts.pci_ids_file)
+        self.assertEqual(sorted(index["vendors"]), ["1002", "10de", "8086"])
+        self.assertEqual(sorted(index["classes"]), ["02", "03"])
+
+        data = open(consts.pci_ids_file).read()
+        self.assertTrue(data[index["vendors"]["10de"]:].startswith("10de  NVIDIA"))
+
+        self.assertEqual(buildIndex(self.path("nonexistent")),
+                         {"vendors": {}, "classes": {}})
+
+    def testVendorAndDevice(self):
+        self.assertEqual(self.ids.query("10DE", "0x0020"),
+                         ("NVIDIA Corporation", "NV4 [RIVA TNT]"))
+        self.assertEqual(self.ids.query("8086", "2562")[1],
+                         "82845G/GL[Brookdale-G]/GE Chipset Integrated Graphics Device")
+        self.assertEqual(idsQuery("1002", "5159"),
+                         ("ATI Technologies Inc", "Radeon RV100 QY [Radeon 7000/VE]"))
+
+    def testUnknown(self):
+        self.assertEqual(self.ids.query("10de", "ffff"),
+                         ("NVIDIA Corporation", unknownModel))
+        self.assertEqual(self.ids.query("abcd", "0001"),
+                         (unknownCompany, unknownModel))
+
+    def testSubsystem(self):
+        self.assertEqual(self.ids.query("1002", "5159", "174B", "7C28")[1],
+                         "VE Radeon 7000")
+        self.assertEqual(self.ids.query("1002", "5159", "1002", "ffff")[1],
+                         "Radeon RV100 QY [Radeon 7000/VE]")
+
+    def testQueryMany(self):
+        keys = [("10de", "0020"), ("1002", "5159", "1002", "013a")]
+        result = self.ids.queryMany(keys)
+        self.assertEqual(result[keys[0]][1], "NV4 [RIVA TNT]")
+        self.assertEqual(result[keys[1]][1], "Radeon 7000")
+
+    def testClassName(self):
+        self.assertEqual(self.ids.className("0x030000"),
+                         ("Display controller", "VGA compatible controller",
+                          "VGA controller"))
+        self.assertEqual(self.ids.className("0380"),
+                         ("Display controller", "Display controller", ""))
+        self.assertEqual(self.ids.className("0x0302"),
+                         ("Display controller", "", ""))
+        self.assertEqual(self.ids.className("0x0c0300"), ("", "", ""))
+
+    def testRebuiltOnChange(self):
+        self.assertTrue(getPciIds() is self.ids)
+
+        fixtures.writeLines(consts.pci_ids_file,
+                            [pciIds, "1af4  Red Hat, Inc.\n",
+                             "\t1050  Virtio GPU\n"])
+
+        ids = getPciIds()
+        self.assertFalse(ids is self.ids)
+        self.assertEqual(ids.query("1af4", "1050"),
+                         ("Red Hat, Inc.", "Virtio GPU"))
+
+if __name__ == "__main__":
+    unittest.main()
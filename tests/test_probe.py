@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from common import fixtures, ZorgTestCase, needsPiksemel
+
+from zorg import consts
+from zorg.edid import parseEDID, readEDID
+from zorg.probe import VideoDevice, Monitor, Output, probeMonitors, \
+                       scanVideoDevices, getPrimaryCard, enabledPackage
+from zorg.state import deviceData, deviceFromData
+
+class EDIDTest(unittest.TestCase):
+    def testDecode(self):
+        edid = parseEDID(fixtures.makeEDID("ACR", 0x1234, "Acer P193W",
+                                           hsync=(31, 81), vref=(56, 76)))
+        self.assertEqual(edid.vendor, "ACR")
+        self.assertEqual(edid.eisa_id, "ACR1234")
+        self.assertEqual(edid.name, "Acer P193W")
+        self.assertEqual(edid.hsync, "31-81")
+        self.assertEqual(edid.vref, "56-76")
+
+    def testInvalid(self):
+        self.assertEqual(parseEDID(""), None)
+        self.assertEqual(parseEDID("\x00" * 128), None)
+        self.assertEqual(readEDID("/nonexistent/edid"), None)
+
+class ScanTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+
+        self.cards = fixtures.makeSysfs(self.path("sys"), 3, others=20)
+        self.devicesDir = self.path("sys/bus/pci/devices")
+
+    def write(self, name, attr, data):
+        self.writeFile(os.path.join(self.devicesDir, name, attr), data)
+
+    def testDisplayDevices(self):
+        devices = scanVideoDevices(self.path("sys"))
+        self.assertEqual([x.sys_name for x in devices], self.cards)
+
+        device = devices[0]
+        vendor = open(os.path.join(self.devicesDir, self.cards[0],
+                                   "vendor")).read()
+        self.assertEqual(device.vendor_id, vendor.strip()[2:])
+        self.assertEqual(device.class_id, "030000")
+        self.assertEqual(device.bus_id, "PCI:0:0:0")
+
+        # The default root is the module's sysdir
+        self.assertEqual([x.sys_name for x in scanVideoDevices()], self.cards)
+
+    def testOtherDisplayClasses(self):
+        self.write("0000:00:01.0", "class", "0x038000\n")
+        names = [x.sys_name for x in scanVideoDevices(self.path("sys"))]
+        self.assertEqual(names, sorted(self.cards + ["0000:00:01.0"]))
+
+    def testUnreadableDevice(self):
+        os.unlink(os.path.join(self.devicesDir, self.cards[1], "vendor"))
+        names = [x.sys_name for x in scanVideoDevices(self.path("sys"))]
+        self.assertEqual(names, [self.cards[0], self.cards[2]])
+
+    def testNoSysfs(self):
+        self.assertEqual(scanVideoDevices(self.path("nonexistent")), [])
+        self.assertEqual(getPrimaryCard(self.path("nonexistent")), None)
+
+    def testEnabledPackage(self):
+        self.assertEqual(enabledPackage(), None)
+
+        self.writeFile(consts.enabled_package_file, "xorg-video-nvidia-current")
+        self.assertEqual(enabledPackage(), "xorg-video-nvidia-current")
+
+    def testPrimaryCard(self):
+        self.assertEqual(getPrimaryCard(self.path("sys")), self.cards[0])
+
+        self.write(self.cards[0], "boot_vga", "0\n")
+        self.write(self.cards[2], "boot_vga", "1\n")
+        self.assertEqual(getPrimaryCard(self.path("sys")), self.cards[2])
+
+        self.write(self.cards[2], "boot_vga", "0\n")
+        self.assertEqual(getPrimaryCard(self.path("sys")), None)
+
+class MonitorProbeTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+
+        self.cards = fixtures.makeSysfs(self.path("sys"), 2, others=6,
+                                        outputs=("VGA-1", "DVI-I-1"))
+        # Only the monitor of the second card is in the database
+        self.writeFile(consts.monitors_file,
+                       "Acer; Acer Known; ACR0001; 31.0-80.0; 56.0-76.0; 1\n")
+
+    def testConnectorsOfCard(self):
+        monitors = probeMonitors(self.cards[0])
+        self.assertEqual(sorted(monitors), ["DVI-I-1", "VGA-1"])
+
+        mon = monitors["VGA-1"]
+        self.assertEqual(mon.eisa_id, "ACR0000")
+        self.assertEqual(mon.model, "Monitor 0")
+        self.assertEqual((mon.hsync, mon.vref), ("30-83", "56-75"))
+
+    def testMonitorsDBMatch(self):
+        mon = probeMonitors(self.cards[1])["VGA-1"]
+        self.assertEqual((mon.vendor, mon.model), ("Acer", "Acer Known"))
+        self.assertEqual((mon.hsync, mon.vref), ("31.0-80.0", "56.0-76.0"))
+
+    def testNoDRM(self):
+        self.assertEqual(probeMonitors(self.cards[0],
+                                       self.path("nonexistent")), {})
+
+    def testDefaultOutputOnly(self):
+        device = VideoDevice(deviceDir=self.cards[0])
+        detected = device.probeMonitors()
+
+        self.assertEqual(sorted(detected), ["DVI-I-1", "VGA-1"])
+        self.assertEqual(sorted(device.monitors), ["default"])
+        self.assertTrue(device.monitors["default"] is detected["DVI-I-1"])
+
+    def testUserMonitorKept(self):
+        device = VideoDevice(deviceDir=self.cards[0])
+
+        picked = Monitor()
+        picked.model = "Picked by hand"
+        device.monitors["default"] = picked
+
+        device.probeMonitors()
+        self.assertTrue(device.monitors["default"] is picked)
+
+        stale = Monitor()
+        stale.eisa_id = "XYZ0001"
+        device.monitors["default"] = stale
+
+        device.probeMonitors()
+        self.assertEqual(device.monitors["default"].eisa_id, "ACR0000")
+
+    def testEisaIdSaved(self):
+        device = VideoDevice(deviceDir=self.cards[0])
+        device.outputs["default"] = Output("default")
+        device.probeMonitors()
+
+        data = deviceData(device)
+        self.assertEqual(data["outputs"][0]["monitor"]["eisa_id"], "ACR0000")
+
+        other = VideoDevice(deviceDir=self.cards[0])
+        deviceFromData(device.bus_id, data, other)
+        self.assertEqual(other.monitors["default"].eisa_id, "ACR0000")
+
+    @needsPiksemel
+    def testInitialConfigUsesEDID(self):
+        from zorg.config import probeDevices, buildXorgConfig
+
+        cards = probeDevices(self.path("sys"))
+        self.assertEqual([x.sys_name for x in cards], self.cards)
+        self.assertTrue("default" in cards[0].outputs)
+
+        text = buildXorgConfig(cards[:1], jail=False).toString()
+        self.assertTrue("HorizSync" in text and "30-83" in text)
+        self.assertTrue("31.5-50" not in text)
+
+@needsPiksemel
+class ConfiguredDevicesTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+
+        self.cards = fixtures.makeSysfs(self.path("sys"), 2, others=6,
+                                        outputs=("VGA-1",))
+        self.devicesDir = self.path("sys/bus/pci/devices")
+
+    def addFunction(self, name, classId, bootVga="0"):
+        for attr, value in (("class", classId), ("vendor", "0x10de"),
+                            ("device", "0x0dfc"), ("boot_vga", bootVga)):
+            self.writeFile(os.path.join(self.devicesDir, name, attr),
+                           value + "\n")
+
+    def busIds(self):
+        from zorg.config import probeDevices
+
+        return [x.bus_id for x in probeDevices(self.path("sys"))]
+
+    def testSecondaryFunction(self):
+        self.addFunction("0000:00:00.1", "0x038000")
+        self.addFunction("0000:00:1f.0", "0x030200")
+
+        self.assertEqual(self.busIds(), ["PCI:0:0:0", "PCI:0:4:0"])
+
+    def testWithoutMonitors(self):
+        # The second card drives no monitor, like a hybrid laptop GPU
+        os.unlink(os.path.join(self.path("sys/class/drm"), "card1-VGA-1", "edid"))
+        self.assertEqual(self.busIds(), ["PCI:0:0:0"])
+
+    def testOnlyOtherClasses(self):
+        for name in self.cards:
+            self.writeFile(os.path.join(self.devicesDir, name, "class"),
+                           "0x030200\n")
+
+        self.assertEqual(self.busIds(), ["PCI:0:0:0", "PCI:0:4:0"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from common import fixtures, ZorgTestCase, needsPiksemel
+
+from zorg import consts
+from zorg.probe import VideoDevice
+from zorg.state import State, readXML, readJSON, jsonString
+from zorg.utils import fileStamp
+
+configXML = """\
+<ZORG>
+    <Card busId="PCI:0:0:0">
+        <VendorId>10de</VendorId>
+        <ProductId>0640</ProductId>
+        <Driver>nv</Driver>
+        <Tuning level="2">quiet</Tuning>
+    </Card>
+    <Touchscreen calibrated="yes">
+        <Matrix>1 0 0</Matrix>
+    </Touchscreen>
+</ZORG>
+"""
+
+class SidecarTest(ZorgTestCase):
+    def testSections(self):
+        state = State()
+        state.sections = [("Device", "VideoCard"), ("Screen", "Screen")]
+        state.sectionKeys = {
+                ("Device", "VideoCard"): (("driver", "identifier"), ("twinview",)),
+                ("Screen", "Screen"): (("device", "identifier"), ()),
+                }
+        self.writeFile(consts.state_file, jsonString(state, (1.0, 10)))
+
+        loaded = readJSON(consts.state_file, (1.0, 10))
+        self.assertEqual(loaded.sections, state.sections)
+        self.assertEqual(loaded.sectionKeys, state.sectionKeys)
+
+@needsPiksemel
+class UnknownTagsTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+        self.writeFile(consts.config_file, configXML)
+        self.cards = fixtures.makeSysfs(self.path("sys"), 1, others=1)
+
+    def checkKept(self, state):
+        self.assertEqual(len(state.extra), 1)
+        self.assertTrue('calibrated="yes"' in state.extra[0])
+        self.assertTrue("<Matrix>1 0 0</Matrix>" in state.extra[0])
+
+        extra = state.cards["PCI:0:0:0"]["extra"]
+        self.assertEqual(len(extra), 1)
+        self.assertTrue('<Tuning level="2">quiet</Tuning>' in extra[0])
+
+    def testRead(self):
+        self.checkKept(readXML(consts.config_file))
+
+    def testSaveKeeps(self):
+        from zorg.config import ConfigStore
+
+        card = VideoDevice(deviceDir=self.cards[0])
+        card.driver = "nouveau"
+
+        store = ConfigStore()
+        store.setDevice(card)
+        store.setKeymap("tr", "f")
+
+        state = readXML(consts.config_file)
+        self.checkKept(state)
+        self.assertEqual(state.cards["PCI:0:0:0"]["driver"], "nouveau")
+        self.assertEqual(state.keyboard, ("tr", "f"))
+
+        self.checkKept(readJSON(consts.state_file, fileStamp(consts.config_file)))
+
+@needsPiksemel
+class StaleSidecarTest(ZorgTestCase):
+    def testMissingXML(self):
+        from zorg.config import ConfigStore
+
+        ConfigStore().setKeymap("tr", "f")
+        self.assertEqual(ConfigStore().getKeymap(), ("tr", "f"))
+
+        os.unlink(consts.config_file)
+        self.assertEqual(readJSON(consts.state_file, None), None)
+        self.assertEqual(ConfigStore().getKeymap(), (None, ""))
+
+    def testChangedXML(self):
+        from zorg.config import ConfigStore
+
+        ConfigStore().setKeymap("tr", "f")
+        fixtures.writeLines(consts.config_file,
+                            ["<ZORG><Keyboard><Layout>de</Layout></Keyboard></ZORG>\n"])
+        self.assertEqual(ConfigStore().getKeymap(), ("de", ""))
+
+if __name__ == "__main__":
+    unittest.main()
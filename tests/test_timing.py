@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from common import ZorgTestCase
+
+from zorg import consts, timing
+from zorg.timing import stage, timed
+
+@timed("test.inner")
+def inner():
+    pass
+
+@timed("test.outer")
+def outer(calls):
+    for n in range(calls):
+        inner()
+    return calls
+
+class TimingTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+
+        self.saved = (timing._enabled, timing._started, timing.cmdlineFile,
+                      os.environ.get(timing.envVariable))
+        os.environ.pop(timing.envVariable, None)
+        timing.cmdlineFile = self.path("cmdline")
+        timing._enabled = None
+        timing.reset()
+
+    def tearDown(self):
+        timing._enabled, timing._started, timing.cmdlineFile, env = self.saved
+        if env is None:
+            os.environ.pop(timing.envVariable, None)
+        else:
+            os.environ[timing.envVariable] = env
+        timing.reset()
+
+        ZorgTestCase.tearDown(self)
+
+    def testDisabled(self):
+        self.writeFile(timing.cmdlineFile, "root=/dev/sda1 xorg=nojail\n")
+
+        self.assertEqual(outer(2), 2)
+        self.assertFalse(timing.isEnabled())
+        self.assertEqual(timing.report()["stages"], {})
+        self.assertFalse(timing.saveReport())
+        self.assertFalse(os.path.exists(consts.profile_file))
+
+    def testEnvironment(self):
+        os.environ[timing.envVariable] = "0"
+        self.assertFalse(timing._detect())
+
+        os.environ[timing.envVariable] = "1"
+        self.assertTrue(timing._detect())
+
+    def testKernelOption(self):
+        self.assertFalse(timing._detect())
+
+        self.writeFile(timing.cmdlineFile, "quiet xorg=nojail,profile\n")
+        self.assertTrue(timing._detect())
+
+        self.writeFile(timing.cmdlineFile, "quiet xorgprofile=1 mudur=profile\n")
+        self.assertFalse(timing._detect())
+
+    def testNesting(self):
+        timing.enable(save=False)
+
+        with stage("test.stage"):
+            outer(3)
+
+        stages = timing.report()["stages"]
+        self.assertEqual(stages["test.stage"]["calls"], 1)
+        self.assertEqual(stages["test.outer"]["calls"], 1)
+        self.assertEqual(stages["test.inner"]["calls"], 3)
+
+        # Nested stages are included in the outer ones
+        self.assertTrue(stages["test.stage"]["total"] >=
+                            stages["test.outer"]["total"] >=
+                            stages["test.inner"]["total"])
+        self.assertTrue(stages["test.inner"]["max"] <=
+                            stages["test.inner"]["total"])
+
+        outer(1)
+        self.assertEqual(timing.report()["stages"]["test.inner"]["calls"], 4)
+
+    def testException(self):
+        timing.enable(save=False)
+
+        def failing():
+            with stage("test.failing"):
+                raise ValueError("failed")
+
+        self.assertRaises(ValueError, failing)
+        self.assertEqual(timing.report()["stages"]["test.failing"]["calls"], 1)
+
+    def testSaveAndFormat(self):
+        timing.enable(save=False)
+        timing.record("test.inner", 0.001)
+        timing.record("test.inner", 0.003)
+        timing.record("test.outer", 0.005)
+
+        self.assertTrue(timing.saveReport())
+        data = timing.loadReport()
+        self.assertEqual(data["version"], timing.REPORT_VERSION)
+        self.assertEqual(data["pid"], os.getpid())
+        self.assertEqual(data["stages"]["test.inner"],
+                         {"calls": 2, "total": 0.004, "max": 0.003})
+
+        lines = timing.formatReport(data).splitlines()
+        self.assertTrue(lines[0].startswith("Command: "))
+        self.assertTrue(lines[2].startswith("Wall time: "))
+        self.assertEqual(lines[3].split(), ["Stage", "Calls", "Total", "ms",
+                                            "Max", "ms"])
+
+        # Sorted by total time, the outer stage first
+        self.assertEqual([x.split() for x in lines[4:]],
+                         [["test.outer", "1", "5.00", "5.00"],
+                          ["test.inner", "2", "4.00", "3.00"]])
+
+    def testUnwritableProfile(self):
+        timing.enable(save=False)
+        outer(1)
+
+        self.writeFile(self.path("file"), "")
+        self.assertFalse(timing.saveReport(self.path("file", "profile.json")))
+        self.assertEqual(timing.loadReport(self.path("missing.json")), None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from common import fixtures, ZorgTestCase
+
+from zorg import utils
+from zorg.utils import writeFile, backup
+
+class WriteFileTest(ZorgTestCase):
+    def setUp(self):
+        ZorgTestCase.setUp(self)
+        self.target = self.path("etc/X11/xorg.conf")
+        self.writeFile(self.target, "old\n")
+
+    def testSameDataNotWritten(self):
+        # No stored hash, the data on disk is compared
+        inode = os.stat(self.target).st_ino
+        self.assertFalse(writeFile(self.target, "old\n", keepBackup=True))
+        self.assertEqual(os.stat(self.target).st_ino, inode)
+        self.assertFalse(os.path.exists(self.target + "-backup"))
+
+        # And the hash is stored for the next time
+        self.assertTrue(self.target in utils.loadHashes())
+        self.assertFalse(writeFile(self.target, "old\n"))
+
+    def testChangedBehindHash(self):
+        self.assertTrue(writeFile(self.target, "new\n"))
+        fixtures.writeLines(self.target, ["edited\n"])
+
+        self.assertTrue(writeFile(self.target, "new\n", keepBackup=True))
+        self.assertEqual(open(self.target).read(), "new\n")
+        self.assertEqual(open(self.target + "-backup").read(), "edited\n")
+
+    def testPrefixIsNotSame(self):
+        self.assertTrue(writeFile(self.target, "old"))
+        self.assertEqual(open(self.target).read(), "old")
+
+class BackupTest(ZorgTestCase):
+    def testCopyWithoutLinks(self):
+        target = self.path("xorg.conf")
+        self.writeFile(target, "current\n")
+
+        def link(src, dst):
+            raise OSError("links are not supported")
+
+        saved = os.link
+        os.link = link
+        try:
+            backup(target)
+        finally:
+            os.link = saved
+
+        self.assertEqual(open(target).read(), "current\n")
+        self.assertEqual(open(target + "-backup").read(), "current\n")
+        self.assertFalse(os.path.exists(target + "-backup.tmp"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import os
+import zlib
+import marshal
+
+from zorg import consts
+
+# Bump this when the layout of any cached object changes
+CACHE_VERSION = 1
+
+_memory = {}
+
+def sourceStamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+def cacheFile(name, source, cacheDir=None):
+    if cacheDir is None:
+        cacheDir = consts.cache_dir
+    crc = zlib.crc32(source) & 0xffffffff
+    return os.path.join(cacheDir, "%s.%08x" % (name, crc))
+
+def readCache(path, stamp):
+    try:
+        f = open(path, "rb")
+        try:
+            version, savedStamp, data = marshal.load(f)
+        finally:
+            f.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+
+    if (version, savedStamp) != (CACHE_VERSION, stamp):
+        return None
+
+    return data
+
+def storeFile(path, data):
+    """Atomically replace path with data. Returns False on failure."""
+
+    tmp = "%s.%d" % (path, os.getpid())
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, 0755)
+        f = open(tmp, "wb")
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        return False
+
+    return True
+
+def writeCache(path, stamp, data):
+    return storeFile(path, marshal.dumps((CACHE_VERSION, stamp, data)))
+
+def cached(name, source, build, extra=None):
+    """
+        Return build(source), reusing a previous result while the
+        source file is unchanged.
+
+        Results are kept in memory for the lifetime of the process and
+        marshalled under consts.cache_dir, keyed on the mtime and size
+        of the source. If the cache directory is not writable, the
+        result is only kept in memory. The result for a missing source
+        is kept in memory too, until the source appears.
+
+        extra is a marshallable stamp of the other inputs of build.
+        If it is given, the result is also built again when it changes.
+    """
+
+    stamp = sourceStamp(source)
+    found = stamp is not None
+    if extra is not None:
+        stamp = (stamp, extra)
+    key = (name, source)
+
+    entry = _memory.get(key)
+    if entry and entry[0] == stamp:
+        return entry[1]
+
+    data = None
+    if found:
+        path = cacheFile(name, source)
+        data = readCache(path, stamp)
+
+    if data is None:
+        data = build(source)
+        if found:
+            writeCache(path, stamp, data)
+
+    _memory[key] = (stamp, data)
+    return data
+
+def invalidate(name=None):
+    for key in _memory.keys():
+        if name is None or key[0] == name:
+            del _memory[key]
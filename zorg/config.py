@@ -1,52 +1,64 @@
 # -*- coding: utf-8 -*-
 
 import os
-import dbus
 
-import comar
-import piksemel
+from contextlib import contextmanager
 
 from zorg import consts
+from zorg.document import XorgDocument
+from zorg.fingerprint import saveFingerprint, isUpToDate
+from zorg.keymaps import defaultKeymap
 from zorg.parser import *
-from zorg.probe import VideoDevice, Monitor, Output
+from zorg.driverinfo import getDriverInfos
+from zorg.probe import VideoDevice, Monitor, Output, scanVideoDevices
+from zorg.state import State, addTag, deviceData, deviceFromData, \
+                       readXML, readJSON, xmlString, jsonString
+from zorg.timing import stage, timed
 from zorg.utils import *
 
-def saveXorgConfig(card):
-    parser = XorgParser()
+@timed("config.cardSections")
+def cardSections(card, suffix=None, deviceOptions=None):
+    """
+        Return the Device and Screen sections and the list of Monitor
+        sections of a card. If suffix is given, it is appended to the
+        identifiers and the BusID is set, so that sections of several
+        cards can be used together.
+
+        deviceOptions is a dict of Device options to add. If it is
+        None, the Xorg.Driver script of the driver is asked for them.
+    """
+
+    if suffix is None:
+        devId = "VideoCard"
+        scrId = "Screen"
+        monId = "Monitor[%s]"
+    else:
+        devId = "VideoCard%s" % suffix
+        scrId = "Screen%s" % suffix
+        monId = "Monitor%s[%%s]" % suffix
 
-    secFlags    = XorgSection("ServerFlags")
     secDevice   = XorgSection("Device")
     secScr      = XorgSection("Screen")
-    secLay      = XorgSection("ServerLayout")
-
-    parser.sections = [
-        secFlags,
-        secDevice,
-        secScr,
-        secLay
-    ]
-
-    if jailEnabled():
-        jailOpts = {
-                "DontVTSwitch" : "true",
-                }
-        secFlags.options.update(jailOpts)
+    monitors    = []
 
     # Device section
-    secDevice.set("Identifier", "VideoCard")
+    secDevice.set("Identifier", devId)
     drvInfo = card.driverInfo()
     if drvInfo:
         secDevice.set("Driver", drvInfo["xorg-module"])
 
+    if suffix is not None:
+        secDevice.set("BusID", card.bus_id)
+
     if card.driver == "fglrx":
         card.depth = 24
 
     # Monitor sections
     for name, output in card.outputs.items():
-        identifier = "Monitor[%s]" % name
+        identifier = monId % name
 
         monSec = XorgSection("Monitor")
-        parser.sections.append(monSec)
+        monitors.append(monSec)
         monSec.set("Identifier", identifier)
 
         if card.monitors.has_key(name):
@@ -81,14 +93,14 @@ def saveXorgConfig(card):
             monSec.options["Below"] = output.below
 
     # Screen section
-    secScr.set("Identifier", "Screen")
-    secScr.set("Device", "VideoCard")
+    secScr.set("Identifier", scrId)
+    secScr.set("Device", devId)
     if card.depth:
         secScr.set("DefaultDepth", card.depth)
 
     if "default" in card.outputs:
         output = card.outputs["default"]
-        secScr.set("Monitor", "Monitor[default]")
+        secScr.set("Monitor", monId % "default")
 
         if output.mode:
             subsec = XorgSection("Display")
@@ -97,224 +109,394 @@ def saveXorgConfig(card):
             subsec.set("Modes", output.mode, "800x600", "640x480")
             secScr.sections = [subsec]
 
-    # Layout section
-    secLay.set("Identifier", "Layout")
-    secLay.set("Screen", "Screen")
-
     # If this driver has an Xorg.Driver script,
     # call its methods to update sections.
     pkg = drvInfo.get("package")
-    if pkg:
+    if deviceOptions is not None:
+        secDevice.options.update(deviceOptions)
+    elif pkg:
+        import comar
+        import dbus
+
         link = comar.Link()
         opts = dbus.Dictionary(secDevice.options, signature="ss")
         try:
-            secDevice.options = link.Xorg.Driver[pkg].getDeviceOptions(
-                                    card.bus_id, opts)
+            with stage("config.getDeviceOptions"):
+                secDevice.options = link.Xorg.Driver[pkg].getDeviceOptions(
+                                        card.bus_id, opts)
         except dbus.DBusException:
             pass
 
-    # Backup and save xorg.conf
-    backup(consts.xorg_conf_file)
+    return secDevice, secScr, monitors
 
-    f = open(consts.xorg_conf_file, "w")
-    f.write(parser.toString())
+@timed("config.buildXorgConfig")
+def buildXorgConfig(cards, jail=None, deviceOptions=None):
+    """
+        Return an XorgParser holding the configuration for the given
+        cards. A single card gets the classic one screen layout. With
+        several cards, every card gets its own Device and Screen with
+        its BusID, and the screens are placed left to right.
 
-    f = open(consts.configured_bus_file, "w")
-    f.write(card.bus_id)
+        If jail is None, it is taken from the kernel options. If
+        deviceOptions is given, it maps bus IDs to the Device options
+        of the cards, and the driver packages are not asked for them.
+    """
 
-def configuredBus():
+    parser = XorgParser()
+
+    secFlags    = XorgSection("ServerFlags")
+    secLay      = XorgSection("ServerLayout")
+
+    if jail is None:
+        jail = jailEnabled()
+
+    if jail:
+        jailOpts = {
+                "DontVTSwitch" : "true",
+                }
+        secFlags.options.update(jailOpts)
+
+    def options(card):
+        if deviceOptions is None:
+            return None
+        return deviceOptions.get(card.bus_id, {})
+
+    if len(cards) == 1:
+        results = [cardSections(cards[0], None, options(cards[0]))]
+    else:
+        # Drivers are resolved once for all cards, then each card is
+        # set up on its own thread.
+        if [x for x in cards if x.driver]:
+            getDriverInfos()
+        results = parallelMap(lambda x: cardSections(*x),
+                              [(card, str(n), options(card))
+                                    for n, card in enumerate(cards)])
+
+    devices = [x[0] for x in results]
+    screens = [x[1] for x in results]
+
+    parser.sections = [secFlags] + devices + screens + [secLay]
+    for x in results:
+        parser.sections.extend(x[2])
+
+    # Layout section
+    secLay.set("Identifier", "Layout")
+    if len(cards) == 1:
+        secLay.set("Screen", "Screen")
+    else:
+        previous = None
+        for n, screen in enumerate(screens):
+            scrId = screen.get("Identifier")
+            if previous is None:
+                secLay.add("Screen", n, scrId, 0, 0)
+            else:
+                secLay.add("Screen", n, scrId, unquoted("RightOf"), previous)
+            previous = scrId
+
+    return parser
+
+def generatedSections(parser):
+    """Return the (name, identifier) of the sections of an XorgParser."""
+
+    return [(x.name, x.get("Identifier")) for x in parser.sections
+                if x.get("Identifier") is not None]
+
+def generatedKeys(parser):
+    """
+        Return a dict mapping the (name, identifier) of the sections of
+        an XorgParser to their (entry keys, option names) in lower case.
+    """
+
+    keys = {}
+    for x in parser.sections:
+        identifier = x.get("Identifier")
+        if identifier is not None:
+            keys[(x.name, identifier)] = (
+                    tuple(sorted(set(e.key.lower() for e in x.entries))),
+                    tuple(sorted(lowerKey(name) for name in x.options)))
+
+    return keys
+
+def writeXorgConfig(parser, cards, keepBackup=True):
+    """
+        Merge the configuration of the cards in parser into xorg.conf
+        and save the bus IDs of the cards and the generated sections.
+    """
+
+    store = getConfigStore()
+
+    # Merge into the existing xorg.conf to keep hand edits, and only
+    # backup and save it if something changed.
+    doc = XorgDocument()
     try:
-        return open(consts.configured_bus_file).read()
-    except IOError:
-        return ""
+        with stage("config.parseXorgConf"):
+            doc.parseFile(consts.xorg_conf_file)
+    except (IOError, ParseError):
+        doc = XorgDocument()
+        doc.parse(parser.generate())
+    else:
+        doc.merge(parser, store.getSections(), store.getSectionKeys())
 
-def addTag(p, name, data):
-    t = p.insertTag(name)
-    t.insertData(data)
+    with stage("config.writeXorgConf"):
+        writeFile(consts.xorg_conf_file, doc.toString(), keepBackup)
+    writeFile(consts.configured_bus_file,
+              "\n".join(x.bus_id for x in cards))
+    store.setSections(generatedSections(parser), generatedKeys(parser))
 
-def getDeviceInfo(busId):
-    if not os.path.exists(consts.config_file):
-        return
-
-    doc = piksemel.parse(consts.config_file)
-
-    cardTag = None
-    for tag in doc.tags("Card"):
-        if tag.getAttribute("busId") == busId:
-            cardTag = tag
-            break
-
-    if not cardTag:
-        return
-
-    device = VideoDevice(busId=busId)
-
-    device.saved_vendor_id  = cardTag.getTagData("VendorId")
-    device.saved_product_id = cardTag.getTagData("ProductId")
-
-    driver = cardTag.getTagData("Driver")
-    activeConfigTag = cardTag.getTag("ActiveConfig")
-
-    if driver:
-        device.driver = driver
-    elif activeConfigTag:
-        driver = activeConfigTag.getTagData("Driver")
-        if driver:
-            device.driver = driver
-
-    depth = cardTag.getTagData("Depth")
-    if depth:
-        device.depth = int(depth)
-
-    def addMonitor(output, tag):
-        mon = Monitor()
-        mon.vendor = tag.getTagData("Vendor") or ""
-        mon.model  = tag.getTagData("Model") or "Unknown Monitor"
-        mon.hsync  = tag.getTagData("HorizSync") or mon.hsync
-        mon.vref   = tag.getTagData("VertRefresh") or mon.vref
-        device.monitors[output] = mon
-
-    # Get output info
-    outputsTag = cardTag.getTag("Outputs")
-    if outputsTag:
-        for outputTag in outputsTag.tags("Output"):
-            name = outputTag.getAttribute("name")
-            output = Output(name)
-            device.outputs[name] = output
-
-            enabled = outputTag.getTagData("Enabled")
-            if enabled:
-                output.setEnabled(enabled == "true")
-            ignored = outputTag.getTagData("Ignored")
-            if ignored:
-                output.setIgnored(ignored == "true")
-
-            mode = outputTag.getTagData("Mode") or ""
-            rate = outputTag.getTagData("RefreshRate") or ""
-            output.setMode(mode, rate)
-
-            rotation = outputTag.getTagData("Rotation")
-            if rotation:
-                output.setOrientation(rotation)
-
-            rightOf = outputTag.getTagData("RightOf")
-            below = outputTag.getTagData("Below")
-            if rightOf:
-                output.setPosition("RightOf", rightOf)
-            elif below:
-                output.setPosition("Below", below)
-
-            monitorTag = outputTag.getTag("Monitor")
-            if monitorTag:
-                addMonitor(name, monitorTag)
-
-    return device
+@timed("config.saveXorgConfig")
+def saveXorgConfig(cards):
+    """Write xorg.conf for a VideoDevice or a list of them."""
 
-def saveDeviceInfo(card):
-    if not os.path.exists(consts.config_dir):
-        os.mkdir(consts.config_dir, 0755)
+    if isinstance(cards, VideoDevice):
+        cards = [cards]
+
+    writeXorgConfig(buildXorgConfig(cards), cards)
 
+    saveFingerprint()
+
+def configuredBuses():
     try:
-        doc = piksemel.parse(consts.config_file)
-    except OSError:
-        doc = piksemel.newDocument("ZORG")
+        return open(consts.configured_bus_file).read().split()
+    except IOError:
+        return []
 
-    for tag in doc.tags("Card"):
-        if tag.getAttribute("busId") == card.bus_id:
-            tag.hide()
-            break
+def configuredBus():
+    buses = configuredBuses()
+    if buses:
+        return buses[0]
+    return ""
 
-    cardTag = doc.insertTag("Card")
-    cardTag.setAttribute("busId", card.bus_id)
+class ConfigStore:
+    """
+        In-memory view of the saved device state.
 
-    addTag(cardTag, "VendorId", card.vendor_id)
-    addTag(cardTag, "ProductId", card.product_id)
+        The state is loaded once, from the config.json sidecar if it is
+        up to date and from config.xml otherwise, and loaded again only
+        if the files change on disk while there are no pending changes.
+        Changes are kept in memory and written out by flush(). Inside a
+        batch() block, flushing is deferred until the outermost block
+        ends, so several changes cost one write of each file.
+    """
 
-    if card.driver:
-        addTag(cardTag, "Driver", card.driver)
+    def __init__(self, path=None, statePath=None):
+        if path is None:
+            path = consts.config_file
+        if statePath is None:
+            statePath = consts.state_file
 
-    if card.depth:
-        addTag(cardTag, "Depth", str(card.depth))
+        self.path = path
+        self.statePath = statePath
+        self.state = None
+        self.stamp = None
+        self.dirty = False
+        self.depth = 0
 
-    # Save output info
-    outputs = cardTag.insertTag("Outputs")
-    for name, output in card.outputs.items():
-        out = outputs.insertTag("Output")
-        out.setAttribute("name", name)
-        addTag(out, "Enabled", "true" if output.enabled else "false")
-        addTag(out, "Ignored", "true" if output.ignored else "false")
-        if output.mode:
-            addTag(out, "Mode", output.mode)
-        if output.refresh_rate:
-            addTag(out, "RefreshRate", output.refresh_rate)
-        if output.rotation:
-            addTag(out, "Rotation", output.rotation)
-        if output.right_of:
-            addTag(out, "RightOf", output.right_of)
-        if output.below:
-            addTag(out, "Below", output.below)
+    @timed("config.ConfigStore.load")
+    def load(self):
+        stamp = (fileStamp(self.path), fileStamp(self.statePath))
+        if self.state is not None and (self.dirty or stamp == self.stamp):
+            return
 
-        if name in card.monitors:
-            mon = card.monitors[name]
-            monitor = out.insertTag("Monitor")
-            addTag(monitor, "Vendor", mon.vendor)
-            addTag(monitor, "Model", mon.model)
-            addTag(monitor, "HorizSync", mon.hsync)
-            addTag(monitor, "VertRefresh", mon.vref)
+        self.stamp = stamp
 
-    f = open(consts.config_file, "w")
-    f.write(doc.toPrettyString().replace("\n\n", ""))
+        self.state = readJSON(self.statePath, stamp[0])
+        if self.state is not None:
+            return
 
-def getKeymap():
-    layout = None
-    variant = ""
+        self.state = readXML(self.path) or State()
 
-    try:
-        doc = piksemel.parse(consts.config_file)
+    def getDevice(self, busId, device=None):
+        """
+            Return the saved device, or None if it was not saved. If
+            device is given, the saved data is applied to it.
+        """
 
-        keyboard = doc.getTag("Keyboard")
-        if keyboard:
-            layout = keyboard.getTagData("Layout")
-            variant = keyboard.getTagData("Variant") or ""
+        self.load()
 
-    except OSError:
-        pass
+        data = self.state.cards.get(busId)
+        if data is None:
+            return None
 
-    if not layout:
-        from pardus.localedata import languages
+        return deviceFromData(busId, data, device)
+
+    def setDevice(self, card):
+        self.load()
+
+        self.state.setCard(card.bus_id, deviceData(card))
+        self.dirty = True
+        self.commit()
+
+    def getKeymap(self):
+        """Return the saved (layout, variant), or (None, "")."""
+
+        self.load()
+
+        return self.state.keyboard or (None, "")
+
+    def setKeymap(self, layout, variant=""):
+        self.load()
+
+        self.state.keyboard = (layout, variant)
+        self.dirty = True
+        self.commit()
+
+    def getSections(self):
+        """Return the (name, identifier) of the generated sections."""
+
+        self.load()
+
+        return list(self.state.sections)
+
+    def getSectionKeys(self):
+        """
+            Return the (entry keys, option names) zorg generated in the
+            sections, keyed by (name, identifier).
+        """
+
+        self.load()
+
+        return dict(self.state.sectionKeys)
+
+    def setSections(self, sections, keys=None):
+        self.load()
 
+        if keys is None:
+            keys = {}
+
+        if sections == self.state.sections and keys == self.state.sectionKeys:
+            return
+
+        self.state.sections = list(sections)
+        self.state.sectionKeys = dict(keys)
+        self.dirty = True
+        self.commit()
+
+    def commit(self):
+        if self.depth == 0:
+            self.flush()
+
+    @timed("config.ConfigStore.flush")
+    def flush(self):
+        if not self.dirty:
+            return
+
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.mkdir(directory, 0755)
+
+        writeFile(self.path, xmlString(self.state))
+        xmlStamp = fileStamp(self.path)
+        writeFile(self.statePath, jsonString(self.state, xmlStamp))
+
+        self.stamp = (xmlStamp, fileStamp(self.statePath))
+        self.dirty = False
+
+    @contextmanager
+    def batch(self):
+        self.depth += 1
         try:
-            language = file("/etc/mudur/language").read().strip()
-        except IOError:
-            language = "en"
+            yield self
+        finally:
+            self.depth -= 1
+        self.commit()
 
-        if not languages.has_key(language):
-            language = "en"
+_store = None
 
-        keymap = languages[language].keymaps[0]
-        layout = keymap.xkb_layout
-        variant = keymap.xkb_variant
+def getConfigStore():
+    global _store
 
-    return layout, variant
+    if _store is None or _store.path != consts.config_file:
+        _store = ConfigStore()
 
-def saveKeymap(layout, variant=""):
-    if not os.path.exists(consts.config_dir):
-        os.mkdir(consts.config_dir, 0755)
+    return _store
 
-    try:
-        doc = piksemel.parse(consts.config_file)
-    except OSError:
-        doc = piksemel.newDocument("ZORG")
+def getDeviceInfo(busId):
+    return getConfigStore().getDevice(busId)
 
-    keyboardTag = doc.getTag("Keyboard")
+def saveDeviceInfo(card):
+    getConfigStore().setDevice(card)
 
-    if keyboardTag:
-        keyboardTag.hide()
+def saveDevicesInfo(cards):
+    store = getConfigStore()
+    with store.batch():
+        for card in cards:
+            store.setDevice(card)
 
-    keyboardTag = doc.insertTag("Keyboard")
-    keyboardTag.insertTag("Layout").insertData(layout)
-    if variant:
-        keyboardTag.insertTag("Variant").insertData(variant)
+def getKeymap():
+    layout, variant = getConfigStore().getKeymap()
 
-    f = file(consts.config_file, "w")
-    f.write(doc.toPrettyString().replace("\n\n", ""))
+    if not layout:
+        layout, variant = defaultKeymap()
+
+    return layout, variant
+
+def saveKeymap(layout, variant=""):
+    getConfigStore().setKeymap(layout, variant)
+
+@timed("config.probeDevices")
+def probeDevices(sysroot=None, drmroot=None):
+    """
+        Return the video devices to configure, with their saved settings
+        and the monitors detected from EDID. A device without saved
+        outputs gets a "default" output for its first monitor.
+
+        Only VGA compatible controllers (class 0x0300) are configured,
+        as secondary heads (0x0380) and 3D controllers (0x0302) have no
+        outputs of their own. If there are several, those which are
+        neither the boot VGA device nor drive a detected monitor, like
+        the discrete GPU of a hybrid laptop, are left out too.
+    """
+
+    devices = scanVideoDevices(sysroot)
+    vga = [x for x in devices if x.class_id.startswith("0300")]
+
+    store = getConfigStore()
+    cards = []
+    connected = []
+    for device in vga or devices:
+        store.getDevice(device.bus_id, device)
+        if device.isChanged():
+            device.driver = None
+            device.outputs = {}
+            device.monitors = {}
+
+        if device.probeMonitors(drmroot):
+            connected.append(device)
+        if not device.outputs and "default" in device.monitors:
+            device.outputs["default"] = Output("default")
+        cards.append(device)
+
+    if len(cards) > 1:
+        used = [x for x in cards if x.boot_vga or x in connected]
+        if used:
+            cards = used
+
+    return cards
+
+@timed("config.initialConfig")
+def initialConfig(cards=None, force=False):
+    """
+        Configure the given devices, or all probed ones, choosing a
+        driver for those which have none. Returns the devices.
+
+        Unless force is True, probing is skipped and None is returned
+        if xorg.conf was made for the current hardware and drivers.
+    """
+
+    if cards is None:
+        if not force and isUpToDate():
+            return None
+        cards = probeDevices()
+
+    if not cards:
+        return cards
+
+    for card in cards:
+        if not card.driver:
+            card.driver = card.preferredDriver()
+
+    with getConfigStore().batch():
+        saveXorgConfig(cards)
+        saveDevicesInfo(cards)
+
+    return cards
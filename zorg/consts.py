@@ -4,15 +4,35 @@
 from os.path import join
 
 config_dir  = "/var/lib/zorg"
+cache_dir   = join(config_dir, "cache")
 data_dir    = "/usr/share/X11"
 modules_dir = "/usr/lib/xorg/modules"
 
 xorg_conf_file      = "/etc/X11/xorg.conf"
 config_file         = join(config_dir,  "config.xml")
+state_file          = join(config_dir,  "config.json")
 configured_bus_file = join(config_dir,  "configured_bus")
+hashes_file         = join(config_dir,  "hashes")
+fingerprint_file    = join(config_dir,  "fingerprint")
+profile_file        = join(config_dir,  "profile.json")
+enabled_package_file = join(config_dir, "enabled_package")
+daemon_socket       = "/var/run/zorg/socket"
 drivers_file        = join(data_dir,    "DriversDB")
+local_drivers_file  = join(config_dir,  "DriversDB")
 monitors_file       = join(data_dir,    "MonitorsDB")
 xkb_symbols_dir     = join(data_dir,    "xkb/symbols")
+xkb_rules_dir       = join(data_dir,    "xkb/rules")
 drivers_dir         = join(modules_dir, "drivers")
+pci_ids_file        = "/usr/share/misc/pci.ids"
+language_file       = "/etc/mudur/language"
+
+# Xorg.Driver scripts registered to COMAR by the driver packages
+driver_scripts_dir  = "/var/db/comar3/scripts/Xorg.Driver"
+
+# PCI ID lists of Xorg drivers and kernel modules, under aliases_root
+aliases_root        = "/"
+video_aliases_dirs  = ("/usr/share/hwdata/videoaliases",
+                       "/usr/share/xserver-xorg/pci")
+modules_alias_files = "/lib/modules/*/modules.alias"
 
 package_sep = "/"
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Resident zorg server.
+
+    The daemon keeps the COMAR link, the driver inventory and infos,
+    DriversDB, MonitorsDB and the keymap catalogue loaded, and answers
+    zorg-cli over a Unix socket. The in-memory caches check the mtime
+    of their sources on use, so they stay valid while the daemon runs.
+
+    Each connection carries one JSON request line,
+
+        {"method": "compatibleDrivers", "args": ["10de", "0020"]}
+
+    and gets one JSON reply line, {"result": ...} or {"error": ...}.
+    Every connection is read on its own thread, so a client which does
+    not send its request does not hold up the others, but requests are
+    carried out one at a time. Requests which change the configuration
+    are only accepted from root.
+
+    Requests which change the configuration, i.e. safe, probe,
+    setDriver and setKeymap, are passed on to the Xorg.Display COMAR
+    script as without the daemon, so they behave the same but are not
+    faster. Only the queries are served from the caches.
+
+    Clients use request(), which handles the request in the calling
+    process when no daemon is listening.
+"""
+
+import os
+import sys
+import json
+import errno
+import socket
+import struct
+import threading
+
+from zorg import consts
+from zorg.timing import stage
+
+# Seconds a client may take to send its request
+readTimeout = 5
+
+# Seconds a client waits for the reply; probing may run the X server
+replyTimeout = 120
+
+maxRequestSize = 64 * 1024
+
+# Connections read at the same time
+maxConnections = 32
+
+class RequestError(Exception):
+    pass
+
+class DaemonUnavailable(Exception):
+    pass
+
+# name: (function, privileged)
+handlers = {}
+
+def handler(name, privileged=False):
+    def register(func):
+        handlers[name] = (func, privileged)
+        return func
+    return register
+
+_link = None
+
+def getLink():
+    global _link
+
+    if _link is None:
+        import comar
+        _link = comar.Link()
+
+    return _link
+
+def display():
+    return getLink().Xorg.Display["zorg"]
+
+# True in the daemon process
+_serving = False
+
+# Scanned video devices and the PCI devices listing they were made from
+_devices = None
+_devicesStamp = None
+
+def devicesStamp():
+    from zorg import probe
+
+    try:
+        return sorted(os.listdir(probe.sysdir))
+    except OSError:
+        return None
+
+def getDevices():
+    """Return the video devices, scanned again if PCI devices changed."""
+
+    global _devices, _devicesStamp
+
+    stamp = devicesStamp()
+    if _devices is None or stamp != _devicesStamp:
+        from zorg.probe import scanVideoDevices
+        _devices = scanVideoDevices()
+        _devicesStamp = stamp
+
+    return _devices
+
+# Requests
+
+@handler("ping")
+def ping():
+    import zorg
+    return zorg.versionString()
+
+@handler("safe", privileged=True)
+def safe():
+    if not display().safeConfig():
+        return False
+
+    display().syncConfigs()
+    return True
+
+@handler("probe", privileged=True)
+def probe():
+    if not display().initialConfig():
+        return False
+
+    display().syncConfigs()
+    return True
+
+def installedPackages():
+    if _serving:
+        from zorg.inventory import getInventory
+        return getInventory().packages()
+
+    # A one-shot process only needs the package list
+    from zorg.driverinfo import installedPackages
+    return installedPackages(getLink())
+
+@handler("setDriver", privileged=True)
+def setDriver(driver):
+    if consts.package_sep in driver:
+        drv, pkg = driver.split(consts.package_sep, 1)
+        if pkg.replace("-", "_") not in installedPackages():
+            raise RequestError("Package is not installed: %s" % pkg)
+
+    display().setDriver(driver)
+    display().syncConfigs()
+
+@handler("setKeymap", privileged=True)
+def setKeymap(layout, variant=""):
+    from zorg.keymaps import getCatalogue
+
+    catalogue = getCatalogue()
+    # Without XKB data there is nothing to check against
+    if len(catalogue) and not catalogue.isValid(layout, variant):
+        if not catalogue.isValid(layout):
+            raise RequestError("Unknown keyboard layout: %s" % layout)
+
+        lines = ["Unknown variant '%s' of layout '%s'. Available variants:"
+                    % (variant, layout)]
+        for name, desc in catalogue.variants(layout):
+            lines.append("  %-20s %s" % (name, desc))
+        raise RequestError("\n".join(lines))
+
+    display().setKeymap(layout, variant)
+
+@handler("compatibleDrivers")
+def compatibleDrivers(vendor, product):
+    from zorg.hwdata import getCompatibleDriverNames
+    return getCompatibleDriverNames(vendor, product)
+
+@handler("availableDrivers")
+def availableDrivers():
+    from zorg.hwdata import getAvailableDriverNames
+    return getAvailableDriverNames()
+
+@handler("failedPackages")
+def failedPackages():
+    from zorg import driverinfo
+
+    driverinfo.getDriverInfos(getLink())
+    return driverinfo.failedPackages()
+
+@handler("layouts")
+def layouts():
+    from zorg.keymaps import getCatalogue
+    return getCatalogue().layouts()
+
+@handler("devices")
+def devices():
+    result = []
+    for device in getDevices():
+        result.append({
+            "bus_id":       device.bus_id,
+            "vendor_id":    device.vendor_id,
+            "product_id":   device.product_id,
+            "boot_vga":     device.boot_vga,
+            })
+
+    return result
+
+def handle(method, args=()):
+    """Run a request in this process. Errors are raised as RequestError."""
+
+    if method not in handlers:
+        raise RequestError("Unknown request: %s" % method)
+
+    func = handlers[method][0]
+    with stage("daemon.%s" % method):
+        return func(*args)
+
+# Client
+
+def readLine(sock, limit=None):
+    data = []
+    size = 0
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+
+        data.append(chunk)
+        size += len(chunk)
+        if "\n" in chunk or (limit and size > limit):
+            break
+
+    return "".join(data).split("\n", 1)[0]
+
+def call(method, *args):
+    """
+        Send a request to the daemon and return its result. Raises
+        DaemonUnavailable if no daemon is listening. Once the request
+        is sent, failures are raised as RequestError, since it may
+        have been carried out.
+    """
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(consts.daemon_socket)
+        except socket.error, e:
+            raise DaemonUnavailable(str(e))
+
+        sock.settimeout(replyTimeout)
+        try:
+            sock.sendall(json.dumps({"method": method, "args": args}) + "\n")
+            reply = readLine(sock)
+        except socket.error, e:
+            raise RequestError("Lost connection to zorg-daemon: %s" % e)
+    finally:
+        sock.close()
+
+    from zorg.state import encodeStrings
+
+    try:
+        reply = encodeStrings(json.loads(reply))
+    except ValueError:
+        raise RequestError("Invalid reply from zorg-daemon")
+
+    if "error" in reply:
+        raise RequestError(reply["error"])
+
+    return reply.get("result")
+
+def request(method, *args):
+    """
+        Ask the daemon if one is running, handle the request in this
+        process otherwise.
+
+        Privileged requests of other users are always handled here, so
+        that COMAR authorizes them as usual.
+    """
+
+    if method not in handlers or not handlers[method][1] or os.getuid() == 0:
+        try:
+            return call(method, *args)
+        except DaemonUnavailable:
+            pass
+
+    return handle(method, args)
+
+# Server
+
+def peerUid(conn):
+    # struct ucred {pid_t pid; uid_t uid; gid_t gid;}
+    option = getattr(socket, "SO_PEERCRED", 17)
+    creds = conn.getsockopt(socket.SOL_SOCKET, option, struct.calcsize("3i"))
+    return struct.unpack("3i", creds)[1]
+
+# Held while a request is carried out
+_handleLock = threading.Lock()
+
+def serveConnection(conn):
+    from zorg.state import encodeStrings
+
+    conn.settimeout(readTimeout)
+    try:
+        line = readLine(conn, maxRequestSize)
+        request = json.loads(line)
+        method = str(request["method"])
+        args = encodeStrings(request.get("args", []))
+    except (socket.error, ValueError, KeyError, TypeError):
+        return
+
+    reply = {}
+    try:
+        if handlers.get(method, (None, False))[1] and peerUid(conn) != 0:
+            raise RequestError("Permission denied")
+        with _handleLock:
+            reply["result"] = handle(method, args)
+    except RequestError, e:
+        reply["error"] = str(e)
+    except Exception, e:
+        reply["error"] = "%s: %s" % (e.__class__.__name__, e)
+
+    try:
+        conn.settimeout(replyTimeout)
+        conn.sendall(json.dumps(reply) + "\n")
+    except socket.error:
+        pass
+
+def warmUp():
+    """Load the databases and driver infos before the first request."""
+
+    from zorg.driversdb import getDriversDB
+    from zorg.monitorsdb import getMonitorDB
+    from zorg.keymaps import getCatalogue
+    from zorg.inventory import getInventory
+
+    for load in (getDriversDB, getMonitorDB, getCatalogue,
+                 getInventory().update, getDevices):
+        try:
+            load()
+        except Exception, e:
+            print >> sys.stderr, "zorg-daemon: %s" % e
+
+def listen(path):
+    """Bind the socket, replacing a stale one. Returns None if in use."""
+
+    if os.path.exists(path):
+        try:
+            call("ping")
+            return None
+        except DaemonUnavailable:
+            os.unlink(path)
+
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory, 0755)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    # Queries are open to everyone, the rest is checked per request
+    os.chmod(path, 0666)
+    sock.listen(16)
+
+    return sock
+
+def acceptLoop(sock):
+    """Serve the connections of a listening socket, each on a thread."""
+
+    slots = threading.BoundedSemaphore(maxConnections)
+
+    def serveThread(conn):
+        try:
+            serveConnection(conn)
+        finally:
+            conn.close()
+            slots.release()
+
+    while True:
+        try:
+            conn, addr = sock.accept()
+        except socket.error, e:
+            if e.args[0] == errno.EINTR:
+                continue
+            raise
+
+        slots.acquire()
+        thread = threading.Thread(target=serveThread, args=(conn,))
+        thread.daemon = True
+        thread.start()
+
+def serve():
+    import signal
+    global _serving
+
+    path = consts.daemon_socket
+    sock = listen(path)
+    if sock is None:
+        print >> sys.stderr, "zorg-daemon is already running on %s" % path
+        return 1
+
+    def terminate(signum, frame):
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    _serving = True
+
+    from zorg import inventory
+    inventory.watchChanges = True
+
+    try:
+        warmUp()
+        acceptLoop(sock)
+    finally:
+        sock.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    return 0
+
+def main(args=None):
+    import optparse
+
+    parser = optparse.OptionParser(
+        description="Serve zorg-cli requests with the hardware data and "
+                    "databases kept in memory.")
+    parser.add_option("-s", "--socket", default=None,
+        help="path of the socket [default: %s]" % consts.daemon_socket)
+
+    opts, args = parser.parse_args(args)
+
+    if opts.socket:
+        consts.daemon_socket = opts.socket
+
+    try:
+        return serve()
+    except KeyboardInterrupt:
+        return 0
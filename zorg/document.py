@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Round-trip preserving xorg.conf model.
+
+    Unlike XorgParser, XorgDocument keeps every line of the file,
+    including comments, blank lines and the original order. Edits only
+    rewrite the lines they touch, so rendering an unmodified document
+    gives back the original bytes.
+"""
+
+import fnmatch
+
+from zorg.parser import XorgEntry, OptionMap, ParseError, entryFormat, \
+                        sectionLines, lowerKey, tokenRe, keyRe, warn
+from zorg.utils import hasData
+
+# Keys which zorg owns in the sections it generates. When a generated
+# section is merged into an existing one, these and the entries and
+# options zorg generated the last time are removed if zorg did not
+# generate them now. Everything else is left as the admin wrote it.
+#
+#   section name: (entry keys, option name patterns, subsection names)
+managedKeys = {
+    "serverflags":  ((), ("dontvtswitch",), ()),
+    "device":       (("driver", "busid"), ("monitor-*",), ()),
+    "screen":       (("device", "monitor", "defaultdepth"), (), ("display",)),
+    "monitor":      (("vendorname", "modelname", "horizsync", "vertrefresh"),
+                     ("ignore", "enable", "disable", "preferredmode",
+                      "targetrefresh", "rotate", "rightof", "below"), ()),
+    "serverlayout": (("screen",), (), ()),
+    "display":      (("depth", "modes"), (), ()),
+}
+
+indentUnit = "    "
+
+class Line(object):
+    __slots__ = ("text", "entry")
+
+    def __init__(self, text, entry=None):
+        self.text = text
+        self.entry = entry
+
+    def __repr__(self):
+        return "<Line: %r>" % self.text
+
+def isOption(line):
+    return line.entry.key.lower() == "option" and line.entry.values
+
+def lineSuffix(text):
+    """Return the trailing comment of a line with its leading spaces."""
+
+    m = keyRe.match(text)
+    if not m:
+        return ""
+
+    for m in tokenRe.finditer(text, m.end()):
+        if m.group(3):
+            return text[m.start():].rstrip("\n")
+
+    return ""
+
+def lineIndent(text):
+    text = text.rstrip("\n")
+    return text[:len(text) - len(text.lstrip())]
+
+def renderLine(old, key, values):
+    newline = "\n" if old.endswith("\n") else ""
+    body = ("%s\t%s" % (key, entryFormat(values))).expandtabs(4)
+    return "%s%s%s%s" % (lineIndent(old), body, lineSuffix(old), newline)
+
+def parseFragment(doc, text):
+    fragment = XorgDocument()
+    fragment.parse(text)
+    block = fragment.sections[0]
+    block.rebind(doc)
+    return fragment.lines, block
+
+class Block(object):
+    """A Section or SubSection of an XorgDocument."""
+
+    __slots__ = ("doc", "name", "head", "tail", "items", "sections")
+
+    def __init__(self, doc, name, head):
+        self.doc = doc
+        self.name = name
+        self.head = head
+        self.tail = None
+        self.items = []
+        self.sections = []
+
+    def __repr__(self):
+        return "<Block '%s'>" % self.name
+
+    def indent(self):
+        for line in self.items:
+            return lineIndent(line.text)
+        return lineIndent(self.head.text) + indentUnit
+
+    def _entries(self, key):
+        key = key.lower()
+        return [x for x in self.items
+                    if x.entry.key.lower() == key and not isOption(x)]
+
+    def _options(self, name):
+        name = lowerKey(name)
+        return [x for x in self.items
+                    if isOption(x) and lowerKey(x.entry.values[0]) == name]
+
+    def _insert(self, lines, after=None):
+        if after is None:
+            pos = self.doc.index(self.tail)
+            self.items.extend(lines)
+        elif after is self.head:
+            pos = self.doc.index(after) + 1
+            self.items[0:0] = lines
+        else:
+            pos = self.doc.index(after) + 1
+            i = self.items.index(after) + 1
+            self.items[i:i] = lines
+        self.doc.splice(pos, pos, lines)
+
+    def _remove(self, line):
+        self.items.remove(line)
+        pos = self.doc.index(line)
+        self.doc.splice(pos, pos + 1)
+
+    def _newLine(self, key, values):
+        text = renderLine(self.indent() + "\n", key, values)
+        return Line(text, XorgEntry(text))
+
+    def _rewrite(self, line, key, values):
+        if entryFormat(line.entry.values) == entryFormat(values):
+            return
+        line.text = renderLine(line.text, key, values)
+        line.entry = XorgEntry(line.text)
+
+    def getEntries(self, key):
+        return tuple(x.entry for x in self._entries(key))
+
+    def get(self, key, index=0, default=None):
+        lines = self._entries(key)
+        if lines:
+            return lines[0].entry.values[index]
+        return default
+
+    def setAll(self, key, valuesList):
+        """Make the entries with key have the given list of values."""
+
+        if key.lower() == "identifier":
+            self.doc.dropSectionIndex()
+
+        lines = self._entries(key)
+        for line, values in zip(lines, valuesList):
+            self._rewrite(line, line.entry.key, list(values))
+
+        for line in lines[len(valuesList):]:
+            self._remove(line)
+
+        if lines:
+            after = lines[-1]
+        else:
+            # Keep plain entries before options
+            after = self.head
+            for line in self.items:
+                if not isOption(line):
+                    after = line
+        new = [self._newLine(key, list(x)) for x in valuesList[len(lines):]]
+        if new:
+            self._insert(new, after)
+
+    def set(self, key, *values):
+        self.setAll(key, [values])
+
+    def remove(self, key):
+        self.setAll(key, [])
+
+    def options(self):
+        options = OptionMap()
+        for line in self.items:
+            if isOption(line):
+                values = line.entry.values
+                options[values[0]] = values[1] if len(values) > 1 else "true"
+        return options
+
+    def getOption(self, name, default=None):
+        return self.options().get(name, default)
+
+    def setOption(self, name, value):
+        lines = self._options(name)
+        values = [lines and lines[0].entry.values[0] or "%s" % name, value]
+        if lines:
+            self._rewrite(lines[0], lines[0].entry.key, values)
+            for line in lines[1:]:
+                self._remove(line)
+        else:
+            after = None
+            for line in self.items:
+                if isOption(line):
+                    after = line
+            self._insert([self._newLine("Option", values)], after)
+
+    def removeOption(self, name):
+        for line in self._options(name):
+            self._remove(line)
+
+    def getSections(self, *names):
+        return tuple(x for x in self.sections if x.name in names)
+
+    def addSection(self, section):
+        """Append an XorgSection as a SubSection of this block."""
+
+        indent = self.indent()
+        text = ['%sSubSection "%s"\n' % (indent, section.name)]
+        text.extend(indent + x.expandtabs(4) for x in sectionLines(section, 1))
+        text.append("%sEndSubSection\n" % indent)
+
+        lines, block = parseFragment(self.doc, text)
+        pos = self.doc.index(self.tail)
+        self.doc.splice(pos, pos, lines)
+        self.sections.append(block)
+        return block
+
+    def removeSection(self, block):
+        start = self.doc.index(block.head)
+        end = self.doc.index(block.tail)
+        self.doc.splice(start, end + 1)
+        self.sections.remove(block)
+
+    def rebind(self, doc):
+        self.doc = doc
+        for sec in self.sections:
+            sec.rebind(doc)
+
+    def update(self, section, owned=((), ())):
+        """
+            Merge a generated XorgSection into this block. Entries and
+            options zorg generated are set, managed ones which were not
+            generated are removed and everything else is kept.
+
+            owned is the (entry keys, option names) which zorg generated
+            for this section before, in lower case. They are managed too.
+        """
+
+        entryKeys, optionPatterns, subNames = \
+                managedKeys.get(self.name.lower(), ((), (), ()))
+        entryKeys = tuple(entryKeys) + tuple(owned[0])
+        optionNames = owned[1]
+
+        generated = {}
+        order = []
+        for e in section.entries:
+            key = e.key.lower()
+            if key not in generated:
+                generated[key] = (e.key, [])
+                order.append(key)
+            generated[key][1].append(e.values)
+
+        for key in order:
+            name, valuesList = generated[key]
+            self.setAll(name, valuesList)
+
+        for key in entryKeys:
+            if key not in generated:
+                self.remove(key)
+
+        for name, value in section.options.items():
+            self.setOption(name, value)
+
+        for name in self.options().keys():
+            lower = lowerKey(name)
+            if name in section.options:
+                continue
+            if lower in optionNames or \
+                    [x for x in optionPatterns if fnmatch.fnmatch(lower, x)]:
+                self.removeOption(name)
+
+        for sub in section.sections:
+            blocks = self.getSections(sub.name)
+            if blocks:
+                blocks[0].update(sub)
+            else:
+                self.addSection(sub)
+
+        names = [x.name for x in section.sections]
+        for block in list(self.sections):
+            if block.name.lower() in subNames and block.name not in names:
+                self.removeSection(block)
+
+def sectionKey(name, identifier):
+    return name.lower(), identifier
+
+class XorgDocument:
+    def __init__(self):
+        self.lines = []
+        self.sections = []
+
+        # id() of a line -> its position. Only the positions below
+        # _valid are known to be right, the lines after the first
+        # change are indexed again on demand.
+        self._positions = {}
+        self._valid = 0
+
+        # sectionKey() -> first block with that name and identifier
+        self._blocks = None
+
+    def index(self, line):
+        pos = self._positions.get(id(line))
+        if pos is None or pos >= self._valid:
+            for i in xrange(self._valid, len(self.lines)):
+                self._positions[id(self.lines[i])] = i
+            self._valid = len(self.lines)
+            pos = self._positions.get(id(line))
+
+        if pos is not None and pos < len(self.lines) and self.lines[pos] is line:
+            return pos
+        raise ValueError("Line is not in the document")
+
+    def splice(self, start, end, lines=()):
+        """Replace the lines from start to end with the given ones."""
+
+        self.lines[start:end] = lines
+        self._valid = min(self._valid, start)
+
+    def dropSectionIndex(self):
+        self._blocks = None
+
+    def parseFile(self, filePath):
+        f = open(filePath)
+        try:
+            self.parse(f, filePath)
+        finally:
+            f.close()
+
+    def parse(self, lines, filename=None):
+        """
+            Parse an iterable of lines. Lines outside of sections and
+            extra EndSections are kept as they are but skipped with a
+            ParseWarning, and sections left open at the end are closed.
+        """
+
+        stack = [self]
+        lineno = 0
+
+        try:
+            for lineno, text in enumerate(lines, 1):
+                e = XorgEntry(text, lineno)
+                key = e.key.lower()
+                line = Line(text)
+                self.lines.append(line)
+
+                if key == "" or key[0] == "#":
+                    continue
+
+                if len(stack) == 1 and key not in ("section", "subsection"):
+                    warn("%s outside of a section" % e.key,
+                         lineno, e.column, filename)
+                    continue
+
+                line.entry = e
+
+                if key in ("section", "subsection"):
+                    if not e.values:
+                        raise ParseError("Missing section name",
+                                         lineno, e.column)
+
+                    block = Block(self, e.values[0], line)
+                    stack[-1].sections.append(block)
+                    stack.append(block)
+
+                elif key in ("endsection", "endsubsection"):
+                    stack.pop().tail = line
+
+                else:
+                    stack[-1].items.append(line)
+
+        except ParseError, e:
+            e.filename = filename
+            raise
+
+        if len(stack) > 1:
+            warn("Missing EndSection of %s" % stack[-1].name,
+                 lineno, None, filename)
+
+            if self.lines and not self.lines[-1].text.endswith("\n"):
+                self.lines[-1].text += "\n"
+
+            while len(stack) > 1:
+                block = stack.pop()
+                if len(stack) > 1:
+                    text = "%sEndSubSection\n" % lineIndent(block.head.text)
+                else:
+                    text = "EndSection\n"
+                block.tail = Line(text, XorgEntry(text))
+                self.lines.append(block.tail)
+
+        self.dropSectionIndex()
+
+    def getSections(self, *names):
+        return tuple(x for x in self.sections if x.name in names)
+
+    def findSection(self, name, identifier=None):
+        if self._blocks is None:
+            blocks = {}
+            for block in self.sections:
+                key = sectionKey(block.name, block.get("Identifier"))
+                blocks.setdefault(key, block)
+            self._blocks = blocks
+
+        return self._blocks.get(sectionKey(name, identifier))
+
+    def addSection(self, section):
+        """Append an XorgSection to the end of the document."""
+
+        text = ['Section "%s"\n' % section.name]
+        text.extend(sectionLines(section, 1))
+        text.append("EndSection\n")
+        text = [x.expandtabs(4) for x in text]
+
+        if self.lines and self.lines[-1].text.strip():
+            text.insert(0, "\n")
+            if not self.lines[-1].text.endswith("\n"):
+                self.lines[-1].text += "\n"
+
+        lines, block = parseFragment(self, text)
+        self.lines.extend(lines)
+        self.sections.append(block)
+        self.dropSectionIndex()
+        return block
+
+    def removeSection(self, block):
+        start = self.index(block.head)
+        end = self.index(block.tail) + 1
+
+        # Take the blank line which addSection() put before it
+        if start > 0 and not self.lines[start - 1].text.strip() and \
+                (end == len(self.lines) or not self.lines[end].text.strip()):
+            start -= 1
+
+        self.splice(start, end)
+        self.sections.remove(block)
+        self.dropSectionIndex()
+
+    def merge(self, parser, owned=(), ownedKeys=None):
+        """
+            Merge the sections of an XorgParser into the document.
+            owned is the list of (name, identifier) of the sections
+            which zorg generated before. Those which are not generated
+            any more are removed.
+
+            ownedKeys maps the (name, identifier) of those sections to
+            the (entry keys, option names) zorg generated in them. The
+            ones which are not generated any more are removed.
+        """
+
+        if ownedKeys is None:
+            ownedKeys = {}
+
+        generated = set()
+        for section in parser.sections:
+            identifier = section.get("Identifier")
+            generated.add(sectionKey(section.name, identifier))
+
+            block = self.findSection(section.name, identifier)
+            if block:
+                block.update(section,
+                             ownedKeys.get((section.name, identifier), ((), ())))
+            else:
+                self.addSection(section)
+
+        for name, identifier in owned:
+            if sectionKey(name, identifier) not in generated:
+                block = self.findSection(name, identifier)
+                if block:
+                    self.removeSection(block)
+
+    def toString(self):
+        return "".join(x.text for x in self.lines)
+
+    def write(self, f):
+        for line in self.lines:
+            f.write(line.text)
+
+    def isSaved(self, filePath):
+        """Return True if filePath already has the rendered contents."""
+
+        return hasData(filePath, self.toString())
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import Queue
+import threading
+
+from zorg import cache
+from zorg import consts
+from zorg.timing import stage, timed
+
+# Size of the worker pool and timeout in seconds of a single getInfo() call
+maxWorkers = 8
+callTimeout = 10
+
+# (installed packages, {alias: info}, {package: error}, scripts stamp)
+# of this process
+_infos = None
+
+def cacheFile():
+    return os.path.join(consts.cache_dir, "driver_info")
+
+def scriptsStamp():
+    """
+        Return the names, mtimes and sizes of the registered Xorg.Driver
+        scripts, which change whenever a driver package is installed,
+        removed or upgraded. Returns None if they can not be read.
+    """
+
+    directory = consts.driver_scripts_dir
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return None
+
+    stamp = []
+    for name in names:
+        try:
+            st = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        stamp.append((name, st.st_mtime, st.st_size))
+
+    return tuple(stamp)
+
+def plainValue(value):
+    # dbus types can not be marshalled
+    if isinstance(value, basestring):
+        try:
+            return str(value)
+        except UnicodeError:
+            return unicode(value)
+    elif isinstance(value, (int, long)):
+        return int(value)
+    elif isinstance(value, (list, tuple)):
+        return [plainValue(x) for x in value]
+    return str(value)
+
+def installedPackages(link):
+    return [str(x) for x in link.Xorg.Driver]
+
+def fetchInfos(link, packages, workers, timeout):
+    """
+        Call getInfo() of the given packages on a pool of worker
+        threads. Returns ({package: info}, {package: error message}).
+    """
+
+    results = {}
+    errors = {}
+    jobs = Queue.Queue()
+    for package in packages:
+        jobs.put(package)
+
+    def worker():
+        while True:
+            try:
+                package = jobs.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                with stage("driverinfo.getInfo"):
+                    info = link.Xorg.Driver[package].getInfo(timeout=timeout)
+                info = dict((str(k), plainValue(v)) for k, v in info.items())
+            except Exception, e:
+                errors[package] = str(e) or e.__class__.__name__
+            else:
+                results[package] = info
+
+    threads = []
+    for i in range(min(workers, len(packages))):
+        t = threading.Thread(target=worker)
+        t.setDaemon(True)
+        t.start()
+        threads.append(t)
+
+    # Each call has its own timeout; this is a safety net for
+    # scripts which do not return at all.
+    rounds = (len(packages) + workers - 1) / max(workers, 1)
+    deadline = time.time() + rounds * timeout + 1
+    for t in threads:
+        t.join(max(deadline - time.time(), 0))
+
+    for package in packages:
+        if package not in results and package not in errors:
+            errors[package] = "Timed out"
+
+    return results, errors
+
+@timed("driverinfo.queryInfos")
+def queryInfos(link, packages, workers=None, timeout=None):
+    """
+        Query all packages concurrently and merge the results by alias.
+
+        If more than one package provides the same alias, the first
+        one in the given order wins, regardless of which call returned
+        first. Returns (infos, errors).
+    """
+
+    if workers is None:
+        workers = maxWorkers
+    if timeout is None:
+        timeout = callTimeout
+
+    results, errors = fetchInfos(link, packages, workers, timeout)
+
+    infos = {}
+    for package in packages:
+        info = results.get(package)
+        if info is None:
+            continue
+
+        if "alias" not in info:
+            errors[package] = "No alias in driver info"
+            continue
+
+        info["package"] = package
+        if info["alias"] not in infos:
+            infos[info["alias"]] = info
+
+    return infos, errors
+
+def getDriverInfos(link=None):
+    """
+        Return a dict mapping driver aliases to the getInfo() results
+        of installed Xorg.Driver packages.
+
+        The result is computed once per process and saved under
+        consts.cache_dir. It is reused as long as the set of installed
+        Xorg.Driver packages is the same, so only the package list is
+        fetched over D-Bus. It is dropped when the registered
+        Xorg.Driver scripts change.
+
+        Packages whose getInfo() failed are reported on stderr and by
+        failedPackages().
+    """
+
+    global _infos
+
+    stamp = scriptsStamp()
+    if _infos is not None:
+        if _infos[3] is None or _infos[3] == stamp:
+            return _infos[1]
+
+    if link is None:
+        import comar
+        link = comar.Link()
+
+    packages = installedPackages(link)
+    # An upgraded package keeps its name but changes its script
+    key = (sorted(packages), stamp)
+
+    infos = cache.readCache(cacheFile(), key)
+    errors = {}
+    if infos is None:
+        infos, errors = queryInfos(link, packages)
+        # Do not keep failures around until the package set changes
+        if not errors:
+            cache.writeCache(cacheFile(), key, infos)
+
+    for package in sorted(errors):
+        print >> sys.stderr, "zorg: getInfo() of %s failed: %s" % \
+                                (package, errors[package])
+
+    _infos = (packages, infos, errors, stamp)
+    return infos
+
+def getInstalledPackages(link=None):
+    getDriverInfos(link)
+    return list(_infos[0])
+
+def failedPackages():
+    """Return {package: error} for the packages whose getInfo() failed."""
+
+    if _infos is None:
+        return {}
+    return dict(_infos[2])
+
+def setInfos(infos, packages=()):
+    """
+        Use the given {alias: info} instead of asking COMAR, e.g. when
+        configuring a system image offline.
+    """
+
+    global _infos
+    _infos = (list(packages), dict(infos), {}, None)
+
+def invalidate():
+    global _infos
+    _infos = None
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+"""
+    PCI ID to Xorg driver table.
+
+    The table maps "vvvvdddd" device IDs, or "vvvv" vendor IDs for
+    drivers which claim every device of a vendor, to lists of driver
+    names. The shipped DriversDB is hand maintained. It is extended
+    with the PCI IDs claimed by the installed Xorg drivers and kernel
+    modules when it is loaded, and loaded again when their alias files
+    change. updateDriversDB() saves the extended table together with
+    its compiled form at install time.
+"""
+
+import os
+import re
+import glob
+import time
+
+from zorg import cache
+from zorg import consts
+from zorg.timing import timed
+from zorg.utils import loadFile
+
+# Kernel modules whose PCI aliases tell which Xorg driver to use
+kernelDrivers = {
+    "i810":         "i810",
+    "i915":         "intel",
+    "radeon":       "radeon",
+    "nouveau":      "nouveau",
+    "mga":          "mga",
+    "mgag200":      "mga",
+    "r128":         "r128",
+    "savage":       "savage",
+    "sis":          "sis",
+    "tdfx":         "tdfx",
+    "via":          "openchrome",
+    "ast":          "ast",
+    "cirrus":       "cirrus",
+    "vmwgfx":       "vmware",
+}
+
+# Seconds between two checks of the driver alias files
+aliasesInterval = 10
+
+# (check time, aliases root, stamp)
+_aliases = None
+
+# pci:v000010DEd00000020sv*sd*bc03sc*i* and the pcivideo: form of .xinf files
+aliasRe = re.compile(r"pci(?:video)?:v0000([0-9A-Fa-f]{4})d(0000[0-9A-Fa-f]{4}|\*)"
+                     r"sv[^s]*sd[^b]*bc([0-9A-Fa-f]{2}|\*)")
+
+@timed("driversdb.parseDriversDB")
+def parseDriversDB(path):
+    """Return a dict mapping "vvvvdddd" PCI IDs to lists of driver names."""
+
+    db = {}
+    for line in loadFile(path):
+        fields = line.split()
+        if len(fields) < 2:
+            continue
+
+        pciId = fields[0].lower()
+        if pciId not in db:
+            db[pciId] = fields[1:]
+
+    return db
+
+def aliasId(alias):
+    """
+        Return the DriversDB key of a PCI modalias pattern, or None if
+        it is not for a display device or too generic to use.
+    """
+
+    m = aliasRe.match(alias)
+    if not m:
+        return None
+
+    vendor, device, baseClass = m.groups()
+    if baseClass not in ("03", "*"):
+        return None
+
+    if device == "*":
+        return vendor.lower()
+    return (vendor + device[4:]).lower()
+
+def addDriver(db, pciId, driver):
+    drivers = db.setdefault(pciId, [])
+    if driver not in drivers:
+        drivers.append(driver)
+
+def parseModulesAlias(path):
+    """Return the table of the display drivers in a kernel modules.alias."""
+
+    db = {}
+    for line in loadFile(path):
+        fields = line.split()
+        if len(fields) != 3 or fields[0] != "alias":
+            continue
+
+        driver = kernelDrivers.get(fields[2])
+        if not driver:
+            continue
+
+        pciId = aliasId(fields[1])
+        if pciId:
+            addDriver(db, pciId, driver)
+
+    return db
+
+def parseVideoAliases(directory):
+    """
+        Return the table of the Xorg driver alias files in directory.
+
+        Both the videoaliases format, lines of "alias pcivideo:... drv"
+        in drv.xinf, and the xserver-xorg/pci format, one "VVVVDDDD"
+        per line in drv.ids, are read.
+    """
+
+    db = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.xinf"))):
+        for line in loadFile(path):
+            fields = line.split()
+            if len(fields) != 3 or fields[0] != "alias":
+                continue
+
+            pciId = aliasId(fields[1])
+            if pciId:
+                addDriver(db, pciId, fields[2])
+
+    for path in sorted(glob.glob(os.path.join(directory, "*.ids"))):
+        driver = os.path.basename(path)[:-4]
+        for line in loadFile(path):
+            pciId = line.strip().lower()
+            if len(pciId) == 8:
+                addDriver(db, pciId, driver)
+
+    return db
+
+def mergeDriversDB(*dbs):
+    """
+        Merge tables. Drivers of earlier tables come first, so the
+        preferred driver of a hand maintained entry is kept.
+    """
+
+    merged = {}
+    for db in dbs:
+        for pciId, drivers in db.iteritems():
+            for driver in drivers:
+                addDriver(merged, pciId, driver)
+
+    return merged
+
+def aliasSources(root):
+    """Return the alias directories and modules.alias files under root."""
+
+    def rooted(path):
+        return os.path.join(root, path.lstrip("/"))
+
+    return [rooted(x) for x in consts.video_aliases_dirs] + \
+                sorted(glob.glob(rooted(consts.modules_alias_files)))
+
+def aliasesStamp(root=None):
+    """
+        Return the stamps of the alias sources under root, which is
+        consts.aliases_root by default, with paths relative to it.
+
+        The alias directories are stamped as a whole, which catches
+        packages adding, removing or replacing their alias files.
+    """
+
+    if root is None:
+        root = consts.aliases_root
+
+    return tuple((os.path.relpath(path, root), cache.sourceStamp(path))
+                    for path in aliasSources(root))
+
+def checkAliases():
+    """
+        Return aliasesStamp() of consts.aliases_root, computed again at
+        most every aliasesInterval seconds.
+    """
+
+    global _aliases
+
+    now = time.time()
+    root = consts.aliases_root
+    if _aliases is None or _aliases[1] != root or \
+            not 0 <= now - _aliases[0] < aliasesInterval:
+        _aliases = (now, root, aliasesStamp(root))
+
+    return _aliases[2]
+
+def generateDriversDB(root="/", shipped=None):
+    """Return the shipped table merged with the aliases found under root."""
+
+    def rooted(path):
+        return os.path.join(root, path.lstrip("/"))
+
+    if shipped is None:
+        shipped = rooted(consts.drivers_file)
+
+    dbs = [parseDriversDB(shipped)]
+
+    for directory in consts.video_aliases_dirs:
+        dbs.append(parseVideoAliases(rooted(directory)))
+
+    for path in sorted(glob.glob(rooted(consts.modules_alias_files))):
+        dbs.append(parseModulesAlias(path))
+
+    return mergeDriversDB(*dbs)
+
+def formatDriversDB(db):
+    return "".join("%s %s\n" % (pciId, " ".join(db[pciId]))
+                        for pciId in sorted(db))
+
+def updateDriversDB(root="/", aliasesRoot=None):
+    """
+        Write the generated table to consts.local_drivers_file under
+        root and store its compiled form in the cache directory, so the
+        first lookup does not have to parse it.
+
+        The shipped table is read under root. The alias files are
+        looked up under aliasesRoot, which defaults to root.
+    """
+
+    shipped = os.path.join(root, consts.drivers_file.lstrip("/"))
+    db = generateDriversDB(aliasesRoot or root, shipped)
+
+    target = os.path.join(root, consts.local_drivers_file.lstrip("/"))
+    if not cache.storeFile(target, formatDriversDB(db)):
+        return None
+
+    cacheDir = os.path.join(root, consts.cache_dir.lstrip("/"))
+    cache.writeCache(cache.cacheFile("DriversDB", consts.local_drivers_file,
+                                     cacheDir),
+                     (cache.sourceStamp(target),
+                      aliasesStamp(aliasesRoot or root)), db)
+
+    return db
+
+def driversDBFile():
+    """
+        Return the generated table, unless the shipped one is newer,
+        e.g. after an upgrade of zorg, or there is no generated one.
+    """
+
+    local = cache.sourceStamp(consts.local_drivers_file)
+    if local is None:
+        return consts.drivers_file
+
+    shipped = cache.sourceStamp(consts.drivers_file)
+    if shipped is not None and shipped[0] > local[0]:
+        return consts.drivers_file
+
+    return consts.local_drivers_file
+
+def buildDriversDB(path):
+    return generateDriversDB(consts.aliases_root, path)
+
+def getDriversDB(path=None):
+    """
+        Return the table in path, the one of driversDBFile() by default,
+        merged with the aliases under consts.aliases_root. Changes of
+        the alias files are noticed within aliasesInterval seconds.
+    """
+
+    if path is None:
+        path = driversDBFile()
+    return cache.cached("DriversDB", path, buildDriversDB, checkAliases())
+
+def _lookup(db, vendor_id, product_id, wildcard=True):
+    drivers = db.get((vendor_id + product_id).lower())
+    if drivers is None and wildcard:
+        drivers = db.get(vendor_id.lower())
+    return list(drivers or [])
+
+def lookup(vendor_id, product_id, wildcard=True):
+    """
+        Return the list of drivers known to support the given device.
+
+        Drivers which claim every device of the vendor are only
+        returned if the device has no entry of its own and wildcard is
+        True. They may not support an unknown device, so they should
+        not be chosen for it automatically.
+    """
+
+    return _lookup(getDriversDB(), vendor_id, product_id, wildcard)
+
+def lookupMany(ids, wildcard=True):
+    """
+        Look up several devices at once.
+
+        ids is a sequence of (vendor_id, product_id) pairs. Returns a
+        dict mapping each pair to its list of drivers.
+    """
+
+    db = getDriversDB()
+    result = {}
+    for vendor_id, product_id in ids:
+        result[(vendor_id, product_id)] = _lookup(db, vendor_id, product_id,
+                                                  wildcard)
+
+    return result
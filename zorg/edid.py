@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import struct
+
+header = "\x00\xff\xff\xff\xff\xff\xff\x00"
+
+descriptorOffsets = (54, 72, 90, 108)
+
+TAG_NAME = 0xfc
+TAG_RANGE_LIMITS = 0xfd
+
+class EDID:
+    def __init__(self, data):
+        if len(data) < 128 or not data.startswith(header):
+            raise ValueError("Invalid EDID block")
+
+        mfg, = struct.unpack(">H", data[8:10])
+        self.vendor = "".join(chr(ord("A") + ((mfg >> shift) & 0x1f) - 1)
+                                for shift in (10, 5, 0))
+        self.product, self.serial = struct.unpack("<HI", data[10:16])
+        self.eisa_id = "%s%04X" % (self.vendor, self.product)
+
+        self.name = ""
+        self.hsync = ""
+        self.vref = ""
+
+        for offset in descriptorOffsets:
+            desc = data[offset:offset+18]
+            if desc[0:3] != "\x00\x00\x00":
+                continue
+
+            tag = ord(desc[3])
+            if tag == TAG_NAME:
+                self.name = desc[5:].split("\n")[0].strip()
+
+            elif tag == TAG_RANGE_LIMITS:
+                flags = ord(desc[4])
+                minV, maxV, minH, maxH = [ord(x) for x in desc[5:9]]
+
+                # EDID 1.4 range offsets
+                if flags & 0x02:
+                    maxV += 255
+                    if flags & 0x01:
+                        minV += 255
+                if flags & 0x08:
+                    maxH += 255
+                    if flags & 0x04:
+                        minH += 255
+
+                self.hsync = "%d-%d" % (minH, maxH)
+                self.vref = "%d-%d" % (minV, maxV)
+
+    def __repr__(self):
+        return "<EDID: %s %s>" % (self.eisa_id, self.name)
+
+def parseEDID(data):
+    try:
+        return EDID(data)
+    except ValueError:
+        return None
+
+def readEDID(path):
+    try:
+        f = open(path, "rb")
+        try:
+            data = f.read()
+        finally:
+            f.close()
+    except IOError:
+        return None
+
+    return parseEDID(data)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Hardware fingerprint of the last configuration.
+
+    The fingerprint covers everything xorg.conf generation depends on:
+    PCI IDs of the display devices, connected outputs and their EDID,
+    installed Xorg driver modules, the Xorg.Driver scripts of the
+    driver packages, DriversDB and the driver alias files. It is made
+    from sysfs and file stamps only, so checking it needs no COMAR
+    call. If it matches the one saved with the current xorg.conf,
+    reconfiguration can be skipped.
+"""
+
+import os
+import glob
+import hashlib
+
+from zorg import consts
+from zorg import driverinfo
+from zorg import driversdb
+from zorg import probe
+from zorg.probe import scanVideoDevices
+from zorg.utils import fileStamp, writeFile
+
+def deviceParts(sysroot):
+    return [(x.bus_id, x.vendor_id, x.product_id,
+             x.subvendor_id, x.subproduct_id) for x in scanVideoDevices(sysroot)]
+
+def outputParts(drmroot):
+    parts = []
+    for connector in sorted(glob.glob(os.path.join(drmroot, "card*-*"))):
+        try:
+            status = open(os.path.join(connector, "status")).read().strip()
+        except IOError:
+            status = ""
+
+        try:
+            edid = open(os.path.join(connector, "edid"), "rb").read()
+        except IOError:
+            edid = ""
+
+        parts.append((os.path.basename(connector), status,
+                      hashlib.sha1(edid).hexdigest()))
+
+    return parts
+
+def moduleParts(driversDir):
+    parts = []
+    try:
+        names = sorted(os.listdir(driversDir))
+    except OSError:
+        return parts
+
+    for name in names:
+        if name.endswith("_drv.so"):
+            parts.append((name, fileStamp(os.path.join(driversDir, name))))
+
+    return parts
+
+def computeFingerprint(sysroot=None, drmroot=None):
+    if drmroot is None:
+        drmroot = probe.drmdir
+
+    parts = (
+            deviceParts(sysroot),
+            outputParts(drmroot),
+            moduleParts(consts.drivers_dir),
+            driverinfo.scriptsStamp(),
+            fileStamp(consts.drivers_file),
+            fileStamp(consts.local_drivers_file),
+            driversdb.aliasesStamp(),
+            )
+
+    return hashlib.sha1(repr(parts)).hexdigest()
+
+def loadFingerprint():
+    """Return the saved (fingerprint, xorg.conf stamp) or None."""
+
+    try:
+        fields = open(consts.fingerprint_file).read().split()
+        return fields[0], (float(fields[1]), int(fields[2]))
+    except (IOError, IndexError, ValueError):
+        return None
+
+def saveFingerprint(fingerprint=None, **kwargs):
+    """Record the fingerprint of the hardware xorg.conf was made for."""
+
+    if fingerprint is None:
+        fingerprint = computeFingerprint(**kwargs)
+
+    stamp = fileStamp(consts.xorg_conf_file)
+    if stamp is None:
+        return
+
+    writeFile(consts.fingerprint_file, "%s %r %d\n" % (fingerprint,
+                                                        stamp[0], stamp[1]))
+
+def isUpToDate(**kwargs):
+    """
+        Return True if xorg.conf was generated for the current hardware
+        and has not been touched since. Keyword arguments are passed to
+        computeFingerprint().
+    """
+
+    saved = loadFingerprint()
+    if saved is None:
+        return False
+
+    fingerprint, stamp = saved
+    if fileStamp(consts.xorg_conf_file) != stamp:
+        return False
+
+    return computeFingerprint(**kwargs) == fingerprint
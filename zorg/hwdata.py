@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 
-import comar
-import zorg.probe
 from zorg import consts
+from zorg import driversdb
+from zorg import monitorsdb
+from zorg.inventory import getInventory
+from zorg.timing import timed
 from zorg.utils import *
 
 drivers = {
@@ -64,13 +66,9 @@ driverPackages = {
         "nvidia-current":   "xorg-video-nvidia-current"
         }
 
+@timed("hwdata.getCompatibleDriverNames")
 def getCompatibleDriverNames(vendor_id, product_id):
-    pci_id = vendor_id + product_id
-    drvlist = []
-    for line in loadFile(consts.drivers_file):
-        if line.startswith(pci_id):
-            drvlist = line.rstrip("\n").split(" ")[1:]
-            break
+    drvlist = driversdb.lookup(vendor_id, product_id)
 
     if "vesa" not in drvlist:
         drvlist.append("vesa")
@@ -80,12 +78,22 @@ def getCompatibleDriverNames(vendor_id, product_id):
 
     return drvlist
 
+# (inventory generation, driver names)
+_availableDrivers = None
+
+@timed("hwdata.getAvailableDriverNames")
 def getAvailableDriverNames():
+    global _availableDrivers
+
+    inventory = getInventory()
+    generation = inventory.update()
+    if _availableDrivers and _availableDrivers[0] == generation:
+        return list(_availableDrivers[1])
+
     drvlist = []
 
-    link = comar.Link()
-    availablePackages = list(link.Xorg.Driver)
-    availableDrivers = zorg.probe.listAvailableDrivers()
+    availablePackages = inventory.packages()
+    availableDrivers = sorted(inventory.modules())
 
     packages = [x.split(consts.package_sep) for x in drivers.keys() if consts.package_sep in x]
 
@@ -99,51 +107,28 @@ def getAvailableDriverNames():
             if drv in drvlist:
                 drvlist.remove(drv)
 
-    return drvlist
+    _availableDrivers = (generation, drvlist)
+    return list(drvlist)
 
+# (MonitorDB, generic monitors, vendor monitors)
+_monitorInfos = None
+
+@timed("hwdata.getMonitorInfos")
 def getMonitorInfos():
+    global _monitorInfos
+
+    db = monitorsdb.getMonitorDB()
+    if _monitorInfos and _monitorInfos[0] is db:
+        return dict(_monitorInfos[1]), dict(_monitorInfos[2])
+
     genericList = {}
     vendorList = {}
 
-    for line in loadFile(consts.monitors_file):
-        monitor = line.split(";")
-
-        if len(monitor) == 5:
-            monitor.append('0')
-
-        monitor = map(str.strip, monitor)
-
-        if len(monitor) == 6:
-            if "Generic" in monitor[0]:
-                if not monitor[0] in genericList:
-                    genericList[monitor[0]] = [{ "model":    monitor[1],
-                                                 "eisa_id":  monitor[2],
-                                                 "hsync":    monitor[3],
-                                                 "vref":     monitor[4],
-                                                 "is_dpms":  monitor[5]
-                                              }]
-                else:
-                    genericList[monitor[0]].extend([{"model":    monitor[1],
-                                                     "eisa_id":  monitor[2],
-                                                     "hsync":    monitor[3],
-                                                     "vref":     monitor[4],
-                                                     "is_dpms":  monitor[5]
-                                                    }])
-
-
-            elif not monitor[0] in vendorList:
-                vendorList[monitor[0]] = [{ "model":    monitor[1],
-                                            "eisa_id":  monitor[2],
-                                            "hsync":    monitor[3],
-                                            "vref":     monitor[4],
-                                            "is_dpms":  monitor[5]
-                                          }]
-            else:
-                vendorList[monitor[0]].extend([{"model":    monitor[1],
-                                                "eisa_id":  monitor[2],
-                                                "hsync":    monitor[3],
-                                                "vref":     monitor[4],
-                                                "is_dpms":  monitor[5]
-                                               }])
-
-    return genericList, vendorList
+    for vendor in db.vendors():
+        if "Generic" in vendor:
+            genericList[vendor] = db.byVendor(vendor)
+        else:
+            vendorList[vendor] = db.byVendor(vendor)
+
+    _monitorInfos = (db, genericList, vendorList)
+    return dict(genericList), dict(vendorList)
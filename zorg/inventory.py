@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""
+    In-memory inventory of installed Xorg drivers.
+
+    The set of *_drv.so modules is updated when the drivers directory
+    changes. Its mtime is checked on each query; long running processes
+    can set watchChanges to have it watched with pyinotify instead. The
+    list of installed Xorg.Driver packages is fetched again when the
+    registered Xorg.Driver scripts change, or at most every
+    packageInterval seconds if they can not be read.
+"""
+
+import os
+import time
+
+from zorg import consts
+from zorg import driverinfo
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+# Seconds between two checks of the installed Xorg.Driver packages
+packageInterval = 30
+
+# Watch the drivers directory with pyinotify. A watcher thread only
+# pays off in a long running process like zorg-daemon.
+watchChanges = False
+
+moduleSuffix = "_drv.so"
+
+if pyinotify:
+    class DirectoryHandler(pyinotify.ProcessEvent):
+        def my_init(self, inventory):
+            self.inventory = inventory
+
+        def process_default(self, event):
+            self.inventory.dirty = True
+
+class DriverInventory:
+    def __init__(self, driversDir=None, link=None, watch=None):
+        if driversDir is None:
+            driversDir = consts.drivers_dir
+
+        self.driversDir = driversDir
+        self.link = link
+
+        # Incremented whenever modules or packages change
+        self.generation = 0
+
+        self.dirty = True
+        self.dirStamp = None
+        self.moduleSet = frozenset()
+
+        self.packageList = ()
+        self.packagesChecked = None
+        self.scriptsStamp = None
+
+        if watch is None:
+            watch = watchChanges
+
+        self.notifier = None
+        if watch and pyinotify:
+            self.watch()
+
+    def watch(self):
+        wm = pyinotify.WatchManager()
+        mask = pyinotify.IN_CREATE | pyinotify.IN_DELETE | \
+               pyinotify.IN_MOVED_TO | pyinotify.IN_MOVED_FROM | \
+               pyinotify.IN_CLOSE_WRITE
+        wd = wm.add_watch(self.driversDir, mask, quiet=True)
+        if not wd or min(wd.values()) < 0:
+            return
+
+        self.notifier = pyinotify.ThreadedNotifier(wm,
+                                        DirectoryHandler(inventory=self))
+        self.notifier.setDaemon(True)
+        self.notifier.start()
+
+    def stop(self):
+        if self.notifier:
+            self.notifier.stop()
+            self.notifier = None
+
+    def updateModules(self):
+        if self.notifier:
+            if not self.dirty:
+                return
+        else:
+            try:
+                st = os.stat(self.driversDir)
+                stamp = (st.st_mtime, st.st_ino)
+            except OSError:
+                stamp = None
+
+            if stamp == self.dirStamp and not self.dirty:
+                return
+            self.dirStamp = stamp
+
+        self.dirty = False
+
+        try:
+            names = os.listdir(self.driversDir)
+        except OSError:
+            names = []
+
+        modules = frozenset(x[:-len(moduleSuffix)] for x in names
+                                if x.endswith(moduleSuffix))
+        if modules != self.moduleSet:
+            self.moduleSet = modules
+            self.generation += 1
+
+    def updatePackages(self):
+        now = time.time()
+        stamp = driverinfo.scriptsStamp()
+        if self.packagesChecked is not None:
+            if stamp is not None:
+                if stamp == self.scriptsStamp:
+                    return
+            elif now - self.packagesChecked < packageInterval:
+                return
+            driverinfo.invalidate()
+
+        self.packagesChecked = now
+        self.scriptsStamp = stamp
+
+        packages = tuple(sorted(driverinfo.getInstalledPackages(self.link)))
+        if packages != self.packageList:
+            self.packageList = packages
+            self.generation += 1
+
+    def modules(self):
+        """Return the set of installed driver module names."""
+
+        self.updateModules()
+        return self.moduleSet
+
+    def hasModule(self, name):
+        return name in self.modules()
+
+    def packages(self):
+        """Return the sorted tuple of installed Xorg.Driver packages."""
+
+        self.updatePackages()
+        return self.packageList
+
+    def update(self):
+        """Bring the inventory up to date and return its generation."""
+
+        self.updateModules()
+        self.updatePackages()
+        return self.generation
+
+_inventories = {}
+
+def getInventory(driversDir=None):
+    if driversDir is None:
+        driversDir = consts.drivers_dir
+
+    if driversDir not in _inventories:
+        _inventories[driversDir] = DriverInventory(driversDir)
+
+    return _inventories[driversDir]
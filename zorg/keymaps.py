@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Catalogue of XKB keyboard layouts and variants.
+
+    The catalogue is read from the XKB rules listing (rules/base.lst)
+    or, if there is none, from the files in the symbols directory. It
+    is built once and cached on the mtime of its source.
+"""
+
+import os
+import re
+
+from zorg import cache
+from zorg import consts
+from zorg.timing import timed
+
+rulesFiles = ("base.lst", "evdev.lst", "xorg.lst")
+
+symbolsRe = re.compile(r'xkb_symbols\s+"([^"]+)"')
+nameRe = re.compile(r'name\[Group1\]\s*=\s*"([^"]*)"')
+
+def emptyIndex():
+    return {"layouts": {}, "variants": {}}
+
+def parseRules(path):
+    """Parse the layout and variant sections of an XKB .lst file."""
+
+    index = emptyIndex()
+    section = None
+
+    try:
+        f = open(path)
+    except IOError:
+        return index
+
+    try:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+
+            if line.startswith("!"):
+                section = line[1:].strip()
+                continue
+
+            name, sep, desc = line.partition(" ")
+            desc = desc.strip()
+
+            if section == "layout":
+                index["layouts"][name] = desc
+                index["variants"].setdefault(name, [])
+
+            elif section == "variant":
+                layout, sep, desc = desc.partition(":")
+                index["variants"].setdefault(layout, []).append((name, desc.strip()))
+    finally:
+        f.close()
+
+    return index
+
+def parseSymbols(directory):
+    """
+        Build the index from XKB symbols files. The first symbols block
+        of a file is the layout itself, the others are its variants.
+        Files without any named block, e.g. modifier maps, are skipped.
+    """
+
+    index = emptyIndex()
+
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return index
+
+    for layout in names:
+        path = os.path.join(directory, layout)
+        if not os.path.isfile(path):
+            continue
+
+        try:
+            data = open(path).read()
+        except IOError:
+            continue
+
+        blocks = []
+        matches = list(symbolsRe.finditer(data))
+        for i, m in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(data)
+            name = nameRe.search(data, m.end(), end)
+            if name:
+                blocks.append((m.group(1), name.group(1)))
+
+        if not blocks:
+            continue
+
+        index["layouts"][layout] = blocks[0][1]
+        index["variants"][layout] = blocks[1:]
+
+    return index
+
+def catalogueSource():
+    """Return the rules listing if there is one, the symbols dir otherwise."""
+
+    for name in rulesFiles:
+        path = os.path.join(consts.xkb_rules_dir, name)
+        if os.path.exists(path):
+            return path
+
+    return consts.xkb_symbols_dir
+
+def buildCatalogue(source):
+    if os.path.isdir(source):
+        return parseSymbols(source)
+    return parseRules(source)
+
+class KeymapCatalogue:
+    def __init__(self, index):
+        self.index = index
+
+    def layouts(self):
+        return sorted(self.index["layouts"])
+
+    def description(self, layout, variant=""):
+        if variant:
+            for name, desc in self.index["variants"].get(layout, ()):
+                if name == variant:
+                    return desc
+            return None
+
+        return self.index["layouts"].get(layout)
+
+    def variants(self, layout):
+        """Return the (variant, description) list of a layout."""
+
+        return [tuple(x) for x in self.index["variants"].get(layout, ())]
+
+    def isValid(self, layout, variant=""):
+        if layout not in self.index["layouts"]:
+            return False
+
+        return not variant or \
+                variant in [x[0] for x in self.index["variants"].get(layout, ())]
+
+    def __len__(self):
+        return len(self.index["layouts"])
+
+_catalogue = None
+
+@timed("keymaps.getCatalogue")
+def getCatalogue():
+    global _catalogue
+
+    index = cache.cached("keymaps", catalogueSource(), buildCatalogue)
+    if _catalogue is None or _catalogue.index is not index:
+        _catalogue = KeymapCatalogue(index)
+
+    return _catalogue
+
+def languageKeymap(path):
+    """Return the default (layout, variant) of the language in path."""
+
+    from pardus.localedata import languages
+
+    try:
+        language = file(path).read().strip()
+    except IOError:
+        language = "en"
+
+    if not languages.has_key(language):
+        language = "en"
+
+    keymap = languages[language].keymaps[0]
+    return keymap.xkb_layout, keymap.xkb_variant
+
+def defaultKeymap():
+    """Return the (layout, variant) of the system language."""
+
+    return tuple(cache.cached("language-keymap", consts.language_file,
+                              languageKeymap))
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+import array
+import struct
+import marshal
+
+from zorg import cache
+from zorg import consts
+from zorg.utils import loadFile
+
+# Compiled file layout:
+#
+#   header   magic, version, index size, record count, source stamp
+#   index    marshalled dict of vendor, EISA ID and model prefix indexes
+#   offsets  one unsigned int per record, relative to the record area
+#   records  "vendor;model;eisa_id;hsync;vref;is_dpms\n" lines
+#
+# Only the header and the index are decoded when the file is opened.
+# Records are decoded from the memory-mapped file when accessed.
+
+MAGIC = "ZMDB"
+VERSION = 1
+
+headerFormat = "<4sIIIdQ"
+headerSize = struct.calcsize(headerFormat)
+
+prefixLength = 2
+
+recordKeys = ("model", "eisa_id", "hsync", "vref", "is_dpms")
+
+def parseLine(line):
+    monitor = line.split(";")
+
+    if len(monitor) == 5:
+        monitor.append("0")
+
+    if len(monitor) != 6:
+        return None
+
+    return map(str.strip, monitor)
+
+def buildMonitorsDB(source, stamp=None):
+    """Return the compiled form of the given MonitorsDB as a string."""
+
+    if stamp is None:
+        stamp = cache.sourceStamp(source) or (0, 0)
+
+    vendors = {}
+    vendorOrder = []
+    eisa = {}
+    prefixes = {}
+
+    offsets = array.array("I")
+    records = []
+    size = 0
+
+    for line in loadFile(source):
+        monitor = parseLine(line)
+        if monitor is None:
+            continue
+
+        n = len(offsets)
+        record = ";".join(monitor) + "\n"
+        offsets.append(size)
+        records.append(record)
+        size += len(record)
+
+        vendor = monitor[0]
+        if vendor not in vendors:
+            vendors[vendor] = []
+            vendorOrder.append(vendor)
+        vendors[vendor].append(n)
+
+        eisaId = monitor[2].upper()
+        if eisaId and eisaId != "0":
+            eisa.setdefault(eisaId, []).append(n)
+
+        prefix = monitor[1][:prefixLength].lower()
+        prefixes.setdefault(prefix, []).append(n)
+
+    index = marshal.dumps({
+        "vendors":  vendorOrder,
+        "vendor":   vendors,
+        "eisa":     eisa,
+        "prefix":   prefixes,
+        })
+
+    header = struct.pack(headerFormat, MAGIC, VERSION, len(index),
+                         len(offsets), stamp[0], stamp[1])
+
+    return "".join([header, index, offsets.tostring()] + records)
+
+def readHeader(buf):
+    if len(buf) < headerSize:
+        return None
+
+    header = struct.unpack(headerFormat, buf[:headerSize])
+    if header[0] != MAGIC or header[1] != VERSION:
+        return None
+
+    return header
+
+class MonitorList(object):
+    """
+        A read-only sequence of monitor dicts decoded on access. Every
+        access returns a new dict, and list() gives a list of them
+        which the caller may modify.
+    """
+
+    __slots__ = ("db", "records")
+
+    def __init__(self, db, records):
+        self.db = db
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return MonitorList(self.db, self.records[i])
+        return self.db.monitor(self.records[i])
+
+    def __iter__(self):
+        for n in self.records:
+            yield self.db.monitor(n)
+
+    def __eq__(self, other):
+        if isinstance(other, MonitorList):
+            return self.db is other.db and self.records == other.records
+        return list(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "<MonitorList: %d monitors>" % len(self.records)
+
+class MonitorDB:
+    def __init__(self, buf):
+        header = readHeader(buf)
+        if header is None:
+            raise ValueError("Invalid compiled MonitorsDB")
+
+        magic, version, indexSize, count, mtime, size = header
+        self.stamp = (mtime, size)
+        self.count = count
+        self.buf = buf
+
+        start = headerSize + indexSize
+        self.index = marshal.loads(buf[headerSize:start])
+        self.offsets = start
+        self.records = start + 4 * count
+
+    def __len__(self):
+        return self.count
+
+    def vendors(self):
+        return list(self.index["vendors"])
+
+    def fields(self, n):
+        off, = struct.unpack_from("<I", self.buf, self.offsets + 4 * n)
+        start = self.records + off
+        end = self.buf.find("\n", start)
+        return self.buf[start:end].split(";")
+
+    def monitor(self, n):
+        fields = self.fields(n)
+        return dict(zip(recordKeys, fields[1:]))
+
+    def monitors(self, records):
+        return MonitorList(self, records)
+
+    def byVendor(self, vendor):
+        return self.monitors(self.index["vendor"].get(vendor, []))
+
+    def byEisa(self, eisaId):
+        return self.monitors(self.index["eisa"].get(eisaId.upper(), []))
+
+    def searchModel(self, prefix):
+        prefix = prefix.lower()
+        index = self.index["prefix"]
+
+        if len(prefix) < prefixLength:
+            records = []
+            for key in sorted(index):
+                if key.startswith(prefix):
+                    records.extend(index[key])
+            records.sort()
+            return self.monitors(records)
+
+        records = index.get(prefix[:prefixLength], [])
+
+        if len(prefix) > prefixLength:
+            records = [n for n in records \
+                        if self.fields(n)[1].lower().startswith(prefix)]
+
+        return self.monitors(records)
+
+    def vendorOf(self, n):
+        return self.fields(n)[0]
+
+    def findEisa(self, eisaId):
+        """Return the first monitor with the given EISA ID, with its vendor."""
+
+        records = self.index["eisa"].get(eisaId.upper())
+        if not records:
+            return None
+
+        fields = self.fields(records[0])
+        monitor = dict(zip(recordKeys, fields[1:]))
+        monitor["vendor"] = fields[0]
+        return monitor
+
+def openMonitorDB(path, stamp):
+    try:
+        f = open(path, "rb")
+    except IOError:
+        return None
+
+    try:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (mmap.error, ValueError):
+            return None
+    finally:
+        f.close()
+
+    header = readHeader(buf)
+    if header is None or header[4:6] != stamp:
+        buf.close()
+        return None
+
+    return MonitorDB(buf)
+
+_db = {}
+
+def getMonitorDB(source=None):
+    """
+        Return a MonitorDB for the given MonitorsDB file.
+
+        The compiled form is kept under consts.cache_dir and rebuilt
+        when the source changes. If it cannot be written there, the
+        compiled form is kept in memory instead.
+    """
+
+    if source is None:
+        source = consts.monitors_file
+
+    stamp = cache.sourceStamp(source) or (0, 0)
+
+    db = _db.get(source)
+    if db and db.stamp == stamp:
+        return db
+
+    path = cache.cacheFile("MonitorsDB", source)
+    db = openMonitorDB(path, stamp)
+
+    if db is None:
+        data = buildMonitorsDB(source, stamp)
+        if cache.storeFile(path, data):
+            db = openMonitorDB(path, stamp)
+
+        if db is None:
+            db = MonitorDB(data)
+
+    _db[source] = db
+    return db
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Offline configuration of system images.
+
+    A hardware profile describes the video cards of a machine the way
+    config.json does, with the EDIDs of the connected monitors:
+
+        {
+            "name":     "sku-1234",
+            "keymap":   ["tr", "f"],
+            "cards":    [{
+                "bus_id":       "PCI:1:0:0",
+                "vendor_id":    "10de",
+                "product_id":   "0640",
+                "driver":       "nvidia",
+                "device_options": {"NoLogo": "true"},
+                "outputs":      [{
+                    "name":     "DVI-I-1",
+                    "mode":     "1680x1050",
+                    "edid":     "00ffffffffffff00...",
+                    }],
+                }],
+        }
+
+    Every profile gets its own tree with etc/X11/xorg.conf and the
+    zorg state files. Drivers, DriversDB, MonitorsDB and keymaps are
+    read from the image sysroot. The host's /sys, kernel options and
+    D-Bus are not used, so the Device options which driver packages
+    add are taken from the device_options of the cards.
+"""
+
+import os
+import time
+import json
+import traceback
+import multiprocessing
+
+from zorg import consts
+from zorg import driverinfo
+from zorg import driversdb
+from zorg.config import getConfigStore, buildXorgConfig, writeXorgConfig
+from zorg.edid import parseEDID
+from zorg.probe import VideoDevice, Monitor
+from zorg.state import deviceFromData, encodeStrings
+from zorg.utils import writeFile
+
+# consts read from the image
+sysrootPaths = ("drivers_file", "local_drivers_file", "monitors_file",
+                "pci_ids_file", "drivers_dir", "xkb_symbols_dir",
+                "xkb_rules_dir", "language_file", "enabled_package_file",
+                "aliases_root")
+
+# consts written for each profile
+targetPaths = ("xorg_conf_file", "config_dir", "config_file", "state_file",
+               "configured_bus_file", "fingerprint_file", "profile_file")
+
+def rooted(root, path):
+    return os.path.join(root, path.lstrip("/"))
+
+def useRoots(sysroot, target, cacheDir):
+    """
+        Point consts at the image and the profile tree. Returns the
+        previous values for restoreConsts().
+    """
+
+    saved = dict((name, getattr(consts, name))
+                    for name in sysrootPaths + targetPaths +
+                                ("cache_dir", "hashes_file"))
+
+    for name in sysrootPaths:
+        setattr(consts, name, rooted(sysroot, saved[name]))
+
+    for name in targetPaths:
+        setattr(consts, name, rooted(target, saved[name]))
+
+    # Caches are shared by the profiles and kept out of the image
+    consts.cache_dir = cacheDir
+    consts.hashes_file = os.path.join(cacheDir,
+                                      "hashes.%s" % os.path.basename(target))
+
+    return saved
+
+def restoreConsts(saved):
+    for name, value in saved.items():
+        setattr(consts, name, value)
+
+def loadProfiles(paths):
+    """
+        Read profiles from JSON files holding a profile or a list of
+        them, or from directories of such files.
+    """
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, x) for x in sorted(os.listdir(path))
+                                                if x.endswith(".json"))
+        else:
+            files.append(path)
+
+    profiles = []
+    for path in files:
+        f = open(path)
+        try:
+            data = encodeStrings(json.load(f))
+        finally:
+            f.close()
+
+        if isinstance(data, dict):
+            data = [data]
+
+        for n, profile in enumerate(data):
+            if "name" not in profile:
+                base = os.path.splitext(os.path.basename(path))[0]
+                profile["name"] = base if len(data) == 1 else "%s-%d" % (base, n)
+            profiles.append(profile)
+
+    return profiles
+
+def deviceFromProfile(data):
+    attrs = {
+            "vendor":           data["vendor_id"],
+            "device":           data["product_id"],
+            "subsystem_vendor": data.get("subvendor_id", ""),
+            "subsystem_device": data.get("subproduct_id", ""),
+            }
+    device = VideoDevice(busId=data["bus_id"], attrs=attrs)
+
+    state = dict(data)
+    state.setdefault("depth", 0)
+    deviceFromData(data["bus_id"], state, device)
+
+    for out in data.get("outputs", []):
+        if "edid" in out and out["name"] not in device.monitors:
+            edid = parseEDID(out["edid"].decode("hex"))
+            if edid:
+                mon = Monitor()
+                mon.setEDID(edid)
+                device.monitors[out["name"]] = mon
+
+    return device
+
+def chooseDriver(card, virtual=False):
+    """
+        Offline version of VideoDevice.preferredDriver(): the first
+        DriversDB driver which is in the image, or None to let the X
+        server decide.
+    """
+
+    if virtual:
+        return "fbdev"
+
+    for driver in driversdb.lookup(card.vendor_id, card.product_id,
+                                   wildcard=False):
+        if card.driverInfo(driver):
+            return driver
+
+    return None
+
+def checkName(name):
+    """Raise ValueError if name can not be used as a directory name."""
+
+    if not name or name == "." or "/" in name or ".." in name:
+        raise ValueError("Invalid profile name: %r" % name)
+
+def configureProfile(profile, sysroot, outdir):
+    """
+        Generate the configuration of a profile under outdir/<name>.
+        Returns a result dict, errors are reported in it.
+    """
+
+    start = time.time()
+    name = profile["name"]
+    target = os.path.join(outdir, name)
+    result = {"name": name, "target": target}
+
+    saved = useRoots(sysroot, target, os.path.join(outdir, ".cache"))
+    try:
+        try:
+            # Install time configuration of the packages can not run
+            driverinfo.setInfos(profile.get("driver_infos", {}))
+
+            cards = [deviceFromProfile(x) for x in profile["cards"]]
+            for card in cards:
+                if not card.driver:
+                    card.driver = chooseDriver(card, profile.get("virtual"))
+
+            for path in (consts.xorg_conf_file, consts.config_file):
+                directory = os.path.dirname(path)
+                if not os.path.exists(directory):
+                    os.makedirs(directory, 0755)
+
+            # The image may ship an xorg.conf to merge into
+            shipped = rooted(sysroot, saved["xorg_conf_file"])
+            if os.path.exists(shipped) and not os.path.exists(consts.xorg_conf_file):
+                writeFile(consts.xorg_conf_file, open(shipped).read())
+
+            deviceOptions = dict((x["bus_id"], x.get("device_options", {}))
+                                    for x in profile["cards"])
+            parser = buildXorgConfig(cards, profile.get("jail", False),
+                                     deviceOptions)
+
+            store = getConfigStore()
+            with store.batch():
+                writeXorgConfig(parser, cards, keepBackup=False)
+                for card in cards:
+                    store.setDevice(card)
+                if profile.get("keymap"):
+                    store.setKeymap(*profile["keymap"])
+
+            result["drivers"] = [(x.bus_id, x.driver) for x in cards]
+            result["ok"] = True
+
+        except Exception, e:
+            result["ok"] = False
+            result["error"] = "".join(traceback.format_exception_only(
+                                            e.__class__, e)).strip()
+    finally:
+        driverinfo.invalidate()
+        restoreConsts(saved)
+
+    result["time"] = time.time() - start
+    return result
+
+def _configure(args):
+    return configureProfile(*args)
+
+def configureProfiles(profiles, sysroot, outdir, jobs=None):
+    """
+        Configure many profiles in a process pool. Returns the results
+        in profile order.
+    """
+
+    names = [x["name"] for x in profiles]
+    for name in names:
+        checkName(name)
+    if len(set(names)) != len(names):
+        raise ValueError("Profile names are not unique")
+
+    tasks = [(x, sysroot, outdir) for x in profiles]
+
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+
+    if jobs <= 1 or len(tasks) <= 1:
+        return map(_configure, tasks)
+
+    pool = multiprocessing.Pool(min(jobs, len(tasks)))
+    try:
+        return pool.map(_configure, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+def main(args=None):
+    import optparse
+
+    parser = optparse.OptionParser(
+        usage="%prog [options] PROFILE.json|DIRECTORY...",
+        description="Generate xorg.conf and zorg state for hardware "
+                    "profiles of a system image.")
+    parser.add_option("-r", "--sysroot", default="/",
+        help="root of the system image [default: %default]")
+    parser.add_option("-o", "--output", default="profiles",
+        help="directory of the generated trees [default: %default]")
+    parser.add_option("-j", "--jobs", type="int", default=None,
+        help="number of worker processes [default: number of CPUs]")
+    parser.add_option("--json", action="store_true", default=False,
+        help="print the results as JSON")
+
+    opts, paths = parser.parse_args(args)
+    if not paths:
+        parser.error("no profiles given")
+
+    profiles = loadProfiles(paths)
+
+    start = time.time()
+    try:
+        results = configureProfiles(profiles, opts.sysroot, opts.output,
+                                    opts.jobs)
+    except ValueError, e:
+        parser.error(str(e))
+    wall = time.time() - start
+
+    failed = [x for x in results if not x["ok"]]
+
+    if opts.json:
+        print json.dumps({"results": results, "wall": wall}, indent=1)
+    else:
+        for result in results:
+            if result["ok"]:
+                status = ", ".join("%s %s" % (bus, driver or "auto")
+                                        for bus, driver in result["drivers"])
+            else:
+                status = "FAILED: %s" % result["error"]
+            print "%-24s %8.1f ms  %s" % (result["name"], result["time"] * 1000,
+                                          status)
+
+        print
+        print "%d profiles, %d failed, %.2f s" % (len(results), len(failed), wall)
+
+    return 1 if failed else 0
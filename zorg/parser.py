@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
 
+import re
+import warnings
+
+from zorg.timing import timed
+
 trueList = ("1", "on", "true", "yes", "enable")
 falseList = ("0", "off", "false", "no", "disable")
 
@@ -8,37 +13,57 @@ xBool = {True: "true", False: "false"}
 class unquoted(str):
     pass
 
+# Key of an entry, and the tokens after it
+keyRe = re.compile(r'\s*(\S+)')
+tokenRe = re.compile(r'\s*(?:"([^"]*)"|(")|(#)|(\S+))')
+
+class ParseError(Exception):
+    def __init__(self, message, lineno=None, column=None, filename=None):
+        Exception.__init__(self, message)
+        self.message = message
+        self.lineno = lineno
+        self.column = column
+        self.filename = filename
+
+    def __str__(self):
+        location = [str(x) for x in (self.filename, self.lineno, self.column)
+                        if x is not None]
+        if location:
+            return "%s: %s" % (":".join(location), self.message)
+        return self.message
+
+class ParseWarning(UserWarning):
+    pass
+
+def warn(message, lineno=None, column=None, filename=None):
+    """Report a line which is skipped."""
+
+    warnings.warn(str(ParseError(message, lineno, column, filename)),
+                  ParseWarning, stacklevel=3)
+
 class XorgEntry:
-    def __init__(self, line = ""):
-        line = line.strip()
-        if line == "":
+    def __init__(self, line = "", lineno = None):
+        self.lineno = lineno
+        self.column = None
+        self.values = []
+
+        m = keyRe.match(line)
+        if not m:
             self.key = ""
-            self.values = []
             return
 
-        v = line.split(None, 1)
-        self.key = v.pop(0)
-        if v:
-            line = v[0].strip()
-        else:
-            line = ""
+        self.key = m.group(1)
+        self.column = m.start(1) + 1
+        if self.key[0] == "#":
+            return
 
-        self.values = []
-        while line:
-            if line[0] == '"':
-                end = line.index('"', 1)
-                self.values.append(line[1:end])
-                line = line[end+1:].lstrip()
-            elif line[0] == "#":
-                break
-            else:
-                v = line.split(None, 1)
-                arg = v.pop(0)
-                if v:
-                    line = v[0].strip()
-                else:
-                    line = ""
+        for m in tokenRe.finditer(line, m.end()):
+            quoted, unterminated, comment, arg = m.groups()
+
+            if quoted is not None:
+                self.values.append(quoted)
 
+            elif arg is not None:
                 if arg[0] == "0" and len(arg) > 1:
                     self.values.append(unquoted(arg))
                 else:
@@ -47,6 +72,12 @@ class XorgEntry:
                     except ValueError:
                         self.values.append(unquoted(arg))
 
+            elif comment:
+                break
+
+            else:
+                raise ParseError("Unterminated string", lineno, m.start(2) + 1)
+
     def __str__(self):
         s = "%s\t%s" % (self.key, entryFormat(self.values))
         return s
@@ -55,34 +86,231 @@ class XorgEntry:
         return "<XorgEntry: %s>" % str(self)
 
 def entryFormat(values):
-    s = ""
+    s = []
     for v in values:
         if isinstance(v, basestring) and not isinstance(v, unquoted):
-            s += ' "%s"' % v
+            s.append(' "%s"' % v)
         else:
-            s += " %s" % v
+            s.append(" %s" % v)
+
+    return "".join(s).lstrip()
+
+def sectionLines(sect, dep):
+    indent = "\t" * dep
+
+    # Entries except 'Option'
+    for e in sect.entries:
+        yield "%s%s\t%s\n" % (indent, e.key, entryFormat(e.values))
+
+    # Options
+    for k, v in sect.options.items():
+        yield "%sOption\t%s\n" % (indent, entryFormat(["%s" % k, v]))
+
+    # Sub sections
+    for sec in sect.sections:
+        yield '%sSubSection "%s"\n' % (indent, sec.name)
+        for line in sectionLines(sec, dep + 1):
+            yield line
+        yield "%sEndSubSection\n" % indent
+
+def lowerKey(key):
+    if not isinstance(key, basestring):
+        key = str(key)
+    return key.lower()
+
+class OptionMap(dict):
+    """
+        Option name to value mapping. Like Xorg, it ignores the case of
+        option names. Keys keep the case they were first set with and
+        are iterated in insertion order.
+    """
+
+    __slots__ = ("_names", "_order")
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self)
+        self._names = {}
+        self._order = []
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        lower = lowerKey(key)
+        name = self._names.get(lower)
+        if name is None:
+            name = self._names[lower] = key
+            self._order.append(key)
+        dict.__setitem__(self, name, value)
+
+    def __getitem__(self, key):
+        try:
+            return dict.__getitem__(self, self._names[lowerKey(key)])
+        except KeyError:
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        try:
+            name = self._names.pop(lowerKey(key))
+        except KeyError:
+            raise KeyError(key)
+        self._order.remove(name)
+        dict.__delitem__(self, name)
+
+    def __contains__(self, key):
+        return lowerKey(key) in self._names
+
+    has_key = __contains__
+
+    def __iter__(self):
+        return iter(self._order)
+
+    iterkeys = __iter__
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self and default:
+            return default[0]
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        if not self._order:
+            raise KeyError("popitem(): dictionary is empty")
+        key = self._order[-1]
+        return key, self.pop(key)
+
+    def update(self, *args, **kwargs):
+        for other in args + (kwargs,):
+            if hasattr(other, "keys"):
+                for key in other.keys():
+                    self[key] = other[key]
+            else:
+                for key, value in other:
+                    self[key] = value
+
+    def clear(self):
+        dict.clear(self)
+        self._names.clear()
+        del self._order[:]
+
+    def copy(self):
+        return OptionMap(self)
+
+    def keys(self):
+        return list(self._order)
+
+    def values(self):
+        return [dict.__getitem__(self, x) for x in self._order]
+
+    def items(self):
+        return [(x, dict.__getitem__(self, x)) for x in self._order]
+
+    def itervalues(self):
+        for x in self._order:
+            yield dict.__getitem__(self, x)
+
+    def iteritems(self):
+        for x in self._order:
+            yield x, dict.__getitem__(self, x)
+
+    def __repr__(self):
+        return "{%s}" % ", ".join("%r: %r" % x for x in self.iteritems())
 
-    return s.lstrip()
+class EntryList(list):
+    """
+        The entries of a section, indexed by lowercase key on lookup.
+        Appending keeps the index up to date, any other change of the
+        list drops it.
+    """
+
+    __slots__ = ("_keys",)
+
+    def __init__(self, entries=()):
+        list.__init__(self, entries)
+        self._keys = None
+
+    def lookup(self, key):
+        if self._keys is None:
+            keys = {}
+            for entry in self:
+                keys.setdefault(entry.key.lower(), []).append(entry)
+            self._keys = keys
+
+        return self._keys.get(key.lower(), ())
+
+    def append(self, entry):
+        list.append(self, entry)
+        if self._keys is not None:
+            self._keys.setdefault(entry.key.lower(), []).append(entry)
+
+def _dropsIndex(name):
+    method = getattr(list, name)
+
+    def wrapper(self, *args, **kwargs):
+        self._keys = None
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    return wrapper
+
+for _name in ("__setitem__", "__delitem__", "__setslice__", "__delslice__",
+              "__iadd__", "__imul__", "extend", "insert", "pop", "remove",
+              "reverse", "sort"):
+    setattr(EntryList, _name, _dropsIndex(_name))
+
+class XorgSection(object):
+    __slots__ = ("name", "lineno", "column", "sections",
+                 "_entries", "_options")
 
-class XorgSection:
     def __init__(self, name):
         self.name = name
+        self.lineno = None
+        self.column = None
         self.sections = []
         self.entries = []
-        self.options = {}
+        self.options = OptionMap()
+
+    def _getEntries(self):
+        return self._entries
+
+    def _setEntries(self, entries):
+        self._entries = EntryList(entries)
+
+    entries = property(_getEntries, _setEntries)
+
+    def _getOptions(self):
+        return self._options
+
+    def _setOptions(self, options):
+        if not isinstance(options, OptionMap):
+            options = OptionMap(options)
+        self._options = options
+
+    options = property(_getOptions, _setOptions)
+
+    def _lookup(self, key):
+        return self._entries.lookup(key)
 
     def entry(self, key):
-        key = key.lower()
-        for entry in self.entries:
-            if entry.key.lower() == key:
-                return entry
+        entries = self._lookup(key)
+        if entries:
+            return entries[0]
         return None
 
     def __repr__(self):
         return "<XorgSection '%s'>" % self.name
 
     def getEntries(self, key):
-        return tuple(x for x in self.entries if x.key == key)
+        return tuple(self._lookup(key))
 
     def getSections(self, *names):
         return tuple(x for x in self.sections if x.name in names)
@@ -104,36 +332,62 @@ class XorgSection:
     def add(self, key, *values):
         entry = XorgEntry(key)
         entry.values = values
-        self.entries.append(entry)
+        self._entries.append(entry)
+
+    def remove(self, key):
+        """Remove all entries with the given key."""
+
+        key = key.lower()
+        self.entries = [x for x in self._entries if x.key.lower() != key]
 
 class XorgParser:
     def __init__(self):
         self.sections = []
 
+    @timed("parser.parseFile")
     def parseFile(self, filePath):
-        section = None
+        f = open(filePath)
+        try:
+            self.parse(f, filePath)
+        finally:
+            f.close()
+
+    @timed("parser.parse")
+    def parse(self, lines, filename=None):
+        """
+            Parse an iterable of lines, e.g. an open file. Raises
+            ParseError with the location of the offending line. Lines
+            outside of sections and extra EndSections are skipped with
+            a ParseWarning.
+        """
+
         stack = [self]
 
-        lines = file(filePath).readlines()
-        for line in lines:
-            e = XorgEntry(line)
-            key = e.key.lower()
+        try:
+            for lineno, line in enumerate(lines, 1):
+                e = XorgEntry(line, lineno)
+                key = e.key.lower()
+
+                if key == "" or key[0] == "#":
+                    continue
+
+                elif key in ("section", "subsection"):
+                    if not e.values:
+                        raise ParseError("Missing section name",
+                                         lineno, e.column)
 
-            if key == "" or key[0] == "#":
-                continue
+                    section = XorgSection(e.values[0])
+                    section.lineno = lineno
+                    section.column = e.column
+                    stack[-1].sections.append(section)
+                    stack.append(section)
 
-            elif key in ("section", "subsection"):
-                section = XorgSection(e.values[0])
-                stack[-1].sections.append(section)
-                stack.append(section)
+                elif len(stack) == 1:
+                    warn("%s outside of a section" % e.key,
+                         lineno, e.column, filename)
 
-            elif section:
-                if key in ("endsection", "endsubsection"):
+                elif key in ("endsection", "endsubsection"):
                     stack.pop()
-                    if stack:
-                        section = stack[-1]
-                    else:
-                        section = None
 
                 elif e.values and key == "option":
                     key = e.values.pop(0)
@@ -142,10 +396,14 @@ class XorgParser:
                     else:
                         value = "true"
 
-                    section.options[key] = value
+                    stack[-1].options[key] = value
 
                 else:
-                    section.entries.append(e)
+                    stack[-1].entries.append(e)
+
+        except ParseError, e:
+            e.filename = filename
+            raise
 
     def getSections(self, *names):
         secs = tuple(x for x in self.sections if x.name in names)
@@ -160,42 +418,24 @@ class XorgParser:
                 self.sections.append(sec)
             return secs # :)
 
-    def toString(self):
-        s = ""
-
-        def writeSection(sect, dep):
-            s = '%sSubSection "%s"\n' % ("\t" * dep, sect.name)
-
-            # Entries except 'Option'
-            for e in sect.entries:
-                s += "%s%s\t%s\n" % ("\t" * (dep+1), e.key, entryFormat(e.values))
-
-            # Options
-            for k, v in sect.options.items():
-                ent = XorgEntry('Option "%s"' % k)
-                ent.values.append(v)
-                s += "%s%s\n" % ("\t" * (dep+1), ent)
-
-            # Sub sections
-            for sec in sect.sections:
-                s += writeSection(sec, dep + 1)
-            s += "%sEndSubSection\n" % "\t" * dep
-            return s
+    def generate(self):
+        """Yield the lines of the configuration file."""
 
         for section in self.sections:
-            s += 'Section "%s"\n' % section.name
+            yield ('Section "%s"\n' % section.name).expandtabs(4)
 
-            for e in section.entries:
-                s += "\t%s\t%s\n" % (e.key, entryFormat(e.values))
+            for line in sectionLines(section, 1):
+                yield line.expandtabs(4)
 
-            for k, v in section.options.items():
-                ent = XorgEntry('Option "%s"' % k)
-                ent.values.append(v)
-                s += "\t%s\n" % ent
+            yield "EndSection\n\n"
 
-            for sec in section.sections:
-                s += writeSection(sec, 1)
+    @timed("parser.write")
+    def write(self, f):
+        """Write the configuration to the file-like object f."""
 
-            s += "EndSection\n\n"
+        for line in self.generate():
+            f.write(line)
 
-        return s.expandtabs(4)
+    @timed("parser.toString")
+    def toString(self):
+        return "".join(self.generate())
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+from zorg import cache
+from zorg import consts
+from zorg.timing import timed
+
+unknownCompany = "Unknown Company"
+unknownModel = "Unknown Model"
+
+def normalizeId(value):
+    value = value.lower()
+    if value.startswith("0x"):
+        value = value[2:]
+    return value
+
+@timed("pciids.buildIndex")
+def buildIndex(path):
+    """
+        Scan pci.ids once and return the byte offsets of vendor and
+        device class blocks.
+    """
+
+    vendors = {}
+    classes = {}
+
+    try:
+        f = open(path, "rb")
+    except IOError:
+        return {"vendors": vendors, "classes": classes}
+
+    offset = 0
+    for line in f:
+        if line[:1] not in ("\t", "#", "\n", ""):
+            if line.startswith("C "):
+                classes[line[2:4].lower()] = offset
+            else:
+                vendors[line[:4].lower()] = offset
+        offset += len(line)
+
+    f.close()
+    return {"vendors": vendors, "classes": classes}
+
+class PciIds:
+    def __init__(self, path):
+        self.path = path
+        self.index = cache.cached("pci.ids", path, buildIndex)
+        self.vendorBlocks = {}
+        self.classBlocks = {}
+
+    def readBlock(self, offset):
+        """Return the header line and the indented lines of a block."""
+
+        f = open(self.path, "rb")
+        try:
+            f.seek(offset)
+            head = f.readline()
+            lines = []
+            for line in f:
+                if line.startswith("\t"):
+                    lines.append(line)
+                elif line.strip() and not line.startswith("#"):
+                    break
+        finally:
+            f.close()
+
+        return head, lines
+
+    def parseBlock(self, head, lines, headSkip):
+        """
+            Parse a block into (name, {id: (name, {subid: name})}).
+
+            Second level keys are tuples of the whitespace separated
+            ids on the line, e.g. (subvendor, subdevice).
+        """
+
+        name = head[headSkip:].strip()
+        items = {}
+        current = None
+
+        for line in lines:
+            if line.startswith("\t\t"):
+                if current is None:
+                    continue
+                ids, sep, subName = line.strip().partition("  ")
+                current[tuple(ids.lower().split())] = subName.strip()
+            else:
+                itemId, sep, itemName = line.strip().partition("  ")
+                current = {}
+                items[itemId.lower()] = (itemName.strip(), current)
+
+        return name, items
+
+    def vendorBlock(self, vendor):
+        vendor = normalizeId(vendor)
+        if vendor not in self.vendorBlocks:
+            offset = self.index["vendors"].get(vendor)
+            if offset is None:
+                block = None
+            else:
+                head, lines = self.readBlock(offset)
+                block = self.parseBlock(head, lines, 4)
+            self.vendorBlocks[vendor] = block
+
+        return self.vendorBlocks[vendor]
+
+    def classBlock(self, classId):
+        if classId not in self.classBlocks:
+            offset = self.index["classes"].get(classId)
+            if offset is None:
+                block = None
+            else:
+                head, lines = self.readBlock(offset)
+                block = self.parseBlock(head, lines, 4)
+            self.classBlocks[classId] = block
+
+        return self.classBlocks[classId]
+
+    @timed("pciids.query")
+    def query(self, vendor, device, subvendor=None, subdevice=None):
+        """
+            Return (company, model) names of a device. If subsystem IDs
+            are given and known, the subsystem name is used as model.
+        """
+
+        block = self.vendorBlock(vendor)
+        if block is None:
+            return unknownCompany, unknownModel
+
+        company, devices = block
+        device = devices.get(normalizeId(device))
+        if device is None:
+            return company, unknownModel
+
+        model, subsystems = device
+        if subvendor and subdevice:
+            key = (normalizeId(subvendor), normalizeId(subdevice))
+            model = subsystems.get(key, model)
+
+        return company, model
+
+    def queryMany(self, ids):
+        """
+            Resolve many devices at once. ids is a sequence of
+            (vendor, device) or (vendor, device, subvendor, subdevice)
+            tuples. Returns a dict mapping each tuple to (company, model).
+        """
+
+        result = {}
+        for key in ids:
+            result[key] = self.query(*key)
+        return result
+
+    def className(self, classId):
+        """
+            Return the names of a device class, e.g. "0x030000" or
+            "0300", as a (class, subclass, programming interface) tuple.
+            Unknown parts are empty strings.
+        """
+
+        classId = normalizeId(classId)
+        names = ["", "", ""]
+
+        block = self.classBlock(classId[:2])
+        if block is None:
+            return tuple(names)
+
+        names[0], subclasses = block
+        subclass = subclasses.get(classId[2:4])
+        if subclass:
+            names[1], progifs = subclass
+            names[2] = progifs.get((classId[4:6],), "")
+
+        return tuple(names)
+
+_ids = {}
+
+def getPciIds(path=None):
+    if path is None:
+        path = consts.pci_ids_file
+
+    stamp = cache.sourceStamp(path)
+    entry = _ids.get(path)
+    if entry is None or entry[0] != stamp:
+        entry = (stamp, PciIds(path))
+        _ids[path] = entry
+
+    return entry[1]
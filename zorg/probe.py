@@ -1,14 +1,20 @@
 # -*- coding: utf-8 -*-
 
 import os
-import dbus
 import glob
 
-import comar
 from zorg import consts
+from zorg import driversdb
+from zorg import monitorsdb
+from zorg.driverinfo import getDriverInfos
+from zorg.edid import readEDID
+from zorg.inventory import getInventory
+from zorg.keymaps import getCatalogue
+from zorg.timing import timed
 from zorg.utils import *
 
 sysdir = "/sys/bus/pci/devices/"
+drmdir = "/sys/class/drm"
 
 class Output:
     def __init__(self, name):
@@ -61,7 +67,14 @@ class Output:
             self.below = ""
 
 class VideoDevice:
-    def __init__(self, deviceDir=None, busId=None):
+    def __init__(self, deviceDir=None, busId=None, attrs=None):
+        """
+            Create a device from its sysfs directory name or X bus ID.
+
+            attrs is a dict of already read sysfs attributes as
+            returned by readPciAttrs(). If not given, they are read.
+        """
+
         if deviceDir:
             self.bus = tuple(int(x, 16) for x in deviceDir.replace(".",":").split(":"))[1:4]
         else:
@@ -69,9 +82,19 @@ class VideoDevice:
             deviceDir = "0000:%02x:%02x.%x" % self.bus
 
         self.bus_id = "PCI:%d:%d:%d" % self.bus
-
-        self.vendor_id  = lremove(pciInfo(deviceDir, "vendor"), "0x").lower()
-        self.product_id = lremove(pciInfo(deviceDir, "device"), "0x").lower()
+        self.sys_name = deviceDir
+
+        if attrs is None:
+            attrs = readPciAttrs(os.path.join(sysdir, deviceDir))
+            if "vendor" not in attrs or "device" not in attrs:
+                raise IOError("No such PCI device: %s" % deviceDir)
+
+        self.vendor_id  = lremove(attrs["vendor"], "0x").lower()
+        self.product_id = lremove(attrs["device"], "0x").lower()
+        self.subvendor_id  = lremove(attrs.get("subsystem_vendor", ""), "0x").lower()
+        self.subproduct_id = lremove(attrs.get("subsystem_device", ""), "0x").lower()
+        self.class_id = lremove(attrs.get("class", ""), "0x").lower()
+        self.boot_vga = attrs.get("boot_vga", "").startswith("1")
         self.saved_vendor_id  = None
         self.saved_product_id = None
 
@@ -87,26 +110,17 @@ class VideoDevice:
         if driver is None:
             return {}
 
-        link = comar.Link()
-        packages = list(link.Xorg.Driver)
-        for package in packages:
-            try:
-                info = link.Xorg.Driver[package].getInfo()
-            except dbus.DBusException:
-                continue
-            alias = str(info["alias"])
-            if alias == driver:
-                info["package"] = package
-                return info
+        info = getDriverInfos().get(driver)
+        if info:
+            return dict(info)
+        elif driverExists(driver):
+            info = {
+                    "alias":        driver,
+                    "xorg-module":  driver,
+                    }
+            return info
         else:
-            if driverExists(driver):
-                info = {
-                        "alias":        driver,
-                        "xorg-module":  driver,
-                        }
-                return info
-            else:
-                return {}
+            return {}
 
     def setDriver(self, driver):
         """
@@ -124,6 +138,7 @@ class VideoDevice:
         package = self.driverInfo().get("package")
         oldpackage = enabledPackage()
         if package != oldpackage:
+            import comar
             link = comar.Link()
             if oldpackage and oldpackage.replace("-", "_") in list(link.Xorg.Driver):
                 link.Xorg.Driver[oldpackage].disable(timeout=2**16-1)
@@ -135,15 +150,35 @@ class VideoDevice:
         if isVirtual():
             return "fbdev" if os.path.exists("/dev/fb0") else None
 
-        cardId = self.vendor_id + self.product_id
-        for line in loadFile(consts.drivers_file):
-            if line.startswith(cardId):
-                driver = line.split()[1]
-                if installed:
-                    drvInfo = self.driverInfo(driver)
-                    if not drvInfo:
-                        return None
-                return driver
+        drivers = driversdb.lookup(self.vendor_id, self.product_id,
+                                   wildcard=False)
+        if drivers:
+            driver = drivers[0]
+            if installed:
+                drvInfo = self.driverInfo(driver)
+                if not drvInfo:
+                    return None
+            return driver
+
+    def probeMonitors(self, drmroot=None):
+        """
+            Detect connected monitors from their EDID data, and give
+            the first one to the "default" output.
+
+            DRM connector names like "DVI-I-1" are not the output names
+            of the X driver, which differ between drivers, so detected
+            monitors are not given to other outputs. A monitor picked
+            by the user is left untouched, a detected one, i.e. one
+            which has an EISA ID, is replaced.
+        """
+
+        detected = probeMonitors(self.sys_name, drmroot)
+
+        default = self.monitors.get("default")
+        if detected and (default is None or default.eisa_id):
+            self.monitors["default"] = detected[sorted(detected)[0]]
+
+        return detected
 
     def isChanged(self):
         if self.saved_vendor_id and self.saved_product_id:
@@ -156,35 +191,125 @@ class Monitor:
         self.model = "Default Monitor"
         self.hsync = "31.5-50"
         self.vref = "50-70"
+        self.eisa_id = ""
+
+    def setEDID(self, edid):
+        """Fill in monitor info from EDID, preferring MonitorsDB entries."""
+
+        self.eisa_id = edid.eisa_id
+
+        info = monitorsdb.getMonitorDB().findEisa(edid.eisa_id)
+        if info:
+            self.vendor = info["vendor"]
+            self.model  = info["model"]
+            self.hsync  = info["hsync"]
+            self.vref   = info["vref"]
+        else:
+            self.vendor = edid.vendor
+            self.model  = edid.name or edid.eisa_id
+            self.hsync  = edid.hsync or self.hsync
+            self.vref   = edid.vref or self.vref
 
 def pciInfo(dev, attr):
     return sysValue(sysdir, dev, attr)
 
+pciAttrs = ("class", "vendor", "device",
+            "subsystem_vendor", "subsystem_device", "boot_vga")
+
+def readPciAttrs(path, names=pciAttrs):
+    attrs = {}
+    for attr in names:
+        try:
+            f = open(os.path.join(path, attr))
+            try:
+                attrs[attr] = f.read().strip()
+            finally:
+                f.close()
+        except IOError:
+            pass
+
+    return attrs
+
+@timed("probe.scanVideoDevices")
+def scanVideoDevices(sysroot=None):
+    """
+        Return VideoDevice objects of all display controllers (PCI class
+        0x03xxxx) in bus order, reading each device directory once.
+
+        sysroot is the sysfs mount point, /sys by default.
+    """
+
+    if sysroot is None:
+        devicesDir = sysdir
+    else:
+        devicesDir = os.path.join(sysroot, "bus/pci/devices")
+
+    try:
+        names = sorted(os.listdir(devicesDir))
+    except OSError:
+        return []
+
+    devices = []
+    for name in names:
+        path = os.path.join(devicesDir, name)
+
+        # Class is read first to skip other devices early
+        attrs = readPciAttrs(path, pciAttrs[:1])
+        if not attrs.get("class", "").startswith("0x03"):
+            continue
+
+        attrs.update(readPciAttrs(path, pciAttrs[1:]))
+        if "vendor" in attrs and "device" in attrs:
+            devices.append(VideoDevice(deviceDir=name, attrs=attrs))
+
+    return devices
+
+@timed("probe.probeMonitors")
+def probeMonitors(device, drmroot=None):
+    """
+        Return a dict of Monitor objects, keyed by DRM connector name,
+        for the connectors of the given PCI device which report an EDID.
+    """
+
+    if drmroot is None:
+        drmroot = drmdir
+
+    monitors = {}
+    for connector in glob.glob(os.path.join(drmroot, "card*-*")):
+        cardName, output = os.path.basename(connector).split("-", 1)
+
+        link = os.path.join(drmroot, cardName, "device")
+        if os.path.basename(os.path.realpath(link)) != device:
+            continue
+
+        edid = readEDID(os.path.join(connector, "edid"))
+        if edid:
+            mon = Monitor()
+            mon.setEDID(edid)
+            monitors[output] = mon
+
+    return monitors
+
 def getKeymapList():
-    return os.listdir(consts.xkb_symbols_dir)
+    return getCatalogue().layouts()
 
 def driverExists(name):
-    return os.path.exists(os.path.join(consts.drivers_dir, "%s_drv.so" % name))
+    return getInventory().hasModule(name)
 
-def listAvailableDrivers(d = consts.drivers_dir):
-    a = []
-    if os.path.exists(d):
-        for drv in os.listdir(d):
-            if drv.endswith("_drv.so"):
-                if drv[:-7] not in a:
-                    a.append(drv[:-7])
-    return a
+@timed("probe.listAvailableDrivers")
+def listAvailableDrivers(d = None):
+    return sorted(getInventory(d).modules())
 
 def enabledPackage():
     try:
-        return file("/var/lib/zorg/enabled_package").read()
+        return file(consts.enabled_package_file).read()
     except IOError:
         return None
 
-def getPrimaryCard():
-    for boot_vga in glob.glob("%s/*/boot_vga" % sysdir):
-        if open(boot_vga).read().startswith("1"):
-            dev_path = os.path.dirname(boot_vga)
-            return os.path.basename(dev_path)
+@timed("probe.getPrimaryCard")
+def getPrimaryCard(sysroot=None):
+    for device in scanVideoDevices(sysroot):
+        if device.boot_vga:
+            return device.sys_name
 
     return None
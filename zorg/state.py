@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Persisted device state.
+
+    The state is kept in two formats. config.xml is the historical
+    format read by older tools. config.json is a versioned sidecar
+    which can be loaded without an XML parser. Both are written on
+    every save, and the sidecar records the mtime and size of the
+    config.xml it was written with. If config.xml changes behind its
+    back, the sidecar is ignored and the state is migrated from XML
+    again.
+"""
+
+import json
+
+from zorg.probe import VideoDevice, Monitor, Output
+from zorg.timing import timed
+
+STATE_VERSION = 1
+
+outputFields = (
+    ("Mode",        "mode"),
+    ("RefreshRate", "refresh_rate"),
+    ("Rotation",    "rotation"),
+    ("RightOf",     "right_of"),
+    ("Below",       "below"),
+    )
+
+monitorFields = (
+    ("Vendor",      "vendor"),
+    ("Model",       "model"),
+    ("HorizSync",   "hsync"),
+    ("VertRefresh", "vref"),
+    ("EisaId",      "eisa_id"),
+    )
+
+class State:
+    def __init__(self):
+        # bus IDs in saved order
+        self.order = []
+        # bus ID -> card data
+        self.cards = {}
+        # (layout, variant) or None
+        self.keyboard = None
+        # (name, identifier) of the xorg.conf sections zorg generated
+        self.sections = []
+        # (name, identifier) -> (entry keys, option names) zorg
+        # generated in the section, in lower case
+        self.sectionKeys = {}
+        # XML of the top level elements zorg does not know
+        self.extra = []
+
+    def setCard(self, busId, data):
+        if busId not in self.cards:
+            self.order.append(busId)
+        else:
+            # Keep the elements which other tools saved for the card
+            old = self.cards[busId]
+            if old.get("extra") and "extra" not in data:
+                data = dict(data, extra=old["extra"])
+        self.cards[busId] = data
+
+def deviceData(card):
+    """Return the plain data saved for a VideoDevice."""
+
+    outputs = []
+    for name, output in card.outputs.items():
+        out = {
+                "name":     name,
+                "enabled":  output.enabled,
+                "ignored":  output.ignored,
+                }
+        for tag, attr in outputFields:
+            if getattr(output, attr):
+                out[attr] = getattr(output, attr)
+
+        if name in card.monitors:
+            mon = card.monitors[name]
+            out["monitor"] = dict((attr, getattr(mon, attr))
+                                    for tag, attr in monitorFields)
+
+        outputs.append(out)
+
+    return {
+            "vendor_id":    card.vendor_id,
+            "product_id":   card.product_id,
+            "driver":       card.driver,
+            "depth":        card.depth,
+            "outputs":      outputs,
+            }
+
+def deviceFromData(busId, data, device=None):
+    """
+        Return a VideoDevice with the saved data. If device is not
+        given, it is created from sysfs.
+    """
+
+    if device is None:
+        device = VideoDevice(busId=busId)
+
+    device.saved_vendor_id  = data.get("vendor_id")
+    device.saved_product_id = data.get("product_id")
+
+    if data.get("driver"):
+        device.driver = data["driver"]
+
+    if data.get("depth"):
+        device.depth = int(data["depth"])
+
+    for out in data.get("outputs", []):
+        name = out["name"]
+        output = Output(name)
+        device.outputs[name] = output
+
+        output.setEnabled(out.get("enabled", True))
+        if out.get("ignored"):
+            output.setIgnored(True)
+
+        output.setMode(out.get("mode", ""), out.get("refresh_rate", ""))
+
+        if out.get("rotation"):
+            output.setOrientation(out["rotation"])
+
+        if out.get("right_of"):
+            output.setPosition("RightOf", out["right_of"])
+        elif out.get("below"):
+            output.setPosition("Below", out["below"])
+
+        if "monitor" in out:
+            mon = Monitor()
+            mon.vendor = out["monitor"].get("vendor") or ""
+            mon.model  = out["monitor"].get("model") or "Unknown Monitor"
+            mon.hsync  = out["monitor"].get("hsync") or mon.hsync
+            mon.vref   = out["monitor"].get("vref") or mon.vref
+            mon.eisa_id = out["monitor"].get("eisa_id") or ""
+            device.monitors[name] = mon
+
+    return device
+
+# XML format
+
+# Elements which are read into the state. The others are kept as XML
+# and written back as they are.
+knownTags = ("Card", "Keyboard")
+knownCardTags = ("VendorId", "ProductId", "Driver", "ActiveConfig", "Depth",
+                 "Outputs")
+
+def addTag(p, name, data):
+    t = p.insertTag(name)
+    t.insertData(data)
+
+def unknownTags(tag, known):
+    return [x.toString() for x in tag.tags() if x.name() not in known]
+
+def insertTags(p, extra):
+    import piksemel
+
+    for data in extra:
+        p.insertNode(piksemel.parseString(data))
+
+def cardFromTag(cardTag):
+    data = {
+            "vendor_id":    cardTag.getTagData("VendorId"),
+            "product_id":   cardTag.getTagData("ProductId"),
+            "driver":       cardTag.getTagData("Driver"),
+            "depth":        0,
+            "outputs":      [],
+            }
+
+    activeConfigTag = cardTag.getTag("ActiveConfig")
+    if not data["driver"] and activeConfigTag:
+        data["driver"] = activeConfigTag.getTagData("Driver")
+
+    depth = cardTag.getTagData("Depth")
+    if depth:
+        data["depth"] = int(depth)
+
+    outputsTag = cardTag.getTag("Outputs")
+    if outputsTag:
+        for outputTag in outputsTag.tags("Output"):
+            out = {"name": outputTag.getAttribute("name")}
+
+            enabled = outputTag.getTagData("Enabled")
+            if enabled:
+                out["enabled"] = enabled == "true"
+            ignored = outputTag.getTagData("Ignored")
+            if ignored:
+                out["ignored"] = ignored == "true"
+
+            for tag, attr in outputFields:
+                value = outputTag.getTagData(tag)
+                if value:
+                    out[attr] = value
+
+            monitorTag = outputTag.getTag("Monitor")
+            if monitorTag:
+                out["monitor"] = dict((attr, monitorTag.getTagData(tag))
+                                        for tag, attr in monitorFields)
+
+            data["outputs"].append(out)
+
+    extra = unknownTags(cardTag, knownCardTags)
+    if extra:
+        data["extra"] = extra
+
+    return data
+
+@timed("state.readXML")
+def readXML(path):
+    """Return the State saved in config.xml, or None if it is missing."""
+
+    import piksemel
+
+    try:
+        doc = piksemel.parse(path)
+    except OSError:
+        return None
+
+    state = State()
+    for tag in doc.tags("Card"):
+        busId = tag.getAttribute("busId")
+        if busId not in state.cards:
+            state.setCard(busId, cardFromTag(tag))
+
+    keyboard = doc.getTag("Keyboard")
+    if keyboard:
+        layout = keyboard.getTagData("Layout")
+        if layout:
+            state.keyboard = (layout, keyboard.getTagData("Variant") or "")
+
+    state.extra = unknownTags(doc, knownTags)
+
+    return state
+
+def xmlString(state):
+    import piksemel
+
+    doc = piksemel.newDocument("ZORG")
+
+    for busId in state.order:
+        data = state.cards[busId]
+
+        cardTag = doc.insertTag("Card")
+        cardTag.setAttribute("busId", busId)
+
+        addTag(cardTag, "VendorId", data["vendor_id"])
+        addTag(cardTag, "ProductId", data["product_id"])
+
+        if data["driver"]:
+            addTag(cardTag, "Driver", data["driver"])
+
+        if data["depth"]:
+            addTag(cardTag, "Depth", str(data["depth"]))
+
+        # Save output info
+        outputs = cardTag.insertTag("Outputs")
+        for out in data["outputs"]:
+            outputTag = outputs.insertTag("Output")
+            outputTag.setAttribute("name", out["name"])
+            addTag(outputTag, "Enabled",
+                    "true" if out.get("enabled", True) else "false")
+            addTag(outputTag, "Ignored",
+                    "true" if out.get("ignored") else "false")
+
+            for tag, attr in outputFields:
+                if out.get(attr):
+                    addTag(outputTag, tag, out[attr])
+
+            if "monitor" in out:
+                monitor = outputTag.insertTag("Monitor")
+                for tag, attr in monitorFields:
+                    addTag(monitor, tag, out["monitor"].get(attr) or "")
+
+        insertTags(cardTag, data.get("extra", []))
+
+    if state.keyboard:
+        layout, variant = state.keyboard
+        keyboardTag = doc.insertTag("Keyboard")
+        keyboardTag.insertTag("Layout").insertData(layout)
+        if variant:
+            keyboardTag.insertTag("Variant").insertData(variant)
+
+    insertTags(doc, state.extra)
+
+    return doc.toPrettyString().replace("\n\n", "")
+
+# JSON sidecar
+
+def encodeStrings(obj):
+    # json gives unicode strings, the rest of zorg uses utf-8 str
+    if isinstance(obj, unicode):
+        return obj.encode("utf-8")
+    elif isinstance(obj, list):
+        return [encodeStrings(x) for x in obj]
+    elif isinstance(obj, dict):
+        return dict((encodeStrings(k), encodeStrings(v))
+                        for k, v in obj.iteritems())
+    return obj
+
+@timed("state.readJSON")
+def readJSON(path, xmlStamp):
+    """
+        Return the State saved in the sidecar, or None if it is missing,
+        of another version or was not written with the given config.xml
+        stamp. A None stamp, i.e. a missing config.xml, never matches.
+    """
+
+    try:
+        f = open(path)
+        try:
+            data = json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return None
+
+    if data.get("version") != STATE_VERSION:
+        return None
+
+    if xmlStamp is None or data.get("xml") != list(xmlStamp):
+        return None
+
+    data = encodeStrings(data)
+
+    state = State()
+    for card in data["cards"]:
+        state.setCard(card.pop("bus_id"), card)
+
+    if data.get("keyboard"):
+        state.keyboard = tuple(data["keyboard"])
+
+    state.sections = [tuple(x) for x in data.get("sections", [])]
+    state.sectionKeys = dict(((x[0], x[1]), (tuple(x[2]), tuple(x[3])))
+                                for x in data.get("section_keys", []))
+    state.extra = data.get("extra", [])
+
+    return state
+
+def jsonString(state, xmlStamp=None):
+    cards = []
+    for busId in state.order:
+        card = dict(state.cards[busId])
+        card["bus_id"] = busId
+        cards.append(card)
+
+    data = {
+            "version":  STATE_VERSION,
+            "xml":      xmlStamp and list(xmlStamp),
+            "cards":    cards,
+            "keyboard": state.keyboard and list(state.keyboard),
+            "sections": [list(x) for x in state.sections],
+            "section_keys": sorted([name, identifier, list(keys[0]), list(keys[1])]
+                                for (name, identifier), keys
+                                    in state.sectionKeys.items()),
+            "extra":    state.extra,
+            }
+
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Opt-in timing of the configuration pipeline.
+
+    Timing is off by default and costs one flag check per instrumented
+    call. It is turned on by setting ZORG_PROFILE=1 in the environment,
+    by booting with xorg=profile, or by calling enable(). While it is
+    on, the wall time and number of calls of every stage are recorded
+    and saved as JSON to consts.profile_file when the process exits.
+"""
+
+import os
+import sys
+import time
+import atexit
+import threading
+
+from contextlib import contextmanager
+from functools import wraps
+
+from zorg import consts
+
+REPORT_VERSION = 1
+
+envVariable = "ZORG_PROFILE"
+cmdlineFile = "/proc/cmdline"
+
+_enabled = None
+_started = None
+_stats = {}
+_lock = threading.Lock()
+
+def _detect():
+    if os.environ.get(envVariable, "") not in ("", "0"):
+        return True
+
+    # Read the command line directly, this runs on every start
+    try:
+        args = open(cmdlineFile).read().split()
+    except IOError:
+        return False
+
+    for arg in args:
+        if arg.startswith("xorg=") and "profile" in arg[5:].split(","):
+            return True
+
+    return False
+
+def isEnabled():
+    if _enabled is None:
+        enable(_detect())
+    return _enabled
+
+def enable(on=True, save=True):
+    """
+        Turn timing on or off. If save is True, the report is written
+        when the process exits.
+    """
+
+    global _enabled, _started
+
+    if on and not _enabled:
+        _started = time.time()
+        if save:
+            atexit.register(saveReport)
+
+    _enabled = on
+
+def record(name, elapsed):
+    _lock.acquire()
+    try:
+        stat = _stats.get(name)
+        if stat is None:
+            _stats[name] = [1, elapsed, elapsed]
+        else:
+            stat[0] += 1
+            stat[1] += elapsed
+            if elapsed > stat[2]:
+                stat[2] = elapsed
+    finally:
+        _lock.release()
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as a call of stage name."""
+
+    if not isEnabled():
+        yield
+        return
+
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(name, time.time() - start)
+
+def timed(name):
+    """Decorator timing every call of a function as stage name."""
+
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not isEnabled():
+                return func(*args, **kwargs)
+
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.time() - start)
+
+        return wrapper
+
+    return decorate
+
+def reset():
+    _lock.acquire()
+    try:
+        _stats.clear()
+    finally:
+        _lock.release()
+
+def report():
+    """
+        Return the recorded timings as a dict. Stage times are in
+        seconds and include the time spent in nested stages.
+    """
+
+    _lock.acquire()
+    try:
+        stages = dict((name, {
+                        "calls":    stat[0],
+                        "total":    round(stat[1], 6),
+                        "max":      round(stat[2], 6),
+                        }) for name, stat in _stats.items())
+    finally:
+        _lock.release()
+
+    return {
+            "version":  REPORT_VERSION,
+            "pid":      os.getpid(),
+            "command":  " ".join(sys.argv),
+            "started":  _started,
+            "wall":     _started and round(time.time() - _started, 6),
+            "stages":   stages,
+            }
+
+def saveReport(path=None):
+    """Write the report as JSON. Nothing is written if it is empty."""
+
+    if path is None:
+        path = consts.profile_file
+
+    if not _stats:
+        return False
+
+    import json
+    from zorg.utils import syncWrite
+
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, 0755)
+        syncWrite(path, json.dumps(report(), sort_keys=True, indent=1))
+    except (IOError, OSError):
+        return False
+
+    return True
+
+def loadReport(path=None):
+    import json
+
+    if path is None:
+        path = consts.profile_file
+
+    try:
+        f = open(path)
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return None
+
+def formatReport(data):
+    """Return a report as a table sorted by total time."""
+
+    lines = []
+    if data.get("command"):
+        lines.append("Command: %s" % data["command"])
+    if data.get("started"):
+        lines.append("Started: %s" % time.ctime(data["started"]))
+    if data.get("wall") is not None:
+        lines.append("Wall time: %.3f s" % data["wall"])
+
+    lines.append("%-40s %8s %10s %10s" % ("Stage", "Calls", "Total ms", "Max ms"))
+
+    stages = sorted(data.get("stages", {}).items(),
+                    key=lambda x: x[1]["total"], reverse=True)
+    for name, stat in stages:
+        lines.append("%-40s %8d %10.2f %10.2f" % (name, stat["calls"],
+                                                  stat["total"] * 1000,
+                                                  stat["max"] * 1000))
+
+    return "\n".join(lines)
@@ -1,9 +1,17 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
+import Queue
+import shutil
+import marshal
+import hashlib
+import tempfile
+import threading
 import subprocess
 
-from pardus.sysutils import get_kernel_option
+from zorg import consts
+from zorg.pciids import getPciIds
 
 xorg_lock = "/tmp/.X0-lock"
 
@@ -45,7 +53,7 @@ def backup(_file):
 
         try:
             os.rename(src, new_name)
-        except IOError:
+        except OSError:
             pass
 
 
@@ -53,10 +61,153 @@ def backup(_file):
         backup_file = "%s-backup" % _file
         if os.path.exists(backup_file):
             rename_backup(backup_file, 2)
+        # Link or copy instead of renaming, so that the file never
+        # disappears while a new version is being written.
         try:
-            os.rename(_file, backup_file)
-        except IOError:
-            pass
+            os.link(_file, backup_file)
+        except OSError:
+            tmp = "%s.tmp" % backup_file
+            try:
+                shutil.copy2(_file, tmp)
+                os.rename(tmp, backup_file)
+            except (IOError, OSError):
+                unlink(tmp)
+
+def fileStamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+def hasData(path, data):
+    """Return True if the file at path holds exactly data."""
+
+    try:
+        f = open(path, "rb")
+    except IOError:
+        return False
+
+    try:
+        return f.read(len(data) + 1) == data
+    finally:
+        f.close()
+
+def loadHashes():
+    try:
+        f = open(consts.hashes_file, "rb")
+        try:
+            return marshal.load(f)
+        finally:
+            f.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        return {}
+
+def syncWrite(path, data):
+    """Write data to a temporary file, fsync it and rename it to path."""
+
+    try:
+        mode = os.stat(path).st_mode & 07777
+    except OSError:
+        mode = 0644
+
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(prefix=".%s." % os.path.basename(path),
+                               dir=directory)
+    try:
+        f = os.fdopen(fd, "wb")
+        try:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.chmod(tmp, mode)
+        os.rename(tmp, path)
+    except:
+        unlink(tmp)
+        raise
+
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+def writeFile(path, data, keepBackup=False):
+    """
+        Atomically replace path with data.
+
+        If the file already holds the same data, nothing is written and
+        no backup is made. The SHA1 of the data is stored with the
+        file's mtime and size, so that an untouched file does not have
+        to be read again to know that. Returns True if the file was
+        written.
+    """
+
+    if isinstance(data, unicode):
+        data = data.encode("utf-8")
+
+    digest = hashlib.sha1(data).hexdigest()
+    hashes = loadHashes()
+
+    stamp = fileStamp(path)
+    if stamp and hashes.get(path) == (digest, stamp):
+        return False
+
+    written = not hasData(path, data)
+    if written:
+        if keepBackup:
+            backup(path)
+
+        syncWrite(path, data)
+
+    hashes[path] = (digest, fileStamp(path))
+    try:
+        syncWrite(consts.hashes_file, marshal.dumps(hashes))
+    except (IOError, OSError):
+        pass
+
+    return written
+
+def parallelMap(func, items, workers=8):
+    """
+        Return [func(x) for x in items], calling func on a pool of
+        threads. The first exception raised by func is re-raised.
+    """
+
+    items = list(items)
+    results = [None] * len(items)
+    errors = []
+    jobs = Queue.Queue()
+    for job in enumerate(items):
+        jobs.put(job)
+
+    def worker():
+        while not errors:
+            try:
+                n, item = jobs.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[n] = func(item)
+            except:
+                errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=worker)
+                    for x in range(min(workers, len(items)))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+
+    return results
 
 def capture(*cmd):
     a = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -87,26 +238,8 @@ def sysValue(path, dir, _file):
     f.close()
     return data
 
-def idsQuery(vendor, device, idsFile="/usr/share/misc/pci.ids"):
-    f = file(idsFile)
-    flag = 0
-    company = "Unknown Company"
-    model = "Unknown Model"
-
-    for line in f.readlines():
-        if flag == 0:
-            if line.startswith(vendor):
-                flag = 1
-                company = line[5:].strip()
-        else:
-            if line.startswith("\t"):
-                if line.startswith("\t" + device):
-                    model = line[6:].strip()
-                    break
-            elif not line.startswith("#"):
-                flag = 0
-
-    return company, model
+def idsQuery(vendor, device, idsFile=None):
+    return getPciIds(idsFile).query(vendor, device)
 
 def xisrunning():
     return os.path.exists(xorg_lock)
@@ -120,6 +253,11 @@ def isVirtual():
             return True
     return False
 
+def get_kernel_option(option):
+    # pardus.sysutils is only needed at boot time
+    from pardus import sysutils
+    return sysutils.get_kernel_option(option)
+
 def jailEnabled():
     xorg_options = get_kernel_option("xorg")
 